@@ -0,0 +1,61 @@
+"""Compare thread-per-request and async fan-out against a fake provider with injected latency.
+
+Both runs are capped at the provider's max_concurrency: the threaded run
+needs one worker thread per in-flight request, the async run keeps the
+same number in flight from a single thread via run_async, under its own
+per-loop slots.
+
+    python benchmarks/async_provider_benchmark.py --prompts 64 --latency 0.5
+"""
+import os
+import sys
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fake_provider import FakeProvider
+
+
+def run_threaded(provider, prompts):
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=provider.max_concurrency) as executor:
+        results = list(executor.map(provider.generate_content, prompts))
+        threads = provider.max_concurrency
+    return perf_counter() - start, results, threads
+
+
+def run_async(provider, prompts):
+    async def fan_out():
+        return await asyncio.gather(*(provider.agenerate_content(prompt) for prompt in prompts))
+
+    start = perf_counter()
+    before = threading.active_count()
+    results = provider.run_async(fan_out())
+    # The background loop's thread, started on first use
+    return perf_counter() - start, results, max(threading.active_count() - before, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prompts', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=16, help="Provider cap, like AI_MAX_CONCURRENCY")
+    args = parser.parse_args()
+
+    prompts = [f"prompt {i}" for i in range(args.prompts)]
+    provider = FakeProvider(latency=args.latency, max_concurrency=args.concurrency)
+
+    threaded_seconds, threaded, threaded_threads = run_threaded(provider, prompts)
+    async_seconds, concurrent, async_threads = run_async(provider, prompts)
+    assert threaded == concurrent
+
+    print(f"{'mode':9} {'seconds':>8} {'prompts/s':>10} {'threads':>8}")
+    print(f"{'threads':9} {threaded_seconds:8.2f} {args.prompts / threaded_seconds:10.1f} {threaded_threads:8}")
+    print(f"{'async':9} {async_seconds:8.2f} {args.prompts / async_seconds:10.1f} {async_threads:8}")
+
+
+if __name__ == '__main__':
+    main()
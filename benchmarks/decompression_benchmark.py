@@ -0,0 +1,120 @@
+"""Measure streaming decompression throughput and peak RSS for evidence uploads.
+
+Builds a synthetic log of --mb megabytes, packs it as plain text, gzip,
+tar.gz, zip and (if zstandard is installed) zstd, then reads every line of
+every member through evidence_archive.iter_members. Each format runs in its
+own subprocess so peak RSS is not shared between them.
+
+    python benchmarks/decompression_benchmark.py --mb 256
+"""
+import os
+import sys
+import gzip
+import json
+import random
+import shutil
+import tarfile
+import zipfile
+import argparse
+import resource
+import tempfile
+import subprocess
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'flask_api'))
+
+from evidence_archive import iter_members, zstandard
+
+
+def write_log(path, megabytes, seed=11):
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    written = 0
+    with open(path, 'w') as f:
+        while written < target:
+            line = (f"2024-05-01T10:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z web01 sshd[{rng.randint(1000, 65000)}]: "
+                    f"Failed password for invalid user {rng.choice(['root', 'admin', 'test'])} "
+                    f"from 203.0.{rng.randint(0, 255)}.{rng.randint(1, 254)} port {rng.randint(1024, 65535)} ssh2\n")
+            f.write(line)
+            written += len(line)
+
+
+def build_inputs(directory, megabytes):
+    plain = os.path.join(directory, 'auth.log')
+    write_log(plain, megabytes)
+    inputs = {'plain': plain}
+
+    inputs['gzip'] = plain + '.gz'
+    with open(plain, 'rb') as src, gzip.open(inputs['gzip'], 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    inputs['tar.gz'] = os.path.join(directory, 'bundle.tar.gz')
+    with tarfile.open(inputs['tar.gz'], 'w:gz') as tar:
+        tar.add(plain, arcname='logs/auth.log')
+
+    inputs['zip'] = os.path.join(directory, 'bundle.zip')
+    with zipfile.ZipFile(inputs['zip'], 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(plain, arcname='logs/auth.log')
+
+    if zstandard is not None:
+        inputs['zstd'] = plain + '.zst'
+        with open(plain, 'rb') as src, open(inputs['zstd'], 'wb') as dst:
+            zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+    return inputs
+
+
+def measure(path):
+    """Read every line of every member; runs inside the worker subprocess"""
+    start = perf_counter()
+    members = 0
+    lines = 0
+    decompressed = 0
+    for _, _, open_member in iter_members(path, os.path.basename(path), 'txt'):
+        members += 1
+        with open_member() as f:
+            for line in f:
+                lines += 1
+                decompressed += len(line)
+    elapsed = perf_counter() - start
+    return {
+        'members': members,
+        'lines': lines,
+        'decompressed_mb': decompressed / 1024 / 1024,
+        'compressed_mb': os.path.getsize(path) / 1024 / 1024,
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=128, help="Size of the uncompressed log")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker)))
+        return
+
+    directory = tempfile.mkdtemp(prefix='decompression_bench_')
+    try:
+        inputs = build_inputs(directory, args.mb)
+        print(f"{'format':8} {'compressed':>11} {'decompressed':>13} {'MB/s':>8} {'peak RSS':>9}")
+        for name, path in inputs.items():
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            throughput = result['decompressed_mb'] / result['seconds'] if result['seconds'] else 0
+            print(f"{name:8} {result['compressed_mb']:9.1f}MB {result['decompressed_mb']:11.1f}MB "
+                  f"{throughput:8.1f} {result['peak_rss_mb']:7.1f}MB")
+        if zstandard is None:
+            print("zstandard not installed; zstd skipped")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Compare per-message and set-based processed_messages dedupe.
+
+Runs against the database configured in the environment (DB_HOST, DB_NAME,
+DB_USER, DB_PASSWORD) using a scratch table, so it never touches
+processed_messages itself.
+
+    python benchmarks/dedupe_benchmark.py --messages 10000
+"""
+import os
+import sys
+import argparse
+from time import perf_counter
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'flask_api'))
+from db_pool import default_db_config
+
+TABLE = 'bench_processed_messages'
+
+
+def reset_table(db_config):
+    with psycopg2.connect(**db_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cur.execute(f"""
+                CREATE TABLE {TABLE} (
+                    message_id TEXT PRIMARY KEY,
+                    processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+    conn.close()
+
+
+def seed_half(db_config, message_ids):
+    """Pre-mark every other message so both paths have real dedupe work to do"""
+    with psycopg2.connect(**db_config) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {TABLE} (message_id) SELECT unnest(%s::text[])",
+                (message_ids[::2],)
+            )
+    conn.close()
+
+
+def per_message_connect(db_config, message_ids):
+    """The original path: two queries per message, each on a fresh connection"""
+    new_ids = []
+    for message_id in message_ids:
+        conn = psycopg2.connect(**db_config)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT EXISTS(SELECT 1 FROM {TABLE} WHERE message_id = %s)", (message_id,))
+            exists = cur.fetchone()[0]
+        conn.close()
+        if not exists:
+            new_ids.append(message_id)
+            conn = psycopg2.connect(**db_config)
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"INSERT INTO {TABLE} (message_id) VALUES (%s) ON CONFLICT (message_id) DO NOTHING",
+                    (message_id,)
+                )
+            conn.commit()
+            conn.close()
+    return new_ids
+
+
+def per_message_pooled(db_config, message_ids):
+    """Two queries per message on one reused connection"""
+    new_ids = []
+    conn = psycopg2.connect(**db_config)
+    with conn.cursor() as cur:
+        for message_id in message_ids:
+            cur.execute(f"SELECT EXISTS(SELECT 1 FROM {TABLE} WHERE message_id = %s)", (message_id,))
+            if not cur.fetchone()[0]:
+                new_ids.append(message_id)
+                cur.execute(
+                    f"INSERT INTO {TABLE} (message_id) VALUES (%s) ON CONFLICT (message_id) DO NOTHING",
+                    (message_id,)
+                )
+    conn.commit()
+    conn.close()
+    return new_ids
+
+
+def set_based(db_config, message_ids):
+    """One INSERT ... ON CONFLICT DO NOTHING RETURNING for the whole batch"""
+    conn = psycopg2.connect(**db_config)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {TABLE} (message_id)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (message_id) DO NOTHING
+            RETURNING message_id
+        """, (message_ids,))
+        new_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    conn.close()
+    return new_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--skip-connect', action='store_true',
+                        help='skip the connection-per-query baseline, which is slow at 10k')
+    args = parser.parse_args()
+
+    db_config = default_db_config('DedupeBenchmark')
+    message_ids = [str(i) for i in range(args.messages)]
+    strategies = [
+        ('per-message, connect per query', per_message_connect),
+        ('per-message, one connection', per_message_pooled),
+        ('set-based INSERT ... RETURNING', set_based),
+    ]
+    if args.skip_connect:
+        strategies = strategies[1:]
+
+    print(f"Deduping {args.messages} messages (half already processed)")
+    try:
+        for label, strategy in strategies:
+            reset_table(db_config)
+            seed_half(db_config, message_ids)
+            start = perf_counter()
+            new_ids = strategy(db_config, message_ids)
+            elapsed = perf_counter() - start
+            print(f"{label:<34} {elapsed:8.3f}s  {len(new_ids)} new")
+    finally:
+        with psycopg2.connect(**db_config) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import random
+import asyncio
+import threading
+from time import sleep, monotonic
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'flask_api'))
+from ai_providers.base_provider import BaseAIProvider
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure; carries a 503 so it is treated as transient"""
+    status_code = 503
+
+
+class FakeProvider(BaseAIProvider):
+    """In-process stand-in for Gemini/Azure with injected latency and errors, for benchmarks.
+
+    error_rate fails that fraction of requests at random, latency_jitter
+    adds up to that many seconds to each request, and outage(seconds)
+    fails every request for a while, like a provider brownout.
+    """
+    provider_name = 'fake'
+
+    def __init__(self, latency=0.5, max_concurrency=4, response=None, error_rate=0.0,
+                 latency_jitter=0.0, name=None, seed=None):
+        if name:
+            self.provider_name = name
+        super().__init__()
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self._request_slots = threading.BoundedSemaphore(max_concurrency)
+        self.response = response or json.dumps({
+            "message": "Benchmark event",
+            "datetime": "2024-10-24T17:22:57+00:00",
+            "timestamp_desc": "Benchmark"
+        })
+        self.error_rate = error_rate
+        self.latency_jitter = latency_jitter
+        self.down_until = 0
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.initialized = True
+        # Every benchmark run should reach the fake model
+        self.response_cache = None
+        self.rate_limiter = None
+
+    def initialize_provider(self):
+        return True
+
+    def validate_configuration(self):
+        return True
+
+    def outage(self, seconds):
+        """Fail every request for the next `seconds`"""
+        self.down_until = monotonic() + seconds
+
+    def _outcome(self):
+        """Count the call and decide its (delay, failed)"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            failed = monotonic() < self.down_until or self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+    def _generate_content(self, prompt, **kwargs):
+        delay, failed = self._outcome()
+        sleep(delay)
+        if failed:
+            raise FakeProviderError(f"{self.provider_name} unavailable")
+        return self.response
+
+    def _stream_content(self, prompt, **kwargs):
+        """Yield the response in small pieces spread evenly over the request latency"""
+        delay, failed = self._outcome()
+        if failed:
+            sleep(delay)
+            raise FakeProviderError(f"{self.provider_name} unavailable")
+        pieces = [self.response[i:i + 16] for i in range(0, len(self.response), 16)] or ['']
+        for piece in pieces:
+            sleep(delay / len(pieces))
+            yield piece
+
+    async def _agenerate_content(self, prompt, **kwargs):
+        delay, failed = self._outcome()
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeProviderError(f"{self.provider_name} unavailable")
+        return self.response
@@ -0,0 +1,145 @@
+"""Local stand-in for Timesketch that accepts imports from TimesketchImporter.
+
+Start it, then point the daemons (or the --bench loop below) at it with
+TIMESKETCH_STANDIN_URL=http://127.0.0.1:5055. It keeps imported events in
+memory and reports counts at GET /stats.
+
+    python benchmarks/fake_timesketch_server.py --port 5055 --bench 200
+"""
+import os
+import sys
+import json
+import re
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'flask_api'))
+
+IMPORT_PATH = re.compile(r'^/api/v1/sketches/(\d+)/import$')
+
+
+class StandInState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timelines = {}
+        self.imports = 0
+        self.events = 0
+
+    def record(self, sketch_id, timeline_name, count):
+        with self.lock:
+            key = f"{sketch_id}/{timeline_name}"
+            self.timelines[key] = self.timelines.get(key, 0) + count
+            self.imports += 1
+            self.events += count
+
+    def snapshot(self):
+        with self.lock:
+            return {'imports': self.imports, 'events': self.events, 'timelines': dict(self.timelines)}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _body_lines(self):
+            """Lines of the request body, which the importer sends chunked"""
+            if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                yield from self.rfile.read(int(self.headers.get('Content-Length', 0))).splitlines()
+                return
+            partial = b''
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                lines = (partial + self.rfile.read(size)).split(b'\n')
+                partial = lines.pop()
+                self.rfile.readline()
+                yield from lines
+            yield partial
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            match = IMPORT_PATH.match(url.path)
+            timeline_name = parse_qs(url.query).get('timeline_name', [None])[0]
+            # Read the whole body even when rejecting it, so the connection can be reused
+            count, valid = 0, True
+            for line in self._body_lines():
+                if line.strip():
+                    count += 1
+                    valid = valid and isinstance(json.loads(line), dict)
+            if not match:
+                return self._reply(404, {'error': 'not found'})
+            if not timeline_name or not valid:
+                return self._reply(400, {'error': 'timeline_name and event objects are required'})
+            state.record(int(match.group(1)), timeline_name, count)
+            return self._reply(201, {'imported': count})
+
+        def do_GET(self):
+            if self.path == '/stats':
+                return self._reply(200, state.snapshot())
+            return self._reply(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port=0):
+    """Start the stand-in on a background thread; returns (server, state, url)"""
+    state = StandInState()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench(url, imports, events_per_import):
+    from timesketch_importer import TimesketchImporter
+
+    importer = TimesketchImporter(stand_in_url=url)
+    events = [
+        {"message": f"Benchmark event {i}", "datetime": "2024-10-24T17:22:57+00:00", "timestamp_desc": "Benchmark"}
+        for i in range(events_per_import)
+    ]
+    start = perf_counter()
+    for i in range(imports):
+        importer.import_events(1, events, f"bench_{i}")
+    elapsed = perf_counter() - start
+    print(f"{imports} imports of {events_per_import} events: {elapsed * 1000 / imports:.2f} ms per import")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--bench', type=int, default=0, help='run N imports against the stand-in and exit')
+    parser.add_argument('--events', type=int, default=20, help='events per benchmark import')
+    args = parser.parse_args()
+
+    server, state, url = start_server(args.port)
+    if args.bench:
+        bench(url, args.bench, args.events)
+        print(state.snapshot()['events'], "events received")
+        server.shutdown()
+        return
+
+    print(f"Timesketch stand-in listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Measure completed analyses through a provider brownout with and without retry, circuit breaker and failover.
+
+The primary fake fails --error-rate of requests at random and every
+request during an --outage-second outage starting shortly after the run
+begins. The fallback fake is healthy. Prompts go through generate_batch,
+as the operator sends room windows.
+
+    python benchmarks/provider_resilience_benchmark.py --prompts 400 --outage 2
+"""
+import os
+import sys
+import logging
+import argparse
+import threading
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fake_provider import FakeProvider
+from ai_providers.resilience import CircuitBreaker
+
+
+def build(args, retry_attempts, failover):
+    primary = FakeProvider(latency=args.latency, latency_jitter=args.latency, max_concurrency=args.concurrency,
+                           error_rate=args.error_rate, name='primary', seed=1)
+    primary.retry_attempts = retry_attempts
+    primary.retry_base_seconds = 0.05
+    primary.retry_max_seconds = 1
+    # The baseline behaves like the providers before: one attempt, never short-circuited
+    threshold = 5 if retry_attempts > 1 else float('inf')
+    primary.circuit_breaker = CircuitBreaker('primary', failure_threshold=threshold, reset_seconds=1)
+    if failover:
+        primary.fallback_provider = FakeProvider(latency=args.latency * 2, max_concurrency=args.concurrency,
+                                                 name='fallback', seed=2)
+    return primary
+
+
+def run(args, label, retry_attempts, failover):
+    provider = build(args, retry_attempts, failover)
+    prompts = [f"prompt {i}" for i in range(args.prompts)]
+    outage = threading.Timer(args.outage_start, provider.outage, [args.outage])
+    start = perf_counter()
+    outage.start()
+    succeeded = failed = 0
+    for item in provider.generate_batch(prompts):
+        if item.error is None:
+            succeeded += 1
+        else:
+            failed += 1
+    elapsed = perf_counter() - start
+    outage.cancel()
+    fallback_calls = provider.fallback_provider.calls if provider.fallback_provider else 0
+    stats = provider.resilience_stats()
+    print(f"{label:26} {succeeded:6} {failed:6} {elapsed:8.2f} {succeeded / elapsed:9.1f} "
+          f"{provider.calls:8} {fallback_calls:9} {stats['retries']:8} {stats['circuit']['opened']:7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prompts', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--outage-start', type=float, default=0.3)
+    parser.add_argument('--outage', type=float, default=2.0)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    print(f"{'mode':26} {'ok':>6} {'failed':>6} {'seconds':>8} {'ok/s':>9} "
+          f"{'primary':>8} {'fallback':>9} {'retries':>8} {'opened':>7}")
+    run(args, 'no retry', 1, False)
+    run(args, 'retry + breaker', 4, False)
+    run(args, 'retry + breaker + failover', 4, True)
+
+
+if __name__ == '__main__':
+    main()
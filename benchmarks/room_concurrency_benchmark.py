@@ -0,0 +1,96 @@
+"""Measure operator room throughput against a fake provider with injected latency.
+
+No database or real provider is needed; rooms are synthetic and the
+Timesketch import is replaced with a no-op.
+
+    python benchmarks/room_concurrency_benchmark.py --rooms 16 --latency 0.5
+"""
+import os
+import sys
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flask_api'))
+os.environ.setdefault('DB_PASSWORD', 'benchmark')
+
+from fake_provider import FakeProvider
+from import_coalescer import ImportCoalescer
+import security_sketch_operator
+
+
+class NullImporter:
+    def import_events(self, sketch_id, events, timeline_name):
+        return True
+
+
+def build_rooms(count, messages_per_room):
+    now = datetime.now(timezone.utc)
+    return {
+        f"room-{room}": {
+            'name': f"Room {room}",
+            'sketch_id': room + 1,
+            'messages': [
+                {
+                    'id': room * messages_per_room + i,
+                    'content': f"Saw outbound traffic to 10.0.{room}.{i}",
+                    'created_at': now,
+                    'timestamp': now.isoformat(),
+                    'username': 'analyst',
+                    'llm_required': False
+                } for i in range(messages_per_room)
+            ]
+        } for room in range(count)
+    }
+
+
+def build_operator(provider, workers, output_dir):
+    """Operator wired to the fake provider, skipping database-backed setup"""
+    operator = security_sketch_operator.SecuritySketchOperator.__new__(
+        security_sketch_operator.SecuritySketchOperator
+    )
+    operator.ai_provider = provider
+    prompt_template = operator.build_prompt_template("Convert security-relevant chat to Timesketch JSON lines.")
+    operator.get_prompt_template = lambda: prompt_template
+    operator.output_dir = output_dir
+    operator.room_workers = workers
+    operator.input_token_budget = 24000
+    operator.output_token_budget = 2048
+    operator.max_messages_per_window = 32
+    operator.pre_classifier = security_sketch_operator.ChatPreClassifier()
+    operator.direct_indicator_events = False
+
+    # Imports flush immediately into a no-op importer; only analysis is measured
+    operator.coalescer = ImportCoalescer(NullImporter(), 'timeline', window_seconds=0)
+    return operator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=20, help='messages per room')
+    parser.add_argument('--latency', type=float, default=0.5, help='fake provider latency in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    rooms = build_rooms(args.rooms, args.messages)
+    print(f"{args.rooms} rooms, {args.latency}s provider latency")
+    with tempfile.TemporaryDirectory() as output_dir:
+        baseline = None
+        for limit in args.concurrency:
+            provider = FakeProvider(latency=args.latency, max_concurrency=limit)
+            operator = build_operator(provider, limit, output_dir)
+            start = perf_counter()
+            operator.process_rooms(rooms)
+            elapsed = perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"concurrency {limit:>3}: {elapsed:7.2f}s  "
+                  f"{args.rooms / elapsed:6.2f} rooms/s  speedup {baseline / elapsed:5.2f}x  "
+                  f"({provider.calls} calls)")
+
+
+if __name__ == '__main__':
+    main()
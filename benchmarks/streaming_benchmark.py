@@ -0,0 +1,60 @@
+"""Measure time to first event with and without streamed completions.
+
+A fake provider writes --events JSONL events over --latency seconds,
+wrapped in markdown fences as real models often do. The buffered mode
+waits for the whole completion before parsing; the streaming mode feeds
+tokens to JsonlEventParser and gets each event as its line completes.
+
+    python benchmarks/streaming_benchmark.py --events 40 --latency 4
+"""
+import os
+import sys
+import json
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fake_provider import FakeProvider
+from jsonl_stream import JsonlEventParser
+
+
+def build_response(events):
+    lines = [json.dumps({
+        'message': f"Outbound connection to 203.0.113.{i}",
+        'datetime': f"2024-05-01T10:00:{i % 60:02d}Z",
+        'timestamp_desc': 'Network Connection',
+        'dest_ip': f"203.0.113.{i}"
+    }) for i in range(events)]
+    return "```jsonl\n" + "\n".join(lines) + "\n```"
+
+
+def buffered(provider):
+    yield provider.generate_content("prompt")
+
+
+def measure(label, chunks):
+    start = perf_counter()
+    first = None
+    count = 0
+    for _ in JsonlEventParser().iter_events(chunks):
+        count += 1
+        if first is None:
+            first = perf_counter() - start
+    total = perf_counter() - start
+    print(f"{label:10} {first:10.2f} {total:8.2f} {count:7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=4.0)
+    args = parser.parse_args()
+
+    provider = FakeProvider(latency=args.latency, response=build_response(args.events))
+    print(f"{'mode':10} {'first (s)':>10} {'total':>8} {'events':>7}")
+    measure('buffered', buffered(provider))
+    measure('streaming', provider.stream_content("prompt"))
+
+
+if __name__ == '__main__':
+    main()
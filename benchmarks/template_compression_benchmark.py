@@ -0,0 +1,93 @@
+"""Measure prompt-token reduction from evidence template compression.
+
+Generates a synthetic auth log (or uses --file), chunks it the way the
+evidence processor does with and without template compression, and checks
+that every IP address in the input still appears in the compressed chunks.
+
+    python benchmarks/template_compression_benchmark.py --lines 50000
+"""
+import os
+import re
+import sys
+import random
+import argparse
+import tempfile
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flask_api'))
+os.environ.setdefault('DB_PASSWORD', 'benchmark')
+
+from token_budget import estimate_tokens
+import evidence_processor
+
+IP_RE = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+
+
+def write_auth_log(path, lines, seed=7):
+    rng = random.Random(seed)
+    users = ['root', 'admin', 'test', 'oracle', 'ubuntu', 'postgres', 'git', 'deploy']
+    with open(path, 'w') as f:
+        for i in range(lines):
+            stamp = f"May {1 + i // 86400 % 28:2d} {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+            source = f"203.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}"
+            kind = rng.random()
+            if kind < 0.85:
+                f.write(f"{stamp} web01 sshd[{rng.randint(1000, 65000)}]: Failed password for invalid user "
+                        f"{rng.choice(users)} from {source} port {rng.randint(1024, 65535)} ssh2\n")
+            elif kind < 0.97:
+                f.write(f"{stamp} web01 CRON[{rng.randint(1000, 65000)}]: pam_unix(cron:session): "
+                        f"session opened for user root by (uid=0)\n")
+            else:
+                f.write(f"{stamp} web01 sshd[{rng.randint(1000, 65000)}]: Accepted publickey for deploy "
+                        f"from {source} port {rng.randint(1024, 65535)} ssh2\n")
+
+
+def measure(processor, path, compress):
+    processor.template_compression = compress
+    start = perf_counter()
+    chunks = list(processor.iter_file_chunks(path, 'txt', max_tokens=20000))
+    elapsed = perf_counter() - start
+    tokens = sum(estimate_tokens(text) for text, _ in chunks)
+    return chunks, tokens, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--file', help="Use an existing log file instead of a synthetic one")
+    args = parser.parse_args()
+
+    path = args.file
+    if not path:
+        path = tempfile.NamedTemporaryFile(suffix='.log', delete=False).name
+        write_auth_log(path, args.lines)
+
+    processor = evidence_processor.EvidenceProcessor.__new__(evidence_processor.EvidenceProcessor)
+    processor.chunk_max_lines = 10 ** 9
+    processor.chunk_overlap_lines = 0
+    processor.template_block_lines = int(os.getenv('EVIDENCE_TEMPLATE_BLOCK_LINES', 20000))
+    processor.template_similarity = float(os.getenv('EVIDENCE_TEMPLATE_SIMILARITY', 0.5))
+    processor.template_max_values = int(os.getenv('EVIDENCE_TEMPLATE_MAX_VALUES', 20))
+
+    raw_chunks, raw_tokens, raw_time = measure(processor, path, compress=False)
+    compressed_chunks, compressed_tokens, compressed_time = measure(processor, path, compress=True)
+
+    with open(path) as f:
+        input_ips = set(IP_RE.findall(f.read()))
+    kept_ips = set()
+    for text, _ in compressed_chunks:
+        kept_ips.update(IP_RE.findall(text))
+
+    print(f"raw:        {len(raw_chunks)} chunks, {raw_tokens} tokens ({raw_time:.2f}s)")
+    print(f"compressed: {len(compressed_chunks)} chunks, {compressed_tokens} tokens ({compressed_time:.2f}s)")
+    print(f"reduction:  {raw_tokens / max(compressed_tokens, 1):.1f}x")
+    print(f"IPs kept:   {len(input_ips & kept_ips)}/{len(input_ips)}")
+
+    if not args.file:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,34 @@
 import os
 import json
-import psycopg2
 from datetime import datetime, timezone
 from time import sleep
 import logging
-import subprocess
-import uuid
 import csv
+import io
+import hashlib
+import zlib
+import socket
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import requests
 import tempfile
 import google.generativeai as genai
 from ai_providers.gemini_provider import GeminiProvider
 from ai_providers.azure_provider import AzureOpenAIProvider
+from ai_providers.failover import configure_failover
+import db_pool
+from timesketch_importer import get_importer
+from import_coalescer import ImportCoalescer, PARTIAL_SUFFIX
+from settings_cache import get_settings
+from db_notify import NotificationListener
+from token_budget import estimate_tokens, split_text
+from log_templates import TemplateMiner, split_timestamp
+import structured_evidence
+from evidence_storage import get_storage
+from evidence_archive import DecompressionLimitError, iter_members, open_text
+from jsonl_stream import JsonlEventParser
 
 # Load environment variables
 load_dotenv()
@@ -47,38 +63,219 @@ DB_CONFIG = {
 if not DB_CONFIG['password']:
     raise ValueError("DB_PASSWORD not found in environment variables")
 
+db_pool.configure(DB_CONFIG)
+
+# Hot-path statements, prepared once per pooled connection
+PREPARED_STATEMENTS = {
+    'get_file_details': """
+        SELECT filename, file_path, uploader_username, uploader_team, original_filename
+        FROM uploaded_files
+        WHERE id = $1
+    """,
+    'update_file_progress': """
+        UPDATE uploaded_files
+        SET chunks_processed = $1,
+            bytes_processed = $2,
+            progress_updated_at = CURRENT_TIMESTAMP
+        WHERE id = $3
+    """,
+    # Fair, size-aware pick: hot rooms first, then rooms with the least work
+    # in flight, round-robin across rooms, smallest expected job first. A
+    # file's expected size shrinks as it waits ($3 seconds halves it), so
+    # large files are delayed but never starved.
+    'claim_next_file': """
+        UPDATE uploaded_files f
+        SET claimed_by = $1,
+            lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2),
+            queue_wait_seconds = COALESCE(
+                f.queue_wait_seconds,
+                EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - f.created_at)
+            )
+        FROM rooms r
+        WHERE f.id = (
+            SELECT u.id
+            FROM (
+                SELECT p.id,
+                       p.room_id,
+                       p.created_at,
+                       p.score,
+                       row_number() OVER (PARTITION BY p.room_id ORDER BY p.score, p.created_at) AS room_rank
+                FROM (
+                    SELECT id, room_id, created_at,
+                           file_size
+                           -- Compressed uploads expand to several times their stored size
+                           * CASE WHEN file_type IN ('gz', 'tgz', 'zip', 'zst') THEN 8 ELSE 1 END
+                           / (1 + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - created_at) / $3) AS score
+                    FROM uploaded_files
+                    WHERE processed = FALSE
+                    AND processing_error IS NULL
+                    AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+                ) p
+            ) ranked
+            JOIN uploaded_files u ON u.id = ranked.id
+            JOIN rooms pr ON pr.id = ranked.room_id
+            CROSS JOIN LATERAL (
+                SELECT count(*) AS in_flight
+                FROM uploaded_files l
+                WHERE l.room_id = ranked.room_id
+                AND l.processed = FALSE
+                AND l.lease_expires_at > CURRENT_TIMESTAMP
+            ) load
+            -- Repeated on the locked row: after waiting on a lock only u is re-checked
+            WHERE u.processed = FALSE
+            AND u.processing_error IS NULL
+            AND (u.lease_expires_at IS NULL OR u.lease_expires_at < CURRENT_TIMESTAMP)
+            ORDER BY COALESCE(pr.evidence_priority, 0) DESC,
+                     load.in_flight ASC,
+                     ranked.room_rank ASC,
+                     ranked.score ASC,
+                     ranked.created_at ASC
+            LIMIT 1
+            FOR UPDATE OF u SKIP LOCKED
+        )
+        AND r.id = f.room_id
+        RETURNING f.id, f.room_id, f.sketch_id, f.file_type, r.name, f.queue_wait_seconds
+    """,
+    'renew_leases': """
+        UPDATE uploaded_files
+        SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $1)
+        WHERE id = ANY($2::text[]::uuid[])
+        AND claimed_by = $3
+        AND processed = FALSE
+    """,
+    'mark_file_processed': """
+        UPDATE uploaded_files
+        SET processed = TRUE,
+            processing_error = $1,
+            processed_at = CURRENT_TIMESTAMP,
+            lease_expires_at = NULL,
+            duplicate_of = $3
+        WHERE id = $2
+    """,
+    'record_content_hash': """
+        UPDATE uploaded_files
+        SET content_sha256 = $1
+        WHERE id = $2
+    """,
+    'find_original_upload': """
+        SELECT COALESCE(duplicate_of, id), sketch_id, processing_error
+        FROM uploaded_files
+        WHERE content_sha256 = $1
+        AND id <> $2
+        AND processed = TRUE
+        AND (processing_error IS NULL OR processing_error = $4)
+        ORDER BY (sketch_id = $3) DESC, processed_at ASC
+        LIMIT 1
+    """,
+    'get_stored_results': """
+        SELECT event_count, events
+        FROM evidence_results
+        WHERE content_sha256 = $1
+        AND analysis_key = $2
+    """,
+    'store_results': """
+        INSERT INTO evidence_results (content_sha256, analysis_key, file_id, event_count, events)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (content_sha256, analysis_key) DO NOTHING
+    """
+}
+
+NO_SECURITY_CONTENT = "No security content found"
+# Prefix of processing_error for failed analyses; never matched by duplicate detection
+ANALYSIS_FAILED = "Analysis failed"
+
 class EvidenceProcessor:
     def __init__(self):
+        self.db = db_pool.get_pool()
+        for name, sql in PREPARED_STATEMENTS.items():
+            self.db.register_statement(name, sql)
+        self.settings = get_settings()
+        self.importer = get_importer()
+
         self.ai_provider = self.initialize_ai_provider()
         self.ai_provider.wait_for_configuration()
+        configure_failover(self.ai_provider)
         
         self.output_dir = os.getenv('OUTPUT_DIR', 'sketch_files')
         self.api_url = os.getenv('API_URL', 'http://host.docker.internal:3000')
         self.api_key = os.getenv('API_KEY')
+        # Uploads are read in place from a shared volume when possible, else downloaded
+        self.storage = get_storage(self.api_url, self.api_key)
         self.evidence_processor_prompt = None
+
+        # Wake on NOTIFY from the uploaded_files trigger instead of fixed polling
+        self.notify_enabled = os.getenv('NOTIFY_ENABLED', 'true').lower() == 'true'
+        self.notify_debounce = float(os.getenv('NOTIFY_DEBOUNCE_SECONDS', 1.0))
+        self.fallback_poll_seconds = float(os.getenv('FALLBACK_POLL_SECONDS', 300))
+        self.listener = NotificationListener(DB_CONFIG, ['evidence_uploaded']) if self.notify_enabled else None
         
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
+
+        # Large files are streamed in line/row-aligned chunks sized for one LLM call
+        self.input_token_budget = int(os.getenv('LLM_INPUT_TOKEN_BUDGET', 24000))
+        self.output_token_budget = int(os.getenv('LLM_OUTPUT_TOKEN_BUDGET', 2048))
+        # Events are parsed and written while the model is still generating
+        self.stream_responses = os.getenv('LLM_STREAMING', 'true').lower() == 'true'
+        self.chunk_max_lines = int(os.getenv('EVIDENCE_CHUNK_MAX_LINES', 200))
+        self.chunk_overlap_lines = min(
+            int(os.getenv('EVIDENCE_CHUNK_OVERLAP_LINES', 5)),
+            self.chunk_max_lines // 2
+        )
+
+        # Identical uploads are recognised by content hash and not analyzed twice
+        self.dedupe_uploads = os.getenv('EVIDENCE_DEDUPE_UPLOADS', 'true').lower() == 'true'
+        self.result_store_max_bytes = int(os.getenv('EVIDENCE_RESULT_STORE_MAX_MB', 16)) * 1024 * 1024
+
+        # Well-structured CSV/TSV exports are mapped to events without the model
+        self.structured_fast_path = os.getenv('EVIDENCE_STRUCTURED_FAST_PATH', 'true').lower() == 'true'
+
+        # Repetitive lines/rows are collapsed into templates before prompting
+        self.template_compression = os.getenv('EVIDENCE_TEMPLATE_COMPRESSION', 'true').lower() == 'true'
+        self.template_block_lines = int(os.getenv('EVIDENCE_TEMPLATE_BLOCK_LINES', 20000))
+        self.template_similarity = float(os.getenv('EVIDENCE_TEMPLATE_SIMILARITY', 0.5))
+        self.template_max_values = int(os.getenv('EVIDENCE_TEMPLATE_MAX_VALUES', 20))
+
+        # Decompressed size limits for compressed uploads and archives (zip bombs); 0 disables one
+        self.max_member_bytes = int(os.getenv('EVIDENCE_MAX_MEMBER_MB', 512)) * 1024 * 1024
+        self.max_decompressed_bytes = int(os.getenv('EVIDENCE_MAX_DECOMPRESSED_MB', 1024)) * 1024 * 1024
+        self.max_compression_ratio = int(os.getenv('EVIDENCE_MAX_COMPRESSION_RATIO', 200))
+
+        # Claim-based work queue shared with any other evidence processor containers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.worker_count = int(os.getenv('EVIDENCE_WORKERS', 2))
+        self.lease_seconds = float(os.getenv('EVIDENCE_LEASE_SECONDS', 120))
+        self.active_files = set()
+        self.active_files_lock = threading.Lock()
+        # Recent upload-to-claim waits, for the queue stats logged each cycle
+        self.queue_waits = deque(maxlen=1000)
+        self.aging_seconds = float(os.getenv('EVIDENCE_AGING_SECONDS', 600))
+        threading.Thread(target=self.heartbeat_loop, name='lease-heartbeat', daemon=True).start()
+
+        # Results from many files are imported together per sketch
+        self.coalescer = ImportCoalescer(
+            self.importer,
+            'evidence',
+            window_seconds=float(os.getenv('IMPORT_COALESCE_SECONDS', 30)),
+            max_events=int(os.getenv('IMPORT_COALESCE_MAX_EVENTS', 5000)),
+            max_attempts=int(os.getenv('IMPORT_MAX_ATTEMPTS', 5)),
+            retry_base_seconds=float(os.getenv('IMPORT_RETRY_BASE_SECONDS', 30))
+        )
+        self.coalescer.recover(self.output_dir, r'^evidence_(\d+)_.*\.jsonl$')
         
         # Fetch initial prompt
         self.fetch_prompt()
 
     def fetch_prompt(self):
-        """Fetch evidence processor prompt from database"""
+        """Fetch evidence processor prompt from the platform settings cache"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT evidence_processor_prompt 
-                FROM platform_settings 
-                LIMIT 1
-            """)
-            
-            result = cur.fetchone()
-            if result and result[0]:
-                self.evidence_processor_prompt = result[0]
-                logging.info("Successfully loaded evidence processor prompt")
+            prompt = self.settings.get('evidence_processor_prompt')
+            if prompt:
+                if prompt != self.evidence_processor_prompt:
+                    logging.info("Successfully loaded evidence processor prompt")
+                    # Log the first part of the prompt to verify content
+                    logging.info(f"Prompt preview (first 200 chars): {prompt[:200]}...")
+                self.evidence_processor_prompt = prompt
                 return True
             else:
                 logging.warning("No evidence processor prompt found in database yet")
@@ -87,70 +284,55 @@ class EvidenceProcessor:
         except Exception as e:
             logging.error(f"Error fetching evidence processor prompt: {e}")
             return False
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
 
-    def download_file(self, file_id):
-        """Download file from API"""
+    def convert_structured_file(self, file_id, source, output_path, file_type, observer):
+        """Map a CSV/TSV file (path or text stream factory) directly to events; returns (written, leftover_path) or None to use the model.
+
+        leftover_path holds rows that could not be mapped (with the header)
+        for model analysis, or is None when every row was mapped.
+        """
+        if not self.structured_fast_path or file_type not in ('csv', 'tsv'):
+            return None
+        # Never next to the source: with local storage that is the API's uploads directory
+        fd, leftover_path = tempfile.mkstemp(prefix=f"evidence_{file_id}_", suffix='.leftover')
+        os.close(fd)
         try:
-            response = requests.get(
-                f"{self.api_url}/api/files/download/{file_id}",
-                headers={'x-api-key': self.api_key},
-                stream=True
+            result = structured_evidence.convert_file(
+                source,
+                output_path,
+                leftover_path,
+                delimiter='\t' if file_type == 'tsv' else ',',
+                observer=observer
             )
-            
-            if response.status_code == 200:
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            tmp_file.write(chunk)
-                    return tmp_file.name
-            else:
-                logging.error(f"Failed to download file {file_id}: {response.status_code}")
-                return None
-                
+        except DecompressionLimitError:
+            os.remove(leftover_path)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
         except Exception as e:
-            logging.error(f"Error downloading file {file_id}: {e}")
+            logging.error(f"Error mapping structured file {file_id}, falling back to model analysis: {e}")
+            for path in (output_path, leftover_path):
+                if os.path.exists(path):
+                    os.remove(path)
             return None
 
-    def read_file_content(self, file_path, file_type):
-        """Read and parse file content based on type"""
-        try:
-            content = []
-            with open(file_path, 'r') as f:
-                if file_type == 'csv':
-                    reader = csv.DictReader(f)
-                    content = list(reader)
-                elif file_type == 'tsv':
-                    reader = csv.DictReader(f, delimiter='\t')
-                    content = list(reader)
-                else:  # txt files
-                    content = f.readlines()
-            return content
-        except Exception as e:
-            logging.error(f"Error reading file {file_path}: {e}")
+        if result is None:
+            logging.info(f"No structured schema recognised for file {file_id}, using model analysis")
+            os.remove(leftover_path)
             return None
-
-    def analyze_file(self, content, file_type, room_name, uploader):
-        """Analyze file content using configured AI provider"""
-        # Refresh prompt before analysis
-        self.fetch_prompt()
-        
-        if not self.evidence_processor_prompt:
-            logging.error("No evidence processor prompt available")
-            return []
-
-        # Log the first part of the prompt to verify content
-        logging.info(f"Prompt preview (first 200 chars): {self.evidence_processor_prompt[:200]}...")
-
+        written, leftover, schema = result
+        logging.info(f"Mapped {written} rows of file {file_id} without the model ({schema.describe()}); "
+                     f"{leftover} rows left for model analysis")
+        if not leftover:
+            os.remove(leftover_path)
+        return written, leftover_path if leftover else None
+
+    def build_prompt_template(self, prompt):
+        """Wrap the database prompt in the evidence analysis template"""
         # First escape the JSON examples in the database prompt
-        escaped_prompt = self.evidence_processor_prompt.replace("{", "{{").replace("}", "}}")
+        escaped_prompt = prompt.replace("{", "{{").replace("}", "}}")
 
-        prompt_template = f'''
+        return f'''
         {escaped_prompt}
 
         File Type: {{file_type}}
@@ -159,11 +341,28 @@ class EvidenceProcessor:
         Content:
         {{content}}
 
+        Note: Repetitive lines may be summarised as one template prefixed with "[N similar lines, first seen ..., last seen ...]".
+        Each <placeholder> in a template is followed by an indented line listing the values observed for it; treat every listed value as observed.
+
         Note: If a file does not appear to contain any security content, respond with "No security content found".
 
         Your response should either be valid JSON lines or "No security content found".
         '''
 
+    def get_prompt_template(self):
+        """Compiled prompt template, rebuilt only when platform settings change"""
+        return self.settings.template('evidence_processor_prompt', self.build_prompt_template)
+
+    def analyze_file(self, content, file_type, room_name, uploader):
+        """Analyze file content using configured AI provider, yielding each valid event line
+        as soon as the model has written it"""
+        # Cached template; only recompiled when the prompt changes in the database
+        prompt_template = self.get_prompt_template()
+        
+        if not prompt_template:
+            logging.error("No evidence processor prompt available")
+            return
+
         try:
             content_sample = str(content[:100])
             logging.info(f"Analyzing file for room: {room_name}")
@@ -179,180 +378,531 @@ class EvidenceProcessor:
             )
             logging.info(f"Final formatted prompt preview (first 500 chars): {formatted_prompt[:500]}...")
             
-            # Use the configured AI provider instead of direct Gemini calls
-            response = self.ai_provider.generate_content(
-                formatted_prompt,
-                temperature=0.1,
-                max_tokens=2048
-            )
-            
-            if response:
-                response_text = response.strip()
-                
-                # Add markdown stripping
-                response_text = response_text.replace('```jsonl', '')
-                response_text = response_text.replace('```json', '')
-                response_text = response_text.replace('```', '')
-                response_text = response_text.strip()
-                
-                logging.info(f"Raw response preview (first 200 chars): {response_text[:200]}...")
-                
-                if "No security content found" in response_text:
-                    logging.info("Analysis result: No security content found")
-                    return []
-                else:
-                    results = [line.strip() for line in response_text.split('\n') if line.strip()]
-                    logging.info(f"Number of JSON lines generated: {len(results)}")
-                    logging.info(f"First result preview: {results[0] if results else 'No results'}")
-                    return results
+            options = {
+                'temperature': 0.1,
+                'max_tokens': self.output_token_budget,
+                'generation_config': {'max_output_tokens': self.output_token_budget}
+            }
+            if self.stream_responses:
+                chunks = self.ai_provider.stream_content(formatted_prompt, **options)
             else:
-                logging.warning("No response received from AI provider")
-                return []
+                chunks = [self.ai_provider.generate_content(formatted_prompt, **options) or '']
+
+            parser = JsonlEventParser(status_lines=(NO_SECURITY_CONTENT,))
+            for result in parser.iter_events(chunks):
+                if parser.stats['events'] == 1:
+                    logging.info(f"First result preview: {result[:200]}")
+                yield result
+
+            if parser.status_seen and not parser.stats['events']:
+                logging.info("Analysis result: No security content found")
+            logging.info(f"Number of JSON lines generated: {parser.stats['events']} "
+                         f"({parser.stats['invalid']} invalid lines dropped)")
 
         except Exception as e:
             logging.error(f"Error analyzing file: {e}")
             logging.error(f"Full error details:", exc_info=True)
-            return []
+            # The chunk has no complete result; the caller must not treat it as empty
+            raise
+
+    def iter_file_chunks(self, source, file_type, max_tokens):
+        """Yield (chunk_text, bytes_read) for line- or row-aligned chunks of a file.
+
+        source is a path or a factory returning a text stream (archive members).
+        CSV/TSV chunks are cut on row boundaries and each repeats the header.
+        The last chunk_overlap_lines lines of a chunk are repeated at the start
+        of the next, so events spanning a boundary are seen whole at least once.
+        """
+        delimiter = '\t' if file_type == 'tsv' else ','
+        with open_text(source) as f:
+            if file_type in ('csv', 'tsv'):
+                reader = csv.reader(f, delimiter=delimiter)
+
+                def render(row):
+                    buffer = io.StringIO()
+                    csv.writer(buffer, delimiter=delimiter, lineterminator='\n').writerow(row)
+                    return buffer.getvalue()
+
+                header = next(reader, None)
+                header_line = render(header) if header else ''
+                entry_budget = max(max_tokens - estimate_tokens(header_line), 1)
+                if self.template_compression:
+                    entries = self.compress_lines(reader, file_type, header=header, render=render,
+                                                  max_tokens=entry_budget)
+                else:
+                    entries = ((line, len(line.encode('utf-8'))) for line in map(render, reader))
+            else:
+                header_line = ''
+                entry_budget = max_tokens
+                if self.template_compression:
+                    entries = self.compress_lines(f, file_type, max_tokens=entry_budget)
+                else:
+                    entries = ((line, len(line.encode('utf-8'))) for line in f)
+
+            chunk = []
+            chunk_tokens = estimate_tokens(header_line)
+            bytes_read = len(header_line.encode('utf-8'))
+            for entry, entry_bytes in entries:
+                # An entry larger than a whole chunk (a huge one-off line) is cut to fit
+                pieces = split_text(entry, entry_budget) if estimate_tokens(entry) > entry_budget else [entry]
+                for index, line in enumerate(pieces):
+                    line_tokens = estimate_tokens(line)
+                    if chunk and (chunk_tokens + line_tokens > max_tokens or len(chunk) >= self.chunk_max_lines):
+                        yield header_line + ''.join(chunk), bytes_read
+                        chunk = chunk[-self.chunk_overlap_lines:] if self.chunk_overlap_lines else []
+                        chunk_tokens = estimate_tokens(header_line) + sum(estimate_tokens(l) for l in chunk)
+                        if chunk_tokens + line_tokens > max_tokens:
+                            # No room for overlap next to a large entry
+                            chunk = []
+                            chunk_tokens = estimate_tokens(header_line)
+                    chunk.append(line)
+                    chunk_tokens += line_tokens
+                    if index == len(pieces) - 1:
+                        bytes_read += entry_bytes
+            if chunk:
+                yield header_line + ''.join(chunk), bytes_read
+
+    def compress_lines(self, lines, file_type, header=None, render=None, max_tokens=None):
+        """Yield (entry_text, source_bytes) with repeated lines/rows collapsed into templates.
+
+        Lines are mined in blocks of template_block_lines so memory stays
+        bounded; one-off lines pass through verbatim. Text lines are split on
+        whitespace, CSV/TSV rows on their fields. Templates with more values
+        than fit max_tokens are split into continuation entries.
+        """
+        def flush(miner, block_bytes):
+            entries = miner.render(field_names=header, join=',' if header is not None else ' ',
+                                   max_tokens=max_tokens)
+            if block_bytes and entries:
+                stats = miner.stats()
+                rendered_bytes = sum(len(entry.encode('utf-8')) for entry in entries)
+                logging.info(f"Compressed {stats['lines']} {file_type} lines into {stats['templates']} templates "
+                             f"({block_bytes} -> {rendered_bytes} bytes)")
+            for index, entry in enumerate(entries):
+                # Source bytes are attributed to the block's last entry, for progress reporting
+                yield entry, block_bytes if index == len(entries) - 1 else 0
+
+        def new_miner():
+            return TemplateMiner(similarity=self.template_similarity, max_values=self.template_max_values,
+                                 field_names=header)
+
+        miner = new_miner()
+        block_bytes = 0
+        for item in lines:
+            if render:
+                raw = render(item)
+                fields, timestamp = list(item), None
+                for index, field in enumerate(fields):
+                    masked, timestamp = split_timestamp(field)
+                    if timestamp:
+                        fields[index] = masked
+                        break
+                tokens = fields
+            else:
+                raw = item
+                masked, timestamp = split_timestamp(item)
+                tokens = masked.split()
+            block_bytes += len(raw.encode('utf-8'))
+            if not tokens:
+                continue
+            miner.add(tokens, raw, timestamp)
+            if miner.lines >= self.template_block_lines:
+                yield from flush(miner, block_bytes)
+                miner = new_miner()
+                block_bytes = 0
+        yield from flush(miner, block_bytes)
+
+    def analyze_file_streaming(self, file_id, source, output_path, file_type, room_name, uploader):
+        """Map-reduce analysis of a file of any size; returns the number of events written.
+
+        Chunks are analyzed concurrently with a bounded number in flight, so
+        memory stays flat regardless of file size. Results are written in
+        chunk order and deduplicated, since overlapping chunks can report the
+        same event twice.
+        """
+        prompt_template = self.get_prompt_template()
+        if not prompt_template:
+            logging.error("No evidence processor prompt available")
+            return 0
+
+        chunk_budget = max(self.input_token_budget - estimate_tokens(prompt_template), 1)
+        workers = max(1, self.ai_provider.max_concurrency)
+        seen = set()
+        written = 0
+        chunks_done = 0
+        chunks_failed = 0
+        last_error = None
 
-    def mark_file_processed(self, file_id, conn, error_message=None):
-        """Mark file as processed in database"""
+        def analyze_chunk(chunk_text, sink):
+            try:
+                for result in self.analyze_file(
+                    content=chunk_text,
+                    file_type=file_type,
+                    room_name=room_name,
+                    uploader=uploader
+                ):
+                    sink.put(result)
+            finally:
+                sink.put(None)
+
+        with open(output_path, 'w') as out, ThreadPoolExecutor(max_workers=workers, thread_name_prefix='evidence-chunk') as executor:
+            pending = deque()
+
+            def drain_one():
+                nonlocal written, chunks_done, chunks_failed, last_error
+                future, sink, bytes_read = pending.popleft()
+                # The oldest chunk's events are written while the model is still streaming them
+                for result in iter(sink.get, None):
+                    try:
+                        # Normalised form so reordered keys still dedupe
+                        key = hashlib.sha256(json.dumps(json.loads(result), sort_keys=True).encode('utf-8')).digest()
+                    except json.JSONDecodeError:
+                        continue
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    out.write(f"{result}\n")
+                    written += 1
+                try:
+                    future.result()
+                except Exception as e:
+                    chunks_failed += 1
+                    last_error = e
+                chunks_done += 1
+                self.update_file_progress(file_id, chunks_done, bytes_read)
+
+            for chunk_text, bytes_read in self.iter_file_chunks(source, file_type, chunk_budget):
+                sink = queue.Queue()
+                pending.append((executor.submit(analyze_chunk, chunk_text, sink), sink, bytes_read))
+                if len(pending) >= workers * 2:
+                    drain_one()
+            while pending:
+                drain_one()
+
+        if chunks_failed:
+            # A partial result must never be reused or look like "no security content"
+            raise RuntimeError(f"{ANALYSIS_FAILED}: {chunks_failed} of {chunks_done} chunks failed: {last_error}")
+
+        logging.info(f"Analyzed file {file_id} in {chunks_done} chunks, {written} unique events")
+        return written
+
+    def update_file_progress(self, file_id, chunks_processed, bytes_processed):
+        """Record streaming progress for a file in uploaded_files"""
+        try:
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'update_file_progress', (chunks_processed, bytes_processed, str(file_id)))
+        except Exception as e:
+            logging.error(f"Error updating progress for file {file_id}: {e}")
+
+    def mark_file_processed(self, file_id, error_message=None, duplicate_of=None):
+        """Mark file as processed in database, optionally pointing at the upload it duplicates"""
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE uploaded_files 
-                    SET processed = TRUE,
-                        processing_error = %s,
-                        processed_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, [error_message, file_id])
-                conn.commit()
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'mark_file_processed', (
+                    error_message,
+                    str(file_id),
+                    str(duplicate_of) if duplicate_of else None
+                ))
         except Exception as e:
             logging.error(f"Error marking file {file_id} as processed: {e}")
-            conn.rollback()
 
-    def process_file(self, file_id, room_id, sketch_id, file_type, room_name):
-        """Process a single file"""
-        temp_path = None
+    def analysis_key(self):
+        """Identifies what produced a stored result, so prompt or model changes are not reused"""
+        material = f"{self.ai_provider.provider_name}|{self.ai_provider.model_identifier()}|{self.get_prompt_template()}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def record_content_hash(self, file_id, content_sha256):
         try:
-            # Initialize database connection
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            # Get file details including uploader info
-            cur.execute("""
-                SELECT filename, file_path, uploader_username, uploader_team 
-                FROM uploaded_files 
-                WHERE id = %s
-            """, [file_id])
-            
-            file_info = cur.fetchone()
-            if not file_info:
-                raise ValueError(f"File {file_id} not found")
-                
-            filename, file_path, uploader_username, uploader_team = file_info
-            
-            # Download and process the file
-            temp_path = self.download_file(file_id)
-            if not temp_path:
-                raise ValueError(f"Failed to download file {file_id}")
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'record_content_hash', (content_sha256, str(file_id)))
+        except Exception as e:
+            logging.error(f"Error recording content hash for file {file_id}: {e}")
 
-            # Read file content
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+    def reuse_duplicate(self, file_id, sketch_id, content_sha256, observer):
+        """Handle an upload whose content was already processed; returns True if nothing is left to do.
 
-            # Analyze content using Gemini
-            results = self.analyze_file(
-                content=content,
+        Identical content already processed for the same sketch is skipped.
+        Content processed for another sketch reuses the stored events, with
+        observer_name rewritten for this upload. Either way the row points at
+        the original upload through duplicate_of.
+        """
+        if not self.dedupe_uploads:
+            return False
+        try:
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'find_original_upload', (
+                    content_sha256, str(file_id), sketch_id, NO_SECURITY_CONTENT
+                ))
+                original = cur.fetchone()
+            if not original:
+                return False
+            original_id, original_sketch_id, original_error = original
+
+            if original_sketch_id == sketch_id or original_error:
+                logging.info(f"File {file_id} is identical to already processed file {original_id} "
+                             f"(sketch {original_sketch_id}), skipping analysis")
+                self.mark_file_processed(file_id, original_error, duplicate_of=original_id)
+                return True
+
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'get_stored_results', (content_sha256, self.analysis_key()))
+                stored = cur.fetchone()
+            if not stored:
+                return False
+            event_count, events = stored
+
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            output_path = os.path.join(self.output_dir, f"evidence_{sketch_id}_{file_id}_{timestamp}.jsonl")
+            with open(output_path + PARTIAL_SUFFIX, 'w') as out:
+                for line in zlib.decompress(bytes(events)).decode('utf-8').splitlines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if 'observer_name' in event:
+                        event['observer_name'] = observer
+                    out.write(json.dumps(event) + '\n')
+            os.replace(output_path + PARTIAL_SUFFIX, output_path)
+
+            logging.info(f"Reusing {event_count} events from file {original_id} (sketch {original_sketch_id}) "
+                         f"for identical file {file_id}")
+            self.coalescer.add(sketch_id, output_path, event_count)
+            self.mark_file_processed(file_id, duplicate_of=original_id)
+            return True
+        except Exception as e:
+            logging.error(f"Error checking file {file_id} for duplicate content, analyzing it: {e}")
+            return False
+
+    def store_results(self, file_id, content_sha256, outputs):
+        """Keep a compressed copy of a file's events for reuse by identical uploads to other sketches"""
+        if not self.dedupe_uploads:
+            return
+        try:
+            paths = [path for path, written in outputs if written]
+            event_count = sum(written for _, written in outputs)
+            total_bytes = sum(os.path.getsize(path) for path in paths)
+            if not paths or total_bytes > self.result_store_max_bytes:
+                return
+            data = b''
+            for path in paths:
+                with open(path, 'rb') as f:
+                    data += f.read()
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'store_results', (
+                    content_sha256, self.analysis_key(), str(file_id), event_count, zlib.compress(data)
+                ))
+        except Exception as e:
+            logging.error(f"Error storing results for file {file_id}: {e}")
+
+    def analyze_member(self, file_id, source, output_path, file_type, room_name, uploader_username, uploader_team):
+        """Analyze one file or archive member; returns [(spooled_path, events_written)]"""
+        # Structured exports are mapped directly; the model only sees what could not be mapped
+        structured = self.convert_structured_file(file_id, source, output_path, file_type, uploader_username)
+        outputs = []
+        leftover_path = None
+        if structured:
+            written, leftover_path = structured
+            outputs.append((output_path, written))
+            if not leftover_path:
+                return outputs
+            model_input = leftover_path
+            model_output = output_path.replace('.jsonl', '_model.jsonl')
+        else:
+            model_input = source
+            model_output = output_path
+
+        try:
+            # Stream the file through the model chunk by chunk
+            written = self.analyze_file_streaming(
+                file_id=file_id,
+                source=model_input,
+                output_path=model_output,
                 file_type=file_type,
                 room_name=room_name,
                 uploader=f"{uploader_username}@{uploader_team or 'sketch'}"
             )
+        except Exception:
+            for path in [path for path, _ in outputs] + [model_output]:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            if leftover_path and os.path.exists(leftover_path):
+                os.remove(leftover_path)
+        outputs.append((model_output, written))
+        return outputs
 
-            if results:
-                # Create a new file with timestamp in name to prevent duplicates
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_path = os.path.join(self.output_dir, f"evidence_{sketch_id}_{file_id}_{timestamp}.jsonl")
+    def process_file(self, file_id, room_id, sketch_id, file_type, room_name):
+        """Process a single file"""
+        stored = None
+        outputs = []
+        queued = False
+        try:
+            # Get file details including uploader info; the connection goes back
+            # to the pool before the slow download and analysis steps
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'get_file_details', (str(file_id),))
+                file_info = cur.fetchone()
+
+            if not file_info:
+                raise ValueError(f"File {file_id} not found")
                 
-                with open(output_path, 'w') as f:
-                    for result in results:
-                        try:
-                            json.loads(result)  # Validate JSON
-                            f.write(f"{result}\n")
-                        except json.JSONDecodeError:
-                            continue
-
-                if self.import_to_timesketch(sketch_id, output_path):
-                    self.mark_file_processed(file_id, conn)
-                else:
-                    self.mark_file_processed(file_id, conn, "Failed to import to Timesketch")
+            filename, file_path, uploader_username, uploader_team, original_filename = file_info
+            
+            # Read the upload in place, or download it, hashing it on the way
+            stored = self.storage.fetch(file_id, filename)
+            if not stored:
+                raise ValueError(f"Failed to download file {file_id}")
+            source_path = stored.path
+            content_sha256 = stored.sha256
+
+            self.record_content_hash(file_id, content_sha256)
+            if self.reuse_duplicate(file_id, sketch_id, content_sha256, uploader_username):
+                return
+
+            # Create a new file with timestamp in name to prevent duplicates
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+            # Compressed uploads and archives are decompressed on the fly, member by member
+            for index, (member_name, member_type, open_member) in enumerate(iter_members(
+                source_path, original_filename or filename, file_type,
+                max_member_bytes=self.max_member_bytes,
+                max_total_bytes=self.max_decompressed_bytes,
+                max_ratio=self.max_compression_ratio
+            )):
+                suffix = f"_{index}" if index else ''
+                # Written under a partial name until the whole file has been analyzed
+                output_path = os.path.join(
+                    self.output_dir, f"evidence_{sketch_id}_{file_id}_{timestamp}{suffix}.jsonl{PARTIAL_SUFFIX}"
+                )
+                if member_name != (original_filename or filename):
+                    logging.info(f"Processing archive member {member_name} of file {file_id} as {member_type}")
+                outputs.extend(self.analyze_member(
+                    file_id, open_member, output_path, member_type, room_name, uploader_username, uploader_team
+                ))
+
+            # Stored before queueing, since a successful import removes the spooled files
+            self.store_results(file_id, content_sha256, outputs)
+
+            # Spooled files are imported with other files for this sketch and
+            # retried from disk if the import fails
+            queued = True
+            for path, written in outputs:
+                if written:
+                    spooled_path = path[:-len(PARTIAL_SUFFIX)]
+                    os.replace(path, spooled_path)
+                    self.coalescer.add(sketch_id, spooled_path, written)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+            if any(written for _, written in outputs):
+                self.mark_file_processed(file_id)
             else:
-                self.mark_file_processed(file_id, conn, "No security content found")
+                self.mark_file_processed(file_id, NO_SECURITY_CONTENT)
 
         except Exception as e:
             logging.error(f"Error processing file {file_id}: {e}")
-            if 'conn' in locals():
-                self.mark_file_processed(file_id, conn, str(e))
+            if not queued:
+                # Results of a failed file are neither imported nor kept for reuse
+                for path, _ in outputs:
+                    if os.path.exists(path):
+                        os.remove(path)
+            self.mark_file_processed(file_id, str(e))
         finally:
-            # Clean up resources
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                except Exception as e:
-                    logging.error(f"Error removing temporary file: {e}")
+            # Clean up resources; uploads read in place are left alone
+            if stored:
+                stored.release()
 
-    def import_to_timesketch(self, sketch_id, file_path):
-        """Import JSONL file to Timesketch"""
+    def claim_next_file(self):
+        """Lease the next unprocessed file; rows locked or leased by other workers are skipped"""
         try:
-            timeline_name = f"evidence_{datetime.now().strftime('%Y%m%d')}_{str(uuid.uuid4())[:8]}"
-            
-            command = f'timesketch --sketch {sketch_id} import --name "{timeline_name}" "{file_path}"'
-            logging.info(f"Executing import command: {command}")
-            
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                shell=True
-            )
-            
-            if result.returncode == 0:
-                logging.info(f"Successfully imported timeline {timeline_name}")
-                os.remove(file_path)
-                return True
-            else:
-                logging.error(f"Import failed: {result.stderr}")
-                return False
-                
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(cur, 'claim_next_file', (
+                    self.worker_id, self.lease_seconds, self.aging_seconds
+                ))
+                claimed = cur.fetchone()
+            if claimed:
+                with self.active_files_lock:
+                    self.active_files.add(str(claimed[0]))
+                    self.record_queue_wait(claimed[5])
+            return claimed
         except Exception as e:
-            logging.error(f"Error importing to Timesketch: {e}")
-            return False
+            logging.error(f"Error claiming unprocessed file: {e}")
+            return None
 
-    def get_unprocessed_files(self):
-        """Fetch unprocessed files from database"""
-        try:
-            with psycopg2.connect(**DB_CONFIG) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        SELECT 
-                            f.id,
-                            f.room_id,
-                            f.sketch_id,
-                            f.file_type,
-                            r.name as room_name
-                        FROM uploaded_files f
-                        JOIN rooms r ON f.room_id = r.id
-                        WHERE f.processed = FALSE 
-                        AND f.processing_error IS NULL
-                        ORDER BY f.created_at ASC
-                    """)
-                    return cur.fetchall()
-        except Exception as e:
-            logging.error(f"Error fetching unprocessed files: {e}")
-            return []
+    def record_queue_wait(self, wait_seconds):
+        """Track time from upload to first claim; caller holds active_files_lock"""
+        if wait_seconds is None:
+            return
+        self.queue_waits.append(float(wait_seconds))
+
+    def queue_stats(self):
+        with self.active_files_lock:
+            waits = sorted(self.queue_waits)
+            in_progress = len(self.active_files)
+        if not waits:
+            return {'claimed': 0, 'in_progress': in_progress}
+        return {
+            'claimed': len(waits),
+            'in_progress': in_progress,
+            'wait_avg_seconds': sum(waits) / len(waits),
+            'wait_p95_seconds': waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            'wait_max_seconds': waits[-1]
+        }
+
+    def release_file(self, file_id):
+        with self.active_files_lock:
+            self.active_files.discard(str(file_id))
+
+    def heartbeat_loop(self):
+        """Keep leases on in-progress files alive; a crashed worker's leases simply expire"""
+        while True:
+            sleep(self.lease_seconds / 3)
+            with self.active_files_lock:
+                file_ids = list(self.active_files)
+            if not file_ids:
+                continue
+            try:
+                with self.db.cursor() as cur:
+                    self.db.execute_prepared(cur, 'renew_leases', (self.lease_seconds, file_ids, self.worker_id))
+            except Exception as e:
+                logging.error(f"Error renewing file leases: {e}")
+
+    def worker_loop(self):
+        """Claim and process files until the queue is empty"""
+        processed = 0
+        while True:
+            claimed = self.claim_next_file()
+            if not claimed:
+                return processed
+            file_id, room_id, sketch_id, file_type, room_name, queue_wait = claimed
+            try:
+                logging.info(f"Processing file {file_id} for room {room_name} "
+                             f"(queued {float(queue_wait or 0):.0f}s)")
+                self.process_file(file_id, room_id, sketch_id, file_type, room_name)
+                processed += 1
+            finally:
+                self.release_file(file_id)
+
+    def process_queue(self):
+        """Drain the evidence queue with worker_count concurrent workers"""
+        if self.worker_count <= 1:
+            return self.worker_loop()
+        with ThreadPoolExecutor(max_workers=self.worker_count, thread_name_prefix='evidence-worker') as executor:
+            futures = [executor.submit(self.worker_loop) for _ in range(self.worker_count)]
+            return sum(future.result() for future in futures)
+
+    def wait_for_work(self, interval_minutes):
+        """Block until an upload is announced, or until the next poll is due"""
+        if not self.listener:
+            logging.info(f"Sleeping for {interval_minutes} minutes...")
+            sleep(interval_minutes * 60)
+            return
+
+        notifications = self.listener.wait(self.fallback_poll_seconds, debounce=self.notify_debounce)
+        if notifications:
+            logging.info(f"Woken by {len(notifications)} evidence upload notifications")
+        else:
+            logging.info("No notifications received, running fallback poll")
 
     def run(self, interval_minutes=1):
         """Main operation loop"""
@@ -369,13 +919,18 @@ class EvidenceProcessor:
                         sleep(60)  # Wait a minute before checking again
                         continue
 
-                files = self.get_unprocessed_files()
-                for file_id, room_id, sketch_id, file_type, room_name in files:
-                    logging.info(f"Processing file {file_id} for room {room_name}")
-                    self.process_file(file_id, room_id, sketch_id, file_type, room_name)
+                processed = self.process_queue()
+                if processed:
+                    logging.info(f"Processed {processed} files this cycle")
                 
-                logging.info(f"Sleeping for {interval_minutes} minutes...")
-                sleep(interval_minutes * 60)
+                logging.info(f"Database pool stats: {self.db.stats()}")
+                logging.info(f"LLM cache stats: {self.ai_provider.cache_stats()}")
+                if self.ai_provider.rate_limiter:
+                    logging.info(f"Rate limiter stats: {self.ai_provider.rate_limit_stats()}")
+                logging.info(f"Provider resilience stats: {self.ai_provider.resilience_stats()}")
+                logging.info(f"Import coalescer stats: {self.coalescer.stats()}")
+                logging.info(f"Evidence queue stats: {self.queue_stats()}")
+                self.wait_for_work(interval_minutes)
                 
             except Exception as e:
                 logging.error(f"Error in main loop: {e}")
@@ -384,19 +939,8 @@ class EvidenceProcessor:
     def initialize_ai_provider(self):
         """Initialize the configured AI provider"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT ai_provider
-                FROM platform_settings
-                LIMIT 1
-            """)
-            
-            result = cur.fetchone()
-            if result:
-                provider_name = result[0]
-                
+            provider_name = self.settings.get('ai_provider')
+            if provider_name:
                 if provider_name == 'azure':
                     logging.info("Initializing Azure OpenAI provider")
                     return AzureOpenAIProvider()
@@ -410,11 +954,6 @@ class EvidenceProcessor:
         except Exception as e:
             logging.error(f"Error initializing AI provider: {e}")
             return GeminiProvider()  # fallback to default
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
 
 if __name__ == "__main__":
     logging.info("Starting Evidence Processor")
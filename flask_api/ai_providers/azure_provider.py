@@ -1,20 +1,23 @@
 import os
-from openai import AzureOpenAI
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from .base_provider import BaseAIProvider
 import logging
-import json
 
 class AzureOpenAIProvider(BaseAIProvider):
+    provider_name = 'azure'
+
     def __init__(self):
         super().__init__()
         provider_keys = self.get_provider_keys()
         azure_keys = provider_keys.get('azure', {})
         
-        self.client = AzureOpenAI(
-            api_key=azure_keys.get('api_key'),
-            api_version=azure_keys.get('api_version'),
-            azure_endpoint=azure_keys.get('endpoint')
-        )
+        self.client_settings = {
+            'api_key': azure_keys.get('api_key'),
+            'api_version': azure_keys.get('api_version'),
+            'azure_endpoint': azure_keys.get('endpoint')
+        }
+        self.client = AzureOpenAI(**self.client_settings)
         self.deployment_name = azure_keys.get('deployment')
         
         # Default configurations
@@ -26,46 +29,78 @@ class AzureOpenAIProvider(BaseAIProvider):
             "presence_penalty": 0
         }
 
-    def generate_content(self, prompt, **kwargs):
+    def _request_options(self, prompt, kwargs):
+        # Merge default configs with any provided kwargs
+        config = {
+            **self.default_config,
+            **{k: v for k, v in kwargs.items() if k in self.default_config}
+        }
+        return {
+            'model': self.deployment_name,
+            'messages': [
+                {"role": "system", "content": "You are a security analysis assistant. You analyze content and provide detailed security insights in JSON format."},
+                {"role": "user", "content": prompt}
+            ],
+            **config
+        }
+
+    def _response_text(self, response, kwargs):
+        response_text = response.choices[0].message.content.strip()
+
+        # Handle JSON validation if needed
+        if kwargs.get('validate_json', False):
+            return self.validate_json_lines(response_text)
+
+        return response_text
+
+    def _generate_content(self, prompt, **kwargs):
         try:
-            # Merge default configs with any provided kwargs
-            config = {
-                **self.default_config,
-                **{k: v for k, v in kwargs.items() if k in self.default_config}
-            }
+            response = self.client.chat.completions.create(**self._request_options(prompt, kwargs))
+            return self._response_text(response, kwargs)
             
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "system", "content": "You are a security analysis assistant. You analyze content and provide detailed security insights in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                **config
+        except Exception as e:
+            logging.error(f"Azure OpenAI generation error: {e}")
+            raise
+
+    def _stream_content(self, prompt, **kwargs):
+        try:
+            stream = self.client.chat.completions.create(stream=True, **self._request_options(prompt, kwargs))
+            for chunk in stream:
+                # Content-filter results arrive as chunks without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        except Exception as e:
+            logging.error(f"Azure OpenAI streaming error: {e}")
+            raise
+
+    def async_client(self):
+        """AsyncAzureOpenAI client for the running loop, with a keep-alive pool sized to the provider cap"""
+        state = self.loop_state()
+        if state.get('client_settings') != self.client_settings:
+            limits = httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Handle JSON validation if needed
-            if kwargs.get('validate_json', False):
-                lines = response_text.split('\n')
-                valid_lines = []
-                for line in lines:
-                    line = line.strip()
-                    if line and line != "Regular chat: no sketch update":
-                        try:
-                            json.loads(line)  # Validate JSON
-                            valid_lines.append(line)
-                        except json.JSONDecodeError:
-                            logging.error(f"Invalid JSON line: {line}")
-                            continue
-                return '\n'.join(valid_lines)
-            
-            return response_text
-            
+            state['client'] = AsyncAzureOpenAI(
+                **self.client_settings,
+                http_client=httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120, connect=10))
+            )
+            state['client_settings'] = dict(self.client_settings)
+        return state['client']
+
+    async def _agenerate_content(self, prompt, **kwargs):
+        try:
+            response = await self.async_client().chat.completions.create(**self._request_options(prompt, kwargs))
+            return self._response_text(response, kwargs)
+
         except Exception as e:
             logging.error(f"Azure OpenAI generation error: {e}")
             raise
 
+    def model_identifier(self):
+        return self.deployment_name
+
     def validate_configuration(self):
         required_vars = [
             "AZURE_OPENAI_API_KEY",
@@ -93,11 +128,12 @@ class AzureOpenAIProvider(BaseAIProvider):
                 return False
             
             logging.info("Creating Azure OpenAI client...")
-            self.client = AzureOpenAI(
-                api_key=azure_keys['api_key'],
-                api_version=azure_keys['api_version'],
-                azure_endpoint=azure_keys['endpoint']
-            )
+            self.client_settings = {
+                'api_key': azure_keys['api_key'],
+                'api_version': azure_keys['api_version'],
+                'azure_endpoint': azure_keys['endpoint']
+            }
+            self.client = AzureOpenAI(**self.client_settings)
             self.deployment_name = azure_keys['deployment']
             
             # Test the configuration with a simple completion
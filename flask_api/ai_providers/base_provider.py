@@ -1,34 +1,60 @@
 from abc import ABC, abstractmethod
-import psycopg2
 import os
 import json
+import queue
+import asyncio
 import logging
+import threading
+import weakref
+from collections import namedtuple
 from time import sleep
+import llm_cache
+import rate_limiter
+from settings_cache import get_settings
+from token_budget import estimate_tokens
+from .resilience import CircuitOpenError, backoff_delay, breaker_from_env, is_transient
+
+# One item of a generate_batch call; error holds the exception when that item failed
+BatchResult = namedtuple('BatchResult', ['index', 'response', 'error'])
 
 class BaseAIProvider(ABC):
+    provider_name = 'base'
+
     def __init__(self):
         super().__init__()
-        self.db_config = {
-            'dbname': os.getenv('DB_NAME', 'security_sketch'),
-            'user': os.getenv('DB_USER', 'sketch_user'),
-            'password': os.getenv('DB_PASSWORD'),
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'port': int(os.getenv('DB_PORT', 5432))
-        }
         self.initialized = False
 
+        # Cap on in-flight requests to this provider: shared by every worker thread, and
+        # applied separately per event loop on the async path (see loop_state)
+        self.max_concurrency = int(os.getenv(
+            f'{self.provider_name.upper()}_MAX_CONCURRENCY',
+            os.getenv('AI_MAX_CONCURRENCY', 4)
+        ))
+        self._request_slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._loop_states = weakref.WeakKeyDictionary()
+        self._loop_states_lock = threading.Lock()
+        self._background_loop = None
+
+        # Persistent response cache shared by both daemons
+        self.response_cache = llm_cache.get_cache()
+
+        # RPM/TPM quota shared with every other process using this provider
+        self.rate_limiter = rate_limiter.get_limiter(self.provider_name)
+
+        # Transient errors are retried with jittered exponential backoff behind a circuit breaker;
+        # a request that still fails goes to fallback_provider when one is attached
+        self.retry_attempts = max(1, int(os.getenv('AI_RETRY_ATTEMPTS', 4)))
+        self.retry_base_seconds = float(os.getenv('AI_RETRY_BASE_SECONDS', 1))
+        self.retry_max_seconds = float(os.getenv('AI_RETRY_MAX_SECONDS', 30))
+        self.circuit_breaker = breaker_from_env(self.provider_name)
+        self.fallback_provider = None
+        self._resilience_lock = threading.Lock()
+        self._resilience_stats = {'retries': 0, 'failovers': 0}
+
     def get_active_provider(self):
         """Get the currently configured AI provider from database"""
         try:
-            with psycopg2.connect(**self.db_config) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        SELECT ai_provider
-                        FROM platform_settings
-                        LIMIT 1
-                    """)
-                    result = cur.fetchone()
-                    return result[0] if result else 'gemini'  # Default to gemini if not set
+            return get_settings().get('ai_provider', 'gemini')  # Default to gemini if not set
         except Exception as e:
             logging.error(f"Error fetching active provider: {e}")
             return 'gemini'
@@ -80,23 +106,388 @@ class BaseAIProvider(ABC):
 
     def get_provider_keys(self):
         try:
-            with psycopg2.connect(**self.db_config) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        SELECT ai_provider_keys
-                        FROM platform_settings
-                        LIMIT 1
-                    """)
-                    result = cur.fetchone()
-                    if result:
-                        return result[0]
-            return {}
+            return get_settings().get('ai_provider_keys', {})
         except Exception as e:
             logging.error(f"Error fetching provider keys: {e}")
             return {}
 
-    @abstractmethod
+    def model_identifier(self):
+        """Name of the model or deployment answering requests, part of the cache key"""
+        return self.provider_name
+
+    def _cache_lookup(self, prompt, kwargs):
+        """Return (cache_key, cached_response); pops use_cache from kwargs"""
+        use_cache = kwargs.pop('use_cache', True) and self.response_cache is not None
+        if not use_cache:
+            return None, None
+        cache_key = self.response_cache.make_key(self.provider_name, self.model_identifier(), prompt, kwargs)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logging.info("Answered from LLM response cache")
+        return cache_key, cached
+
+    def _cache_store(self, cache_key, response):
+        if cache_key and response:
+            try:
+                self.response_cache.put(cache_key, response)
+            except Exception as e:
+                logging.error(f"Error storing LLM response in cache: {e}")
+
+    def request_tokens(self, prompt, kwargs):
+        """Estimated quota cost of a request: prompt tokens plus the output tokens it may use"""
+        output_tokens = kwargs.get('max_tokens') or kwargs.get('generation_config', {}).get('max_output_tokens') or 2048
+        return estimate_tokens(prompt) + output_tokens
+
+    def _count(self, name):
+        with self._resilience_lock:
+            self._resilience_stats[name] += 1
+
+    def _retry_delay(self, attempt, error):
+        """Seconds to wait before retrying after error, or None if it should not be retried"""
+        if not is_transient(error):
+            # A bad request says nothing about the provider's health, either way
+            self.circuit_breaker.release_probe()
+            return None
+        self.circuit_breaker.record_failure()
+        if attempt == self.retry_attempts - 1:
+            return None
+        delay = backoff_delay(attempt, self.retry_base_seconds, self.retry_max_seconds)
+        logging.warning(f"Transient {self.provider_name} error, retrying in {delay:.1f}s "
+                        f"(attempt {attempt + 2}/{self.retry_attempts}): {error}")
+        self._count('retries')
+        return delay
+
+    def _breaker_wait(self, attempt):
+        """Seconds until the circuit lets a request through; raises if the caller should not wait"""
+        wait = self.circuit_breaker.wait_time()
+        if wait and (self.fallback_provider or attempt == self.retry_attempts - 1):
+            raise CircuitOpenError(f"{self.provider_name} circuit is open")
+        return wait
+
+    def _attempt(self, prompt, kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.acquire(self.request_tokens(prompt, kwargs))
+        with self._request_slots:
+            return self._generate_content(prompt, **kwargs)
+
+    def _generate_resilient(self, prompt, kwargs):
+        for attempt in range(self.retry_attempts):
+            wait = self._breaker_wait(attempt)
+            if wait:
+                sleep(wait)
+                continue
+            try:
+                response = self._attempt(prompt, kwargs)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                sleep(delay)
+                continue
+            self.circuit_breaker.record_success()
+            return response
+
     def generate_content(self, prompt, **kwargs):
+        """Generate a completion, answering from the response cache when possible and
+        otherwise waiting for quota and a free slot under the provider concurrency cap.
+        Transient errors are retried; a request that still fails goes to the fallback provider"""
+        cache_key, cached = self._cache_lookup(prompt, kwargs)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self._generate_resilient(prompt, kwargs)
+        except Exception as e:
+            if self.fallback_provider is None:
+                raise
+            logging.warning(f"{self.provider_name} request failed, failing over to "
+                            f"{self.fallback_provider.provider_name}: {e}")
+            self._count('failovers')
+            return self.fallback_provider.generate_content(prompt, **kwargs)
+
+        self._cache_store(cache_key, response)
+        return response
+
+    def _stream_attempt(self, prompt, kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.acquire(self.request_tokens(prompt, kwargs))
+        # The slot is held until the stream is exhausted or closed
+        with self._request_slots:
+            yield from self._stream_content(prompt, **kwargs)
+
+    def _open_stream(self, prompt, kwargs):
+        """Start a stream under the retry policy; returns (stream, first_chunk) once output begins"""
+        for attempt in range(self.retry_attempts):
+            wait = self._breaker_wait(attempt)
+            if wait:
+                sleep(wait)
+                continue
+            stream = self._stream_attempt(prompt, kwargs)
+            try:
+                first = next(stream, None)
+            except Exception as e:
+                stream.close()
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                sleep(delay)
+                continue
+            self.circuit_breaker.record_success()
+            return stream, first
+
+    def stream_content(self, prompt, **kwargs):
+        """Yield the completion as text chunks while the model is still writing it.
+
+        Takes the same options as generate_content and shares its cache, quota,
+        concurrency cap, retries and failover. Only failures before the first
+        chunk are retried or failed over; a stream that breaks later counts
+        against the circuit breaker and raises, so the caller can fail the work.
+        """
+        cache_key, cached = self._cache_lookup(prompt, kwargs)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            stream, first = self._open_stream(prompt, kwargs)
+        except Exception as e:
+            if self.fallback_provider is None:
+                raise
+            logging.warning(f"{self.provider_name} request failed, failing over to "
+                            f"{self.fallback_provider.provider_name}: {e}")
+            self._count('failovers')
+            yield from self.fallback_provider.stream_content(prompt, **kwargs)
+            return
+
+        # Kept only for the cache; a completion is bounded by its output token budget
+        chunks = []
+        try:
+            chunk = first
+            while chunk is not None:
+                if cache_key:
+                    chunks.append(chunk)
+                yield chunk
+                try:
+                    chunk = next(stream, None)
+                except Exception as e:
+                    if is_transient(e):
+                        self.circuit_breaker.record_failure()
+                    logging.error(f"{self.provider_name} stream failed after output began: {e}")
+                    raise
+        finally:
+            stream.close()
+        self._cache_store(cache_key, ''.join(chunks).strip())
+
+    def _stream_content(self, prompt, **kwargs):
+        """Providers without a streaming client answer in one chunk"""
+        response = self._generate_content(prompt, **kwargs)
+        if response:
+            yield response
+
+    def loop_state(self):
+        """Per-event-loop state (semaphore, pooled clients); async clients cannot cross loops"""
+        loop = asyncio.get_running_loop()
+        with self._loop_states_lock:
+            state = self._loop_states.get(loop)
+            if state is None:
+                state = {'slots': asyncio.Semaphore(self.max_concurrency)}
+                self._loop_states[loop] = state
+            return state
+
+    async def agenerate_content(self, prompt, **kwargs):
+        """Async counterpart of generate_content: same cache and options, but waits on the
+        network without holding a thread, up to max_concurrency requests per event loop"""
+        cache_key, cached = self._cache_lookup(prompt, kwargs)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self._agenerate_resilient(prompt, kwargs)
+        except Exception as e:
+            if self.fallback_provider is None:
+                raise
+            logging.warning(f"{self.provider_name} request failed, failing over to "
+                            f"{self.fallback_provider.provider_name}: {e}")
+            self._count('failovers')
+            return await self.fallback_provider.agenerate_content(prompt, **kwargs)
+
+        self._cache_store(cache_key, response)
+        return response
+
+    async def _aattempt(self, prompt, kwargs):
+        if self.rate_limiter:
+            await asyncio.to_thread(self.rate_limiter.acquire, self.request_tokens(prompt, kwargs))
+        async with self.loop_state()['slots']:
+            return await self._agenerate_content(prompt, **kwargs)
+
+    async def _agenerate_resilient(self, prompt, kwargs):
+        for attempt in range(self.retry_attempts):
+            wait = self._breaker_wait(attempt)
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                response = await self._aattempt(prompt, kwargs)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.circuit_breaker.record_success()
+            return response
+
+    async def _agenerate_content(self, prompt, **kwargs):
+        """Providers without a native async client fall back to a worker thread"""
+        return await asyncio.to_thread(self._generate_content, prompt, **kwargs)
+
+    def background_loop(self):
+        """This provider's long-running event loop, started on first use in a daemon thread"""
+        with self._loop_states_lock:
+            if self._background_loop is None or self._background_loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name=f'{self.provider_name}-async', daemon=True
+                ).start()
+                self._background_loop = loop
+            loop = self._background_loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("Cannot block on the provider's own event loop")
+        return loop
+
+    def run_async(self, coro, timeout=None):
+        """Sync shim: run a coroutine on this provider's background event loop and wait for it.
+
+        Lets the thread-based daemons drive many async requests at once while
+        the pooled async clients live on one long-running loop.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.background_loop()).result(timeout)
+
+    async def agenerate_batch(self, prompts, max_parallel=None, **kwargs):
+        """Async generator of BatchResult items for prompts, in completion order.
+
+        prompts may be any iterable and is consumed lazily, with at most
+        max_parallel (default max_concurrency) requests in flight.
+        Identical prompts in flight together are sent once; later repeats
+        are answered by the response cache.
+        A failed item yields its exception instead of failing the batch.
+        """
+        limit = max(1, max_parallel or self.max_concurrency)
+        prompts = enumerate(prompts)
+        in_flight = {}  # task -> (prompt, [indexes])
+        by_prompt = {}
+
+        async def generate(prompt):
+            return await self.agenerate_content(prompt, **dict(kwargs))
+
+        exhausted = False
+        try:
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < limit:
+                    item = next(prompts, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    index, prompt = item
+                    if prompt in by_prompt:
+                        by_prompt[prompt].append(index)
+                        continue
+                    task = asyncio.ensure_future(generate(prompt))
+                    by_prompt[prompt] = [index]
+                    in_flight[task] = prompt
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    indexes = by_prompt.pop(in_flight.pop(task))
+                    error = task.exception()
+                    if error is not None:
+                        logging.error(f"Batch item {indexes[0]} failed: {error}")
+                    response = None if error is not None else task.result()
+                    for index in indexes:
+                        yield BatchResult(index, response, error)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def generate_batch(self, prompts, ordered=False, max_parallel=None, **kwargs):
+        """Generate completions for many prompts, yielding BatchResult items as they finish.
+
+        Requests fan out on the provider's background loop. With ordered=True
+        items are yielded in input order, each as soon as every earlier item
+        has finished. Neither Gemini nor Azure offers an interactive
+        multi-prompt endpoint (their batch APIs are offline jobs), so every
+        provider uses bounded fan-out.
+        """
+        results = queue.Queue()
+        finished = object()
+
+        async def produce():
+            try:
+                async for item in self.agenerate_batch(prompts, max_parallel=max_parallel, **kwargs):
+                    results.put(item)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self.background_loop())
+        waiting = {}
+        next_index = 0
+        try:
+            while True:
+                item = results.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if not ordered:
+                    yield item
+                    continue
+                waiting[item.index] = item
+                while next_index in waiting:
+                    yield waiting.pop(next_index)
+                    next_index += 1
+        finally:
+            future.cancel()
+
+    @staticmethod
+    def validate_json_lines(response_text):
+        """Keep only the lines of a response that parse as JSON"""
+        valid_lines = []
+        for line in response_text.split('\n'):
+            line = line.strip()
+            if line and line != "Regular chat: no sketch update":
+                try:
+                    json.loads(line)  # Validate JSON
+                    valid_lines.append(line)
+                except json.JSONDecodeError:
+                    logging.error(f"Invalid JSON line: {line}")
+                    continue
+        return '\n'.join(valid_lines)
+
+    def cache_stats(self):
+        return self.response_cache.stats() if self.response_cache else None
+
+    def rate_limit_stats(self):
+        return self.rate_limiter.stats() if self.rate_limiter else None
+
+    def resilience_stats(self):
+        with self._resilience_lock:
+            snapshot = dict(self._resilience_stats)
+        snapshot['circuit'] = self.circuit_breaker.stats()
+        if self.fallback_provider:
+            snapshot['fallback'] = self.fallback_provider.provider_name
+            snapshot['fallback_circuit'] = self.fallback_provider.circuit_breaker.stats()
+        return snapshot
+
+    @abstractmethod
+    def _generate_content(self, prompt, **kwargs):
         pass
 
     @abstractmethod
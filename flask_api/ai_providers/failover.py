@@ -0,0 +1,26 @@
+import os
+import logging
+from .gemini_provider import GeminiProvider
+from .azure_provider import AzureOpenAIProvider
+
+
+def configure_failover(provider):
+    """Attach the other configured provider as provider's fallback when AI_FAILOVER is enabled.
+
+    The fallback keeps its own cache entries, rate limit and circuit
+    breaker, and never fails over itself. Returns the fallback or None.
+    """
+    if os.getenv('AI_FAILOVER', 'false').lower() != 'true':
+        return None
+    try:
+        fallback = GeminiProvider() if provider.provider_name == 'azure' else AzureOpenAIProvider()
+        if not fallback.initialize_provider():
+            logging.warning(f"Failover enabled but {fallback.provider_name} is not configured; running without a fallback")
+            return None
+        fallback.initialized = True
+        provider.fallback_provider = fallback
+        logging.info(f"Requests to {provider.provider_name} fail over to {fallback.provider_name}")
+        return fallback
+    except Exception as e:
+        logging.error(f"Error configuring failover provider: {e}")
+        return None
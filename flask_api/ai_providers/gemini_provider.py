@@ -1,11 +1,13 @@
 import os
+import asyncio
 import google.generativeai as genai
 from .base_provider import BaseAIProvider
 import logging
-import json
-import psycopg2
+from settings_cache import get_settings
 
 class GeminiProvider(BaseAIProvider):
+    provider_name = 'gemini'
+
     def __init__(self):
         super().__init__()
         self.api_key = None
@@ -60,67 +62,81 @@ class GeminiProvider(BaseAIProvider):
             logging.error(f"Error initializing Gemini provider: {e}")
             return False
 
+    def model_identifier(self):
+        return self.model_name
+
     def get_model_settings(self):
-        """Fetch model settings from database"""
+        """Fetch model settings from the platform settings cache"""
         try:
-            with psycopg2.connect(**self.db_config) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        SELECT ai_model_settings
-                        FROM platform_settings
-                        WHERE ai_provider = 'gemini'
-                        LIMIT 1
-                    """)
-                    result = cur.fetchone()
-                    if result and result[0]:
-                        return result[0]
+            settings = get_settings()
+            if settings.get('ai_provider') == 'gemini':
+                return settings.get('ai_model_settings', {})
             return {}
         except Exception as e:
             logging.error(f"Error fetching model settings: {e}")
             return {}
 
-    def generate_content(self, prompt, **kwargs):
+    def _request_options(self, kwargs):
+        # Merge default configs with any provided kwargs
+        generation_config = {
+            **self.default_generation_config,
+            **kwargs.get('generation_config', {})
+        }
+        safety_settings = kwargs.get('safety_settings', self.default_safety_settings)
+        return {'generation_config': generation_config, 'safety_settings': safety_settings}
+
+    def _response_text(self, response, kwargs):
+        if response.candidates:
+            response_text = response.candidates[0].content.parts[0].text.strip()
+
+            # Handle JSON validation if needed
+            if kwargs.get('validate_json', False):
+                return self.validate_json_lines(response_text)
+
+            return response_text
+        return None
+
+    def _generate_content(self, prompt, **kwargs):
         if not self.initialized:
             self.wait_for_configuration()
         try:
-            # Merge default configs with any provided kwargs
-            generation_config = {
-                **self.default_generation_config,
-                **kwargs.get('generation_config', {})
-            }
-            
-            safety_settings = kwargs.get('safety_settings', self.default_safety_settings)
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            
-            if response.candidates:
-                response_text = response.candidates[0].content.parts[0].text.strip()
-                
-                # Handle JSON validation if needed
-                if kwargs.get('validate_json', False):
-                    lines = response_text.split('\n')
-                    valid_lines = []
-                    for line in lines:
-                        line = line.strip()
-                        if line and line != "Regular chat: no sketch update":
-                            try:
-                                json.loads(line)  # Validate JSON
-                                valid_lines.append(line)
-                            except json.JSONDecodeError:
-                                logging.error(f"Invalid JSON line: {line}")
-                                continue
-                    return '\n'.join(valid_lines)
-                
-                return response_text
-            return None
+            response = self.model.generate_content(prompt, **self._request_options(kwargs))
+            return self._response_text(response, kwargs)
             
         except Exception as e:
             logging.error(f"Gemini generation error: {e}")
             raise
 
+    def _stream_content(self, prompt, **kwargs):
+        if not self.initialized:
+            self.wait_for_configuration()
+        try:
+            response = self.model.generate_content(prompt, stream=True, **self._request_options(kwargs))
+            for chunk in response:
+                if chunk.candidates and chunk.candidates[0].content.parts:
+                    text = ''.join(part.text for part in chunk.candidates[0].content.parts)
+                    if text:
+                        yield text
+
+        except Exception as e:
+            logging.error(f"Gemini streaming error: {e}")
+            raise
+
+    async def _agenerate_content(self, prompt, **kwargs):
+        if not self.initialized:
+            await asyncio.to_thread(self.wait_for_configuration)
+        try:
+            # The async gRPC channel multiplexes every request from this loop over one connection
+            state = self.loop_state()
+            if state.get('model_name') != self.model_name:
+                state['model'] = genai.GenerativeModel(self.model_name)
+                state['model_name'] = self.model_name
+            response = await state['model'].generate_content_async(prompt, **self._request_options(kwargs))
+            return self._response_text(response, kwargs)
+
+        except Exception as e:
+            logging.error(f"Gemini generation error: {e}")
+            raise
+
     def validate_configuration(self):
         return bool(self.api_key and self.model_name) 
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import random
+import asyncio
+import threading
+from time import monotonic
+
+# Exception class names that mean "try again" across the openai, google-api-core and grpc clients
+TRANSIENT_ERROR_NAMES = {
+    'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError',
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'TooManyRequests',
+    'GatewayTimeout', 'BadGateway', 'RetryError', 'AioRpcError',
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit is open and the request is not attempted"""
+    pass
+
+
+def is_transient(error):
+    """True for timeouts, connection failures, 408/429 and 5xx responses"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    """Full-jitter exponential backoff for the given zero-based retry"""
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are refused for reset_seconds. Then a single probe request
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._stats = {'opened': 0, 'rejected': 0, 'successes': 0, 'failures': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if monotonic() - self._opened_at >= self.reset_seconds else 'open'
+
+    def wait_time(self):
+        """0 if a request may go ahead now (reserving the probe when half open), else seconds to wait"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            remaining = self._opened_at + self.reset_seconds - monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return 0
+            self._stats['rejected'] += 1
+            # While a probe is in flight, check back shortly
+            return remaining if remaining > 0 else min(1.0, self.reset_seconds)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._stats['successes'] += 1
+
+    def release_probe(self):
+        """The request said nothing about the provider's health; let another request probe"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._stats['opened'] += 1
+                self._opened_at = monotonic()
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['state'] = self.state
+        return snapshot
+
+
+def breaker_from_env(provider_name):
+    prefix = provider_name.upper()
+    return CircuitBreaker(
+        provider_name,
+        failure_threshold=int(os.getenv(f'{prefix}_BREAKER_FAILURES', os.getenv('AI_BREAKER_FAILURES', 5))),
+        reset_seconds=float(os.getenv(f'{prefix}_BREAKER_RESET_SECONDS', os.getenv('AI_BREAKER_RESET_SECONDS', 30)))
+    )
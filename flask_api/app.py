@@ -5,6 +5,7 @@ import json
 import time
 from datetime import datetime
 import logging
+from flask_api.timesketch_importer import get_importer
 
 # Add JsonFormatter class at the top level
 class JsonFormatter(logging.Formatter):
@@ -121,8 +122,8 @@ def import_timeline():
     # Generate unique timeline name using timestamp
     timeline_name = f"timeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    import_command = f'timesketch --sketch {sketch_id} import --name "{timeline_name}" "{file_path}"'
-    result = run_timesketch_command(import_command)
+    # Reuses one authenticated Timesketch session instead of spawning the CLI
+    result = get_importer().import_file(sketch_id, file_path, timeline_name)
     
     if not result:
         return jsonify({'error': 'Failed to import timeline'}), 500
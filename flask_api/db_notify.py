@@ -0,0 +1,66 @@
+import logging
+import select
+from time import monotonic, sleep
+import psycopg2
+from psycopg2 import extensions
+
+
+class NotificationListener:
+    """Dedicated LISTEN connection that lets a daemon sleep until Postgres signals new work"""
+
+    def __init__(self, db_config, channels):
+        self.db_config = db_config
+        self.channels = channels
+        self.conn = None
+
+    def connect(self):
+        """Open the autocommit connection and subscribe to every channel"""
+        self.close()
+        self.conn = psycopg2.connect(**self.db_config)
+        self.conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cur:
+            for channel in self.channels:
+                cur.execute(f"LISTEN {channel}")
+        logging.info(f"Listening for notifications on: {', '.join(self.channels)}")
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def wait(self, timeout, debounce=1.0):
+        """Block until a notification arrives or timeout elapses.
+
+        After the first notification, keep collecting for up to `debounce`
+        seconds so a burst of inserts wakes the caller once. Returns the list
+        of (channel, payload) pairs received; empty means the timeout expired.
+        """
+        deadline = monotonic() + timeout
+        notifications = []
+        try:
+            if self.conn is None or self.conn.closed:
+                self.connect()
+
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([self.conn], [], [], remaining)
+                if not readable:
+                    break
+
+                self.conn.poll()
+                first = not notifications
+                while self.conn.notifies:
+                    notify = self.conn.notifies.pop(0)
+                    notifications.append((notify.channel, notify.payload))
+                if first and notifications:
+                    deadline = min(deadline, monotonic() + debounce)
+
+        except (psycopg2.Error, OSError) as e:
+            logging.error(f"Notification listener error, falling back to polling: {e}")
+            self.close()
+            # Avoid a tight reconnect loop while the database is unavailable
+            sleep(max(0, min(deadline - monotonic(), 5)))
+
+        return notifications
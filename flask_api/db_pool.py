@@ -0,0 +1,175 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from time import monotonic
+import psycopg2
+from psycopg2 import extensions
+from psycopg2 import pool as pg_pool
+
+
+def default_db_config(application_name='SecuritySketch'):
+    """Build database configuration from environment"""
+    return {
+        'dbname': os.getenv('DB_NAME', 'security_sketch'),
+        'user': os.getenv('DB_USER', 'sketch_user'),
+        'password': os.getenv('DB_PASSWORD'),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'application_name': application_name
+    }
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+    pass
+
+
+class PooledConnection(extensions.connection):
+    """psycopg2 connection that remembers which statements it has prepared"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class DatabasePool:
+    """Bounded, thread-safe Postgres connection pool shared by a whole process"""
+
+    def __init__(self, db_config, min_connections=1, max_connections=5, checkout_timeout=30):
+        self.db_config = db_config
+        self.max_connections = max_connections
+        self.checkout_timeout = checkout_timeout
+        self._pool = pg_pool.ThreadedConnectionPool(
+            min_connections,
+            max_connections,
+            connection_factory=PooledConnection,
+            **db_config
+        )
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._statements = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'checkouts': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'discarded': 0
+        }
+
+    def register_statement(self, name, sql):
+        """Register SQL (using $1, $2 placeholders) to be prepared lazily per connection"""
+        with self._lock:
+            self._statements[name] = sql
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error, always return it"""
+        start = monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            raise PoolTimeout(f"No database connection available after {self.checkout_timeout}s")
+
+        waited = monotonic() - start
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['in_use'] += 1
+            self._metrics['peak_in_use'] = max(self._metrics['peak_in_use'], self._metrics['in_use'])
+            self._metrics['wait_time_total'] += waited
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], waited)
+
+        conn = None
+        broken = False
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            yield conn
+            if not conn.closed and not conn.autocommit:
+                conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                discard = broken or bool(conn.closed)
+                if discard:
+                    with self._lock:
+                        self._metrics['discarded'] += 1
+                    logging.warning("Discarding broken database connection from pool")
+                self._pool.putconn(conn, close=discard)
+            with self._lock:
+                self._metrics['in_use'] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        """Check out a connection and yield a cursor on it"""
+        with self.connection() as conn:
+            with conn.cursor(**kwargs) as cur:
+                yield cur
+
+    def execute_prepared(self, cur, name, params=()):
+        """Execute a registered statement, preparing it on this connection first if needed"""
+        conn = cur.connection
+        if name not in conn.prepared_statements:
+            sql = self._statements[name]
+            cur.execute(f"PREPARE {name} AS {sql}")
+            conn.prepared_statements.add(name)
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cur.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    def stats(self):
+        """Return a snapshot of pool metrics for sizing"""
+        with self._lock:
+            snapshot = dict(self._metrics)
+        checkouts = snapshot['checkouts']
+        snapshot['wait_time_avg'] = snapshot['wait_time_total'] / checkouts if checkouts else 0.0
+        snapshot['max_connections'] = self.max_connections
+        return snapshot
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def configure(db_config):
+    """Set the configuration used when the process-wide pool is first created"""
+    global _pool_config
+    with _pool_lock:
+        if _pool is not None:
+            logging.warning("Database pool already created, ignoring new configuration")
+            return
+        _pool_config = db_config
+
+
+def get_pool():
+    """Return the process-wide database pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = _pool_config or default_db_config()
+            _pool = DatabasePool(
+                config,
+                min_connections=int(os.getenv('DB_POOL_MIN', 1)),
+                max_connections=int(os.getenv('DB_POOL_MAX', 5)),
+                checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30))
+            )
+            logging.info(f"Created database pool for {config.get('application_name')} "
+                         f"(max {_pool.max_connections} connections)")
+        return _pool
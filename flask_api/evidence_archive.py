@@ -0,0 +1,306 @@
+import io
+import os
+import gzip
+import logging
+import tarfile
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # .zst uploads are rejected without it
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COMPRESSED_SUFFIXES = ('.gz', '.gzip', '.zst', '.zstd', '.zip', '.tgz', '.tar')
+TEXT_FILE_TYPES = ('csv', 'tsv', 'txt')
+
+
+class DecompressionLimitError(ValueError):
+    """An upload expands past the decompressed size allowed for it (a likely zip bomb)"""
+    pass
+
+
+def open_text(source):
+    """Open a path, or call a stream factory, as UTF-8 text that never fails on bad bytes"""
+    if callable(source):
+        return source()
+    return open(source, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def _text_stream(binary):
+    return io.TextIOWrapper(binary, encoding='utf-8', errors='replace', newline='')
+
+
+def member_file_type(name, default):
+    """File type for an archive member, from its own extension"""
+    base = name
+    lowered = base.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if lowered.endswith(suffix):
+            base = base[:-len(suffix)]
+            lowered = base.lower()
+    extension = os.path.splitext(lowered)[1].lstrip('.')
+    if extension in TEXT_FILE_TYPES:
+        return extension
+    return default if default in TEXT_FILE_TYPES else 'txt'
+
+
+def looks_binary(data):
+    return b'\x00' in data
+
+
+class _Prefixed(io.RawIOBase):
+    """Replays bytes already read for sniffing, then continues with the stream"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+class _Budget:
+    """Decompressed bytes allowed for one upload, per member and across all members.
+
+    A member opened again (say for the structured pass and then the model)
+    is charged once, for the most read from it.
+    """
+
+    def __init__(self, name, member_limit, total_limit):
+        self.name = name
+        self.member_limit = member_limit
+        self.total_limit = total_limit
+        self.total = 0
+        self._members = {}
+
+    def check_member(self, member, read):
+        if self.member_limit and read > self.member_limit:
+            raise DecompressionLimitError(
+                f"{member} in {self.name} decompresses to more than {self.member_limit} bytes"
+            )
+
+    def charge(self, member, read):
+        self.check_member(member, read)
+        self.charge_total(member, read)
+
+    def charge_total(self, member, read):
+        previous = self._members.get(member, 0)
+        if read > previous:
+            self._members[member] = read
+            self.total += read - previous
+            if self.total_limit and self.total > self.total_limit:
+                raise DecompressionLimitError(f"{self.name} decompresses to more than {self.total_limit} bytes")
+
+
+class _Limited(io.RawIOBase):
+    """Counts decompressed bytes as they are read and stops once a limit is passed"""
+
+    def __init__(self, stream, check):
+        self._stream = stream
+        self._check = check
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        self._read += len(data)
+        self._check(self._read)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def _limited(open_binary, check):
+    """Wrap a stream factory so every read is passed to check(bytes_read_so_far)"""
+    return lambda: _Limited(open_binary(), check)
+
+
+def _sniffed(open_binary):
+    """Return (head, factory); the factory's first stream reuses the one opened for sniffing"""
+    stream = open_binary()
+    head = stream.read(4096)
+    pending = [stream]
+
+    def factory():
+        if pending:
+            return _text_stream(io.BufferedReader(_Prefixed(head, pending.pop())))
+        return _text_stream(io.BufferedReader(_Prefixed(b'', open_binary())))
+
+    def discard():
+        while pending:
+            pending.pop().close()
+
+    return head, factory, discard
+
+
+class _TarMembers:
+    """Sequential access to the file members of a (possibly compressed) tar stream.
+
+    The tar is read in stream mode so nothing is extracted; reopening a
+    member that has already been passed restarts the stream from the top.
+    """
+
+    def __init__(self, open_raw):
+        self.open_raw = open_raw
+        self._raw = None
+        self._tar = None
+        self._iter = None
+        self._index = -1
+        self._member = None
+
+    def _restart(self):
+        self.close()
+        self._raw = self.open_raw()
+        self._tar = tarfile.open(fileobj=self._raw, mode='r|')
+        self._iter = iter(self._tar)
+        self._index = -1
+
+    def _advance(self):
+        for member in self._iter:
+            if member.isfile():
+                self._index += 1
+                self._member = member
+                return member
+        return None
+
+    def __iter__(self):
+        self._restart()
+        while True:
+            member = self._advance()
+            if member is None:
+                return
+            yield self._index, member.name
+
+    def open(self, wanted):
+        if self._tar is None or wanted < self._index:
+            self._restart()
+        while self._index < wanted:
+            if self._advance() is None:
+                raise KeyError(f"Archive member {wanted} not found")
+        if wanted == self._index and self._member is not None:
+            stream = self._tar.extractfile(self._member)
+            # A stream-mode member can only be read once
+            self._member = None
+            return stream
+        self._restart()
+        return self.open(wanted)
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+        if self._raw is not None:
+            self._raw.close()
+        self._tar = self._raw = self._iter = None
+
+
+def _open_zstd(path):
+    if zstandard is None:
+        raise RuntimeError("zstandard is not installed; cannot read .zst evidence")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def _is_tar(open_raw):
+    with open_raw() as raw:
+        header = raw.read(512)
+    return len(header) == 512 and header[257:262] == b'ustar'
+
+
+def iter_members(path, name, default_type, max_member_bytes=0, max_total_bytes=0, max_ratio=0):
+    """Yield (member_name, file_type, open_text_factory) for every text file in an upload.
+
+    Plain files yield themselves. gzip and zstd streams yield their single
+    decompressed file, or each member if they wrap a tar; zip and tar
+    archives yield each member. Factories decompress on the fly and can be
+    called more than once, but only while this generator is on that member.
+    Binary members are skipped.
+
+    Reading a member past max_member_bytes, or the upload past
+    max_total_bytes or max_ratio times its compressed size, raises
+    DecompressionLimitError. 0 disables a limit.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+
+    total_limit = min(
+        [limit for limit in (max_total_bytes, max_ratio * os.path.getsize(path)) if limit] or [0]
+    )
+    budget = _Budget(name, max_member_bytes, total_limit)
+
+    if magic.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # Declared sizes can lie, so reads are counted as well
+                budget.check_member(info.filename, info.file_size)
+                head, factory, discard = _sniffed(_limited(
+                    lambda info=info: archive.open(info),
+                    lambda read, member=info.filename: budget.charge(member, read)
+                ))
+                if looks_binary(head):
+                    logging.info(f"Skipping binary archive member {info.filename}")
+                else:
+                    yield info.filename, member_file_type(info.filename, default_type), factory
+                discard()
+        return
+
+    compressed = magic.startswith(GZIP_MAGIC) or magic.startswith(ZSTD_MAGIC)
+    if magic.startswith(GZIP_MAGIC):
+        open_raw = lambda: gzip.open(path, 'rb')
+    elif magic.startswith(ZSTD_MAGIC):
+        open_raw = lambda: _open_zstd(path)
+    else:
+        open_raw = lambda: open(path, 'rb')
+
+    if _is_tar(open_raw):
+        # The decompressed tar stream carries every member, so it counts toward the total
+        if compressed:
+            open_raw = _limited(open_raw, lambda read: budget.charge_total(name, read))
+        members = _TarMembers(open_raw)
+        try:
+            for index, member_name in members:
+                head, factory, discard = _sniffed(_limited(
+                    lambda index=index: members.open(index),
+                    lambda read, member_name=member_name: budget.check_member(member_name, read)
+                ))
+                if looks_binary(head):
+                    logging.info(f"Skipping binary archive member {member_name}")
+                else:
+                    yield member_name, member_file_type(member_name, default_type), factory
+                discard()
+        finally:
+            members.close()
+        return
+
+    if not compressed:
+        yield name, default_type, lambda: open_text(path)
+        return
+
+    head, factory, discard = _sniffed(_limited(open_raw, lambda read: budget.charge(name, read)))
+    if looks_binary(head):
+        logging.info(f"Skipping binary content in {name}")
+    else:
+        yield name, member_file_type(name, default_type), factory
+    discard()
@@ -0,0 +1,145 @@
+import os
+import mmap
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class StoredFile:
+    """A readable local copy (or the original) of an uploaded evidence file"""
+
+    def __init__(self, path, sha256, temporary):
+        self.path = path
+        self.sha256 = sha256
+        self.temporary = temporary
+
+    def release(self):
+        """Remove the file if it is a temporary copy; originals are never touched"""
+        if self.temporary and os.path.exists(self.path):
+            try:
+                os.unlink(self.path)
+            except OSError as e:
+                logging.error(f"Error removing temporary file {self.path}: {e}")
+
+
+class LocalStorage:
+    """Reads uploads in place from a directory shared with the API container.
+
+    Nothing is copied: the file is hashed through a read-only mmap and the
+    analysis reads the original path directly.
+    """
+
+    def __init__(self, uploads_dir):
+        self.uploads_dir = uploads_dir
+
+    def locate(self, filename):
+        # Only the stored name is trusted; the API's absolute path is for its own container
+        path = os.path.join(self.uploads_dir, os.path.basename(filename or ''))
+        return path if filename and os.path.isfile(path) else None
+
+    def fetch(self, file_id, filename):
+        path = self.locate(filename)
+        if not path:
+            logging.error(f"Upload {filename} for file {file_id} not found in {self.uploads_dir}")
+            return None
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+        return StoredFile(path, digest.hexdigest(), temporary=False)
+
+
+class HttpStorage:
+    """Downloads uploads from the Node API over one pooled session.
+
+    An interrupted transfer resumes with a Range request from the last byte
+    written; if the server ignores the range, the download starts over.
+    """
+
+    def __init__(self, api_url, api_key, max_retries=3, chunk_size=1024 * 1024, pool_size=8):
+        self.api_url = api_url.rstrip('/')
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        self.session.headers['x-api-key'] = api_key or ''
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, file_id, filename=None):
+        url = f"{self.api_url}/api/files/download/{file_id}"
+        tmp_file = tempfile.NamedTemporaryFile(delete=False)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            for attempt in range(self.max_retries + 1):
+                headers = {'Range': f"bytes={written}-"} if written else {}
+                try:
+                    with self.session.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                        if written and response.status_code == 200:
+                            # Range not honoured; start again from the first byte
+                            logging.warning(f"Server ignored range request for file {file_id}, restarting download")
+                            tmp_file.seek(0)
+                            tmp_file.truncate()
+                            digest = hashlib.sha256()
+                            written = 0
+                        elif response.status_code not in (200, 206):
+                            logging.error(f"Failed to download file {file_id}: {response.status_code}")
+                            tmp_file.close()
+                            os.unlink(tmp_file.name)
+                            return None
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            if chunk:
+                                tmp_file.write(chunk)
+                                digest.update(chunk)
+                                written += len(chunk)
+                    tmp_file.close()
+                    return StoredFile(tmp_file.name, digest.hexdigest(), temporary=True)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    logging.warning(f"Download of file {file_id} interrupted after {written} bytes, resuming: {e}")
+        except Exception as e:
+            logging.error(f"Error downloading file {file_id}: {e}")
+            tmp_file.close()
+            if os.path.exists(tmp_file.name):
+                os.unlink(tmp_file.name)
+            return None
+
+
+class AutoStorage:
+    """Reads in place when the shared uploads volume has the file, else downloads it"""
+
+    def __init__(self, local, http):
+        self.local = local
+        self.http = http
+
+    def fetch(self, file_id, filename):
+        if self.local.locate(filename):
+            return self.local.fetch(file_id, filename)
+        return self.http.fetch(file_id, filename)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage(api_url, api_key):
+    """Return the process-wide evidence storage backend selected by EVIDENCE_STORAGE"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.getenv('EVIDENCE_STORAGE', 'auto').lower()
+            uploads_dir = os.getenv('EVIDENCE_UPLOADS_DIR', '/app/uploads')
+            if backend == 'local':
+                _storage = LocalStorage(uploads_dir)
+            elif backend == 'http' or not os.path.isdir(uploads_dir):
+                _storage = HttpStorage(api_url, api_key)
+            else:
+                _storage = AutoStorage(LocalStorage(uploads_dir), HttpStorage(api_url, api_key))
+            logging.info(f"Using {type(_storage).__name__} for evidence files")
+        return _storage
@@ -0,0 +1,181 @@
+import os
+import re
+import uuid
+import logging
+import threading
+from datetime import datetime
+from time import monotonic
+from jsonl_stream import JsonlFiles
+
+# Spooled files are written under this suffix and renamed once complete,
+# so recover() never picks up a half-written file
+PARTIAL_SUFFIX = '.partial'
+
+
+class ImportCoalescer:
+    """Batches spooled JSONL files per sketch into few, larger Timesketch imports.
+
+    Callers hand over a written JSONL file with add(); the file stays on disk
+    until the batch it belongs to is imported, so a crash loses nothing and
+    recover() re-queues leftovers on startup. A sketch's batch is flushed
+    when it reaches max_events or has been open for window_seconds.
+
+    A failed import is retried under the same timeline name with exponential
+    backoff; after max_attempts its files are moved to a failed/ directory
+    next to them.
+    """
+
+    def __init__(self, importer, timeline_prefix, window_seconds=30, max_events=5000,
+                 max_attempts=5, retry_base_seconds=30, retry_max_seconds=900):
+        self.importer = importer
+        self.timeline_prefix = timeline_prefix
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats = {'files': 0, 'events': 0, 'imports': 0, 'failed_imports': 0, 'abandoned_files': 0}
+        self._stop = threading.Event()
+        # Checked often enough that a short window adds little latency; also drives retries
+        self._tick_seconds = min(1.0, self.window_seconds / 4) if self.window_seconds > 0 else 1.0
+        self._thread = threading.Thread(target=self._flush_loop, name='import-coalescer', daemon=True)
+        self._thread.start()
+
+    def _new_batch(self):
+        return {
+            'files': [],
+            'events': 0,
+            'opened_at': monotonic(),
+            'timeline_name': f"{self.timeline_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}",
+            'attempts': 0,
+            'retry_at': 0
+        }
+
+    def add(self, sketch_id, file_path, event_count):
+        """Queue a JSONL file for import into sketch_id"""
+        with self._lock:
+            batch = self._batches.setdefault(sketch_id, self._new_batch())
+            batch['files'].append(file_path)
+            batch['events'] += event_count
+            self._stats['files'] += 1
+            # A batch waiting to retry is left to the flush loop
+            full = (self.window_seconds <= 0 or batch['events'] >= self.max_events) and not batch['attempts']
+        if full:
+            self.flush(sketch_id)
+
+    def recover(self, directory, pattern):
+        """Queue JSONL files left behind by a previous run; pattern captures the sketch id"""
+        regex = re.compile(pattern)
+        recovered = 0
+        for name in sorted(os.listdir(directory)):
+            file_path = os.path.join(directory, name)
+            if name.endswith(PARTIAL_SUFFIX) and regex.match(name[:-len(PARTIAL_SUFFIX)]):
+                logging.info(f"Removing unfinished spooled file {file_path}")
+                os.remove(file_path)
+                continue
+            match = regex.match(name)
+            if not match:
+                continue
+            with open(file_path) as f:
+                event_count = sum(1 for line in f if line.strip())
+            self.add(int(match.group(1)), file_path, event_count)
+            recovered += 1
+        if recovered:
+            logging.info(f"Re-queued {recovered} unimported JSONL files from {directory}")
+
+    def flush(self, sketch_id):
+        """Import everything queued for one sketch as a single timeline"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._batches.get(sketch_id)
+                if batch and batch['retry_at'] > monotonic():
+                    return False
+                self._batches.pop(sketch_id, None)
+            if not batch or not batch['files']:
+                return True
+
+            # Events are streamed from the spooled files rather than loaded into memory
+            events = JsonlFiles(batch['files'])
+            timeline_name = batch['timeline_name']
+            if batch['events'] and not self.importer.import_events(sketch_id, events, timeline_name):
+                batch['attempts'] += 1
+                with self._lock:
+                    self._stats['failed_imports'] += 1
+                if batch['attempts'] >= self.max_attempts:
+                    self._abandon(sketch_id, batch)
+                    return False
+                delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (batch['attempts'] - 1))
+                batch['retry_at'] = monotonic() + delay
+                # Put the batch back under the same timeline name; files queued meanwhile join it
+                with self._lock:
+                    newer = self._batches.get(sketch_id)
+                    if newer:
+                        batch['files'] += newer['files']
+                        batch['events'] += newer['events']
+                    self._batches[sketch_id] = batch
+                logging.error(f"Coalesced import to sketch {sketch_id} failed "
+                              f"(attempt {batch['attempts']}/{self.max_attempts}), retrying in {delay:.0f}s")
+                return False
+
+            logging.info(f"Imported {batch['events']} events from {len(batch['files'])} files "
+                         f"to sketch {sketch_id} as {timeline_name}")
+            with self._lock:
+                self._stats['imports'] += 1
+                self._stats['events'] += batch['events']
+            for file_path in batch['files']:
+                try:
+                    os.remove(file_path)
+                except OSError as e:
+                    logging.error(f"Error removing imported file {file_path}: {e}")
+            return True
+
+    def _abandon(self, sketch_id, batch):
+        """Move a batch that keeps failing out of the spool, where recover() will not pick it up"""
+        for file_path in batch['files']:
+            failed_dir = os.path.join(os.path.dirname(file_path), 'failed')
+            try:
+                os.makedirs(failed_dir, exist_ok=True)
+                os.replace(file_path, os.path.join(failed_dir, os.path.basename(file_path)))
+            except OSError as e:
+                logging.error(f"Error moving {file_path} aside: {e}")
+        with self._lock:
+            self._stats['abandoned_files'] += len(batch['files'])
+        logging.error(f"Giving up on importing {batch['events']} events to sketch {sketch_id} after "
+                      f"{batch['attempts']} attempts; moved {len(batch['files'])} files to failed/")
+
+    def flush_due(self):
+        now = monotonic()
+        with self._lock:
+            due = [
+                sketch_id for sketch_id, batch in self._batches.items()
+                if now - batch['opened_at'] >= self.window_seconds and now >= batch['retry_at']
+            ]
+        for sketch_id in due:
+            self.flush(sketch_id)
+
+    def flush_all(self):
+        with self._lock:
+            sketch_ids = list(self._batches.keys())
+        for sketch_id in sketch_ids:
+            self.flush(sketch_id)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self._tick_seconds):
+            try:
+                self.flush_due()
+            except Exception as e:
+                logging.error(f"Error flushing coalesced imports: {e}")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending_sketches'] = len(self._batches)
+            snapshot['pending_events'] = sum(batch['events'] for batch in self._batches.values())
+        return snapshot
+
+    def close(self):
+        self._stop.set()
+        self.flush_all()
@@ -0,0 +1,142 @@
+import re
+import threading
+
+# Typed indicator patterns, checked in this order; earlier kinds claim their matches first
+INDICATOR_PATTERNS = {
+    'url': r'\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s"\'<>]+',
+    'email': r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b',
+    'ip': r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+          r'|\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b'
+          # Compressed form; one group of 3-4 hex digits keeps times and labels (12:30::45, a:b::c) out
+          r'|(?<![\w:])(?=[0-9a-fA-F:]*[0-9a-fA-F]{3})'
+          r'(?:[0-9a-fA-F]{1,4}:)+:[0-9a-fA-F]{1,4}(?::[0-9a-fA-F]{1,4})*\b',
+    'sha256_hash': r'\b[0-9a-fA-F]{64}\b',
+    'sha1_hash': r'\b[0-9a-fA-F]{40}\b',
+    'md5_hash': r'\b[0-9a-fA-F]{32}\b',
+    'file_path': r'\b[A-Za-z]:\\[^\s"\'<>|]+'
+                 r'|(?<![\w/])/(?:[\w.-]+/)+[\w.-]+'
+                 r'|\b[\w-]+\.(?:exe|dll|ps1|bat|cmd|vbs|hta|scr|msi|lnk|jar|sh|elf|bin)\b',
+    'domain': r'\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+'
+              r'(?:com|net|org|io|co|ru|cn|info|biz|xyz|top|onion|gov|edu|mil|us|uk|de|local|internal|corp)\b',
+    'mitre_technique': r'\bT\d{4}(?:\.\d{3})?\b',
+    'cve': r'\bCVE-\d{4}-\d{4,}\b',
+    # Machine names in the style analysts paste them: WS01, CPC1234, SRV-DC-02
+    'hostname': r'\b[A-Z]{2,}[A-Z0-9]*(?:-[A-Z0-9]+)*-?\d{2,}[A-Z0-9]*\b',
+    'username': r'(?i:\b(?:user(?:name)?|account|login)\s*[:=]?\s+)([A-Za-z][\w.\\-]{1,63})',
+}
+INDICATOR_REGEXES = {kind: re.compile(pattern) for kind, pattern in INDICATOR_PATTERNS.items()}
+
+# Kinds unambiguous enough to become an event without the model
+DIRECT_EVENT_KINDS = ('ip', 'domain', 'url', 'file_path', 'sha256_hash', 'sha1_hash', 'md5_hash')
+
+# Any indicator kind, for callers that only need a yes/no answer
+INDICATOR_RE = re.compile('|'.join(f"(?:{pattern})" for pattern in INDICATOR_PATTERNS.values()))
+
+TIMESTAMP_RE = re.compile(
+    r'\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?\b'
+    r'|\b\d{1,2}/\d{1,2}/\d{2,4}\b'
+    r'|\b\d{1,2}:\d{2}(?::\d{2})?\s?(?:[aApP][mM]|UTC|GMT|[ECMP][SD]T)?\b'
+)
+
+# Security terms, plus the finding, containment and connectivity phrases the operator prompt
+# turns into events; findings often carry no indicator. Everyday words ("process", "port",
+# "logs", "connect") are left out so ordinary chat is not sent to the model.
+SECURITY_KEYWORDS_RE = re.compile(
+    r'\b(?:malware|malicious|suspicious|phish\w*|ransom\w*|exfil\w*|c2|beacon\w*|lateral movement|'
+    r'persistence|privilege escalation|compromis\w*|breach\w*|iocs?|indicators? of compromise|'
+    r'contain(?:ed|ment)|network contain|isolated (?:the )?(?:host|machine|device|system)|quarantin\w*|'
+    r'edr|siem|credential\w*|brute[- ]?forc\w*|password spray\w*|failed log(?:in|on)s?|mfa fatigue|'
+    r'exploit\w*|payload|powershell|mimikatz|cobalt strike|scheduled task|rdp|vulnerab\w*|cve|'
+    r'attacker|threat actor|infected|forensic\w*|ttps?|mitre|'
+    r'(?:no|any) (?:other|additional|further) (?:users?|hosts?|machines?|systems?|accounts?|impact|compromise)|'
+    r'(?:investigation|analysis|review|triage) (?:is )?(?:complete|completed|done|finished)|'
+    r'(?:reviewed|checked|pulled|went through) (?:all |the )*(?:logs|emails|alerts|events)|'
+    r'(?:users?|hosts?|machines?|systems?|accounts?) (?:were |was )?(?:affected|impacted)|'
+    r'(?:validate|verify|check|test) (?:the )?(?:connectivity|connection|access))\b',
+    re.IGNORECASE
+)
+
+
+def extract_indicators(text):
+    """Return {kind: [values]} for every indicator in text, each value listed once"""
+    found = {}
+    if not text:
+        return found
+    claimed = []
+    for kind, regex in INDICATOR_REGEXES.items():
+        for match in regex.finditer(text):
+            group = 1 if regex.groups else 0
+            start, end = match.span(group)
+            # A hash inside a URL or a domain inside an email is part of that indicator
+            if any(start < claimed_end and end > claimed_start for claimed_start, claimed_end in claimed):
+                continue
+            claimed.append((start, end))
+            values = found.setdefault(kind, [])
+            value = match.group(group)
+            if value not in values:
+                values.append(value)
+    return found
+
+
+def single_indicator(text):
+    """Return (kind, value) when text is nothing but one indicator of a DIRECT_EVENT_KINDS kind, else None"""
+    stripped = (text or '').strip().strip('.,;:!?()[]"\'')
+    if not stripped or any(ch.isspace() for ch in stripped):
+        return None
+    found = extract_indicators(stripped)
+    if len(found) != 1:
+        return None
+    kind, values = next(iter(found.items()))
+    if kind not in DIRECT_EVENT_KINDS or values != [stripped]:
+        return None
+    return kind, stripped
+
+
+class ChatPreClassifier:
+    """Decides locally whether a batch of chat messages needs the model at all.
+
+    A message is relevant if it is flagged llm_required, contains an
+    indicator, or uses investigation vocabulary; a batch with no relevant
+    message is skipped. Timestamps are extracted for callers but never make
+    a message relevant on their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'batches': 0, 'batches_skipped': 0, 'messages': 0, 'direct_events': 0}
+
+    def classify(self, message):
+        """Annotate a message dict with its indicators and relevance; returns the relevance"""
+        content = message.get('content') or ''
+        message['indicators'] = extract_indicators(content)
+        message['timestamps'] = TIMESTAMP_RE.findall(content)
+        message['relevant'] = bool(
+            message.get('llm_required')
+            or message['indicators']
+            or SECURITY_KEYWORDS_RE.search(content)
+        )
+        return message['relevant']
+
+    def needs_model(self, messages):
+        """True if any message in the batch is relevant; records the decision"""
+        relevant = any(
+            message['relevant'] if 'relevant' in message else self.classify(message)
+            for message in messages
+        )
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['messages'] += len(messages)
+            if not relevant:
+                self._stats['batches_skipped'] += 1
+        return relevant
+
+    def record_direct_events(self, count):
+        with self._lock:
+            self._stats['direct_events'] += count
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['skip_rate'] = snapshot['batches_skipped'] / snapshot['batches'] if snapshot['batches'] else 0.0
+        snapshot['llm_calls_saved'] = snapshot['batches_skipped']
+        return snapshot
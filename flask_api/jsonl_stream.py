@@ -0,0 +1,99 @@
+import re
+import json
+import logging
+
+# Fields every Timesketch event needs before it can be imported
+REQUIRED_FIELDS = ('message', 'datetime', 'timestamp_desc')
+
+# Markdown fence at the start or end of a line, with an optional language tag
+LEADING_FENCE_RE = re.compile(r'^```[\w-]*')
+TRAILING_FENCE_RE = re.compile(r'```$')
+
+
+class JsonlEventParser:
+    """Incremental parser for model output written as JSON lines.
+
+    Text can be fed in chunks of any size; each line that parses as a JSON
+    object with the required Timesketch fields is returned as soon as its
+    newline arrives. Markdown fences and status lines (such as "No security
+    content found") are skipped. Only the current partial line is buffered.
+    """
+
+    def __init__(self, status_lines=(), required_fields=REQUIRED_FIELDS):
+        self.status_lines = status_lines
+        self.required_fields = required_fields
+        self.status_seen = False
+        self._partial = ''
+        self.stats = {'events': 0, 'invalid': 0}
+
+    def feed(self, text):
+        """Add text and return the event lines it completed"""
+        if not text:
+            return []
+        if '\n' not in text:
+            self._partial += text
+            return []
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        return [event for event in map(self._parse_line, lines) if event]
+
+    def close(self):
+        """Parse whatever is left after the last newline"""
+        line, self._partial = self._partial, ''
+        event = self._parse_line(line)
+        return [event] if event else []
+
+    def iter_events(self, chunks):
+        """Yield event lines from an iterable of text chunks as each line completes"""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.close()
+
+    def _parse_line(self, line):
+        # Fences may sit on their own lines or wrap the event inline (```{...}```)
+        line = TRAILING_FENCE_RE.sub('', LEADING_FENCE_RE.sub('', line.strip())).strip()
+        if not line:
+            return None
+        if not line.startswith('{') and any(status in line for status in self.status_lines):
+            self.status_seen = True
+            return None
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError as e:
+            logging.error(f"Invalid JSON line: {line} ({e})")
+            self.stats['invalid'] += 1
+            return None
+        missing = [field for field in self.required_fields if not isinstance(event, dict) or field not in event]
+        if missing:
+            logging.error(f"Dropping event without {', '.join(missing)}: {line}")
+            self.stats['invalid'] += 1
+            return None
+        self.stats['events'] += 1
+        return line
+
+
+class JsonlFiles:
+    """The events in a list of JSONL files, read a line at a time.
+
+    Can be iterated more than once (each pass re-opens the files), so an
+    import can be retried without holding the events in memory. Unreadable
+    files and lines are logged and skipped.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError as e:
+                            logging.error(f"Skipping invalid JSON line in {path}: {e}")
+            except OSError as e:
+                logging.error(f"Error reading spooled file {path}, skipping it: {e}")
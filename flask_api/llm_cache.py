@@ -0,0 +1,145 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from time import time
+
+
+class ResponseCache:
+    """Content-addressed LLM response cache backed by a local SQLite file.
+
+    Entries are keyed on a hash of provider, model, generation options and
+    the full prompt (which already embeds the prompt template version). The
+    file can be shared by both daemons in the same container.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age_seconds=7 * 24 * 3600, evict_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)")
+
+    @staticmethod
+    def make_key(provider, model, prompt, options=None):
+        """Hash everything that can change the model's answer"""
+        material = json.dumps({
+            'provider': provider,
+            'model': model,
+            'options': options or {},
+            'prompt': prompt
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key):
+        """Return the cached response or None; expired entries count as misses"""
+        now = time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+            if row and now - row[1] <= self.max_age_seconds:
+                self._conn.execute(
+                    "UPDATE responses SET last_accessed = ? WHERE cache_key = ?",
+                    (now, cache_key)
+                )
+                self._stats['hits'] += 1
+                return row[0]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, cache_key, response):
+        now = time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO responses (cache_key, response, size, created_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    response = excluded.response,
+                    size = excluded.size,
+                    created_at = excluded.created_at,
+                    last_accessed = excluded.last_accessed
+            """, (cache_key, response, len(response.encode('utf-8')), now, now))
+            self._stats['stores'] += 1
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= self.evict_every:
+                self._puts_since_eviction = 0
+                self._evict(now)
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        evicted = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?",
+            (now - self.max_age_seconds,)
+        ).rowcount
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            stale_keys = []
+            for cache_key, size in self._conn.execute(
+                "SELECT cache_key, size FROM responses ORDER BY last_accessed ASC"
+            ):
+                if freed >= excess:
+                    break
+                stale_keys.append((cache_key,))
+                freed += size
+            self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", stale_keys)
+            evicted += len(stale_keys)
+
+        if evicted:
+            self._stats['evictions'] += evicted
+            logging.info(f"Evicted {evicted} cached LLM responses")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide response cache, or None when caching is disabled"""
+    global _cache
+    if os.getenv('LLM_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache(
+                    os.getenv('LLM_CACHE_PATH', os.path.join('cache', 'llm_responses.sqlite3')),
+                    max_bytes=int(os.getenv('LLM_CACHE_MAX_MB', 256)) * 1024 * 1024,
+                    max_age_seconds=int(os.getenv('LLM_CACHE_MAX_AGE_HOURS', 168)) * 3600
+                )
+                logging.info(f"Using LLM response cache at {_cache.path}")
+            except Exception as e:
+                logging.error(f"Error opening LLM response cache, continuing without it: {e}")
+                return None
+        return _cache
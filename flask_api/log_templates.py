@@ -0,0 +1,265 @@
+import re
+from datetime import datetime, timezone
+from indicators import INDICATOR_RE
+from structured_evidence import COLUMN_ALIASES, IOC_ATTRIBUTES
+from token_budget import CHARS_PER_TOKEN, estimate_tokens
+
+WILDCARD = '<*>'
+TIMESTAMP_TOKEN = '<time>'
+
+# Event time at the start of (or anywhere in) a line: ISO 8601, syslog, Apache/CLF
+TIMESTAMP_RE = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+    r'|[A-Z][a-z]{2}\s+\d{1,2}\s\d{2}:\d{2}:\d{2}'
+    r'|\d{2}/[A-Z][a-z]{2}/\d{4}:\d{2}:\d{2}:\d{2}(?:\s[+-]\d{4})?'
+)
+
+# Column names or preceding words that mark a value as an indicator no pattern would catch
+# (usernames, hostnames, paths); "for" covers auth logs such as "Accepted publickey for deploy"
+INDICATOR_LABELS = {alias for attribute in IOC_ATTRIBUTES for alias in COLUMN_ALIASES[attribute]} | {'for'}
+
+SYSLOG_SPACES_RE = re.compile(r'\s+')
+
+
+def split_timestamp(text):
+    """Return (text with its first timestamp replaced by a placeholder, timestamp or None)"""
+    match = TIMESTAMP_RE.search(text)
+    if not match:
+        return text, None
+    return text[:match.start()] + TIMESTAMP_TOKEN + text[match.end():], match.group(0)
+
+
+def parse_timestamp(text):
+    """Comparable form of a TIMESTAMP_RE match (UTC when it has an offset), or None"""
+    try:
+        if text[:4].isdigit():
+            parsed = datetime.fromisoformat(text.replace(',', '.').replace('Z', '+00:00'))
+        elif '/' in text:
+            parsed = datetime.strptime(text, '%d/%b/%Y:%H:%M:%S %z' if ' ' in text else '%d/%b/%Y:%H:%M:%S')
+        else:
+            # Syslog has no year; ordering within one file is what matters here
+            parsed = datetime.strptime(SYSLOG_SPACES_RE.sub(' ', text), '%b %d %H:%M:%S')
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def is_indicator_label(label):
+    """True for a column name or word such as "user", "host=" or "TargetUserName:"""
+    return re.sub(r'[^a-z0-9@]+', '_', (label or '').lower()).strip('_') in INDICATOR_LABELS
+
+
+def is_indicator(value):
+    """Values matching any indicator pattern, or labelled ones such as user=bob, are never summarised away"""
+    if INDICATOR_RE.search(value) is not None:
+        return True
+    key, separator, rest = value.partition('=')
+    return bool(separator and rest) and is_indicator_label(key)
+
+
+class TemplateCluster:
+    __slots__ = ('template', 'raw', 'count', 'first_seen', 'last_seen', 'first_key', 'last_key',
+                 'values', 'overflow', 'indicator_positions')
+
+    def __init__(self, tokens, raw, timestamp):
+        self.template = list(tokens)
+        self.raw = raw
+        self.count = 1
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.first_key = self.last_key = parse_timestamp(timestamp) if timestamp else None
+        self.values = {}
+        self.overflow = {}
+        self.indicator_positions = set()
+
+    def seen(self, timestamp):
+        """Widen the first/last seen window; lines need not arrive in time order"""
+        key = parse_timestamp(timestamp)
+        if self.first_seen is None:
+            self.first_seen = self.last_seen = timestamp
+            self.first_key = self.last_key = key
+            return
+        if key is None or self.first_key is None or self.last_key is None:
+            # Unparsed times fall back to file order
+            self.last_seen, self.last_key = timestamp, key
+            return
+        if key < self.first_key:
+            self.first_seen, self.first_key = timestamp, key
+        if key > self.last_key:
+            self.last_seen, self.last_key = timestamp, key
+
+
+class TemplateMiner:
+    """Drain-style online clustering of log lines (or CSV rows) into templates.
+
+    Lines are grouped by token count and first token, then merged into the
+    most similar template in that group when at least `similarity` of their
+    tokens match; differing positions become wildcards. Each template keeps
+    its count, earliest/latest timestamps and the distinct values seen at
+    each wildcard. Up to max_values ordinary values are kept per wildcard,
+    but values that look like indicators (IPs, hashes, URLs, domains,
+    emails, executables) are always kept, as are values in a user, host,
+    domain, path or hash column (field_names) or following such a word in
+    free text ("invalid user bob", "host=ws01"), so summarising never drops
+    an IOC.
+    """
+
+    def __init__(self, similarity=0.5, max_values=20, max_clusters_per_group=100, field_names=None):
+        self.similarity = similarity
+        self.max_values = max_values
+        self.max_clusters_per_group = max_clusters_per_group
+        self.free_text = field_names is None
+        self.indicator_columns = {
+            position for position, name in enumerate(field_names or ()) if is_indicator_label(name)
+        }
+        self.groups = {}
+        self.clusters = []
+        self.lines = 0
+
+    @staticmethod
+    def _group_key(tokens):
+        first = tokens[0] if tokens else ''
+        if any(ch.isdigit() for ch in first):
+            first = WILDCARD
+        return len(tokens), first
+
+    def _score(self, template, tokens):
+        matches = 0
+        wildcards = 0
+        for expected, token in zip(template, tokens):
+            if expected == WILDCARD:
+                wildcards += 1
+            elif expected == token:
+                matches += 1
+        return matches / len(tokens) if tokens else 1.0, -wildcards
+
+    def _remember(self, cluster, position, value, tokens):
+        values = cluster.values.setdefault(position, {})
+        if value in values:
+            return
+        if position in self.indicator_columns or (
+            self.free_text and position and is_indicator_label(tokens[position - 1])
+        ):
+            cluster.indicator_positions.add(position)
+        if len(values) < self.max_values or position in cluster.indicator_positions or is_indicator(value):
+            values[value] = None
+        else:
+            cluster.overflow.setdefault(position, set()).add(hash(value))
+
+    def add(self, tokens, raw, timestamp=None):
+        """Add one tokenised line; raw is the original text, kept for one-off lines"""
+        self.lines += 1
+        group = self.groups.setdefault(self._group_key(tokens), [])
+
+        best = None
+        best_score = None
+        for cluster in group:
+            score = self._score(cluster.template, tokens)
+            if score[0] >= self.similarity and (best_score is None or score > best_score):
+                best, best_score = cluster, score
+
+        if best is None:
+            cluster = TemplateCluster(tokens, raw, timestamp)
+            if len(group) < self.max_clusters_per_group:
+                group.append(cluster)
+            self.clusters.append(cluster)
+            return
+
+        for position, (expected, token) in enumerate(zip(best.template, tokens)):
+            if expected == WILDCARD:
+                self._remember(best, position, token, tokens)
+            elif expected != token:
+                # Every earlier member had the old constant here
+                best.template[position] = WILDCARD
+                self._remember(best, position, expected, tokens)
+                self._remember(best, position, token, tokens)
+        best.count += 1
+        if timestamp:
+            best.seen(timestamp)
+
+    @staticmethod
+    def _split_entry(header, value_lines, max_tokens, line_end):
+        """Spread a template's value lists over entries that each fit max_tokens.
+
+        Every part repeats the template header, so each can be read on its
+        own; a long value list continues in the next part under its label.
+        """
+        parts = []
+        current = []
+        current_tokens = estimate_tokens(header) + 8
+
+        def close_part():
+            nonlocal current, current_tokens
+            parts.append(current)
+            current = []
+            current_tokens = estimate_tokens(header) + 8
+
+        for label, values, suffix in value_lines:
+            prefix = f"    <{label}> = "
+            line = []
+            line_tokens = estimate_tokens(prefix)
+            for value in values:
+                # Exact share of the joined line, so parts are filled close to the budget
+                value_tokens = (len(value) + 2) / CHARS_PER_TOKEN
+                if (line or current) and current_tokens + line_tokens + value_tokens > max_tokens:
+                    if line:
+                        current.append(prefix + ', '.join(line))
+                    close_part()
+                    line = []
+                    line_tokens = estimate_tokens(prefix)
+                line.append(value)
+                line_tokens += value_tokens
+            current.append(prefix + ', '.join(line) + suffix)
+            current_tokens += line_tokens + estimate_tokens(suffix)
+        if current or not parts:
+            parts.append(current)
+
+        return [
+            line_end.join([f"{header} (values part {index}/{len(parts)})"] + lines) + line_end
+            for index, lines in enumerate(parts, 1)
+        ]
+
+    def render(self, field_names=None, join=' ', line_end='\n', max_tokens=None):
+        """Render clusters in first-seen order; one-off lines are returned verbatim.
+
+        field_names labels wildcards by column for CSV/TSV rows; free-text
+        wildcards are numbered <1>, <2>, ... in the template. A template whose
+        values would exceed max_tokens is split into several entries.
+        """
+        entries = []
+        for cluster in self.clusters:
+            if cluster.count == 1:
+                entries.append(cluster.raw if cluster.raw.endswith(line_end) else cluster.raw + line_end)
+                continue
+
+            labels = {}
+            template = []
+            for position, token in enumerate(cluster.template):
+                if token == WILDCARD:
+                    if field_names and position < len(field_names):
+                        labels[position] = field_names[position]
+                    else:
+                        labels[position] = str(len(labels) + 1)
+                    token = f"<{labels[position]}>"
+                template.append(token)
+
+            seen = f", first seen {cluster.first_seen}, last seen {cluster.last_seen}" if cluster.first_seen else ''
+            header = f"[{cluster.count} similar lines{seen}] {join.join(template)}"
+            value_lines = []
+            for position, label in labels.items():
+                values = list(cluster.values.get(position, {}))
+                more = len(cluster.overflow.get(position, ()))
+                suffix = f" (+{more} more distinct)" if more else ''
+                value_lines.append((label, values, suffix))
+            lines = [header] + [f"    <{label}> = {', '.join(values)}{suffix}" for label, values, suffix in value_lines]
+            entry = line_end.join(lines) + line_end
+            if max_tokens and estimate_tokens(entry) > max_tokens:
+                entries.extend(self._split_entry(header, value_lines, max_tokens, line_end))
+            else:
+                entries.append(entry)
+        return entries
+
+    def stats(self):
+        return {'lines': self.lines, 'templates': len(self.clusters)}
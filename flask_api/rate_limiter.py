@@ -0,0 +1,229 @@
+import os
+import json
+import fcntl
+import random
+import logging
+import threading
+from collections import deque
+from time import time, sleep, monotonic
+import db_pool
+
+PREPARED_STATEMENTS = {
+    'ensure_rate_limit_bucket': """
+        INSERT INTO provider_rate_limits (provider, requests, tokens, updated_at)
+        VALUES ($1, $2, $3, clock_timestamp())
+        ON CONFLICT (provider) DO NOTHING
+    """,
+    # Refill both buckets for the time elapsed, then take from them only if both have enough
+    'take_rate_limit_tokens': """
+        WITH bucket AS (
+            SELECT provider,
+                   LEAST($2::float8, requests + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * $2::float8 / 60) AS requests,
+                   LEAST($3::float8, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * $3::float8 / 60) AS tokens
+            FROM provider_rate_limits
+            WHERE provider = $1
+            FOR UPDATE
+        )
+        UPDATE provider_rate_limits p
+        SET requests = b.requests - CASE WHEN b.requests >= $4::float8 AND b.tokens >= $5::float8 THEN $4::float8 ELSE 0 END,
+            tokens = b.tokens - CASE WHEN b.requests >= $4::float8 AND b.tokens >= $5::float8 THEN $5::float8 ELSE 0 END,
+            updated_at = clock_timestamp()
+        FROM bucket b
+        WHERE p.provider = b.provider
+        RETURNING b.requests >= $4::float8 AND b.tokens >= $5::float8, b.requests, b.tokens
+    """
+}
+
+
+class PostgresBuckets:
+    """Token buckets in a Postgres row per provider, shared by every process on the database"""
+
+    def __init__(self):
+        self.pool = db_pool.get_pool()
+        for name, sql in PREPARED_STATEMENTS.items():
+            self.pool.register_statement(name, sql)
+        with self.pool.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS provider_rate_limits (
+                    provider TEXT PRIMARY KEY,
+                    requests DOUBLE PRECISION NOT NULL,
+                    tokens DOUBLE PRECISION NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """)
+
+    def take(self, provider, request_capacity, token_capacity, requests, tokens):
+        """Return (granted, requests_available, tokens_available) after refilling"""
+        with self.pool.cursor() as cur:
+            self.pool.execute_prepared(cur, 'take_rate_limit_tokens',
+                                       (provider, request_capacity, token_capacity, requests, tokens))
+            row = cur.fetchone()
+            if row is None:
+                self.pool.execute_prepared(cur, 'ensure_rate_limit_bucket',
+                                           (provider, request_capacity, token_capacity))
+                self.pool.execute_prepared(cur, 'take_rate_limit_tokens',
+                                           (provider, request_capacity, token_capacity, requests, tokens))
+                row = cur.fetchone()
+        return row
+
+
+class FileBuckets:
+    """Token buckets in a JSON file guarded by flock, for processes sharing one host or volume"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def take(self, provider, request_capacity, token_capacity, requests, tokens):
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except json.JSONDecodeError:
+                    state = {}
+                now = time()
+                bucket = state.get(provider, {'requests': request_capacity, 'tokens': token_capacity, 'updated_at': now})
+                elapsed = max(now - bucket['updated_at'], 0)
+                available_requests = min(request_capacity, bucket['requests'] + elapsed * request_capacity / 60)
+                available_tokens = min(token_capacity, bucket['tokens'] + elapsed * token_capacity / 60)
+                granted = available_requests >= requests and available_tokens >= tokens
+                state[provider] = {
+                    'requests': available_requests - (requests if granted else 0),
+                    'tokens': available_tokens - (tokens if granted else 0),
+                    'updated_at': now
+                }
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return granted, available_requests, available_tokens
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute quota for one provider, shared across processes.
+
+    Callers that would exceed the quota wait in line rather than fail;
+    within a process only the caller at the head of the line polls the
+    shared buckets. A limit of 0 disables that dimension. If the buckets
+    cannot be reached the request is let through, so a database outage
+    never stops analysis.
+    """
+
+    def __init__(self, provider, buckets, requests_per_minute=0, tokens_per_minute=0, max_poll_seconds=5):
+        self.provider = provider
+        self.buckets = buckets
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_poll_seconds = max_poll_seconds
+        self._turn = threading.Lock()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._stats = {
+            'acquired': 0,
+            'delayed': 0,
+            'queue_depth': 0,
+            'peak_queue_depth': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'errors': 0
+        }
+
+    def _try_take(self, tokens):
+        """Return 0 when the request was admitted, else the seconds until it could be"""
+        # A disabled dimension asks for nothing from a bucket that always holds one
+        request_capacity = self.requests_per_minute or 1
+        token_capacity = self.tokens_per_minute or 1
+        needed_requests = 1 if self.requests_per_minute else 0
+        needed_tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+        try:
+            granted, requests, available_tokens = self.buckets.take(
+                self.provider, request_capacity, token_capacity, needed_requests, needed_tokens
+            )
+        except Exception as e:
+            logging.error(f"Error checking {self.provider} rate limit, letting request through: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return 0
+        if granted:
+            return 0
+        return max(
+            (needed_requests - requests) * 60 / request_capacity,
+            (needed_tokens - available_tokens) * 60 / token_capacity,
+            0.01
+        )
+
+    def acquire(self, tokens):
+        """Block until one request of roughly `tokens` tokens fits the quota; returns seconds waited"""
+        start = monotonic()
+        with self._lock:
+            self._stats['queue_depth'] += 1
+            self._stats['peak_queue_depth'] = max(self._stats['peak_queue_depth'], self._stats['queue_depth'])
+        try:
+            with self._turn:
+                while True:
+                    wait = self._try_take(tokens)
+                    if not wait:
+                        break
+                    # Jitter keeps processes waiting on the same bucket from polling in lockstep
+                    sleep(min(wait, self.max_poll_seconds) * random.uniform(1.0, 1.2))
+        finally:
+            waited = monotonic() - start
+            with self._lock:
+                self._stats['queue_depth'] -= 1
+                self._stats['acquired'] += 1
+                self._stats['wait_time_total'] += waited
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+                if waited >= 0.01:
+                    self._stats['delayed'] += 1
+                self._waits.append(waited)
+        return waited
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            waits = sorted(self._waits)
+        snapshot['wait_time_avg'] = snapshot['wait_time_total'] / snapshot['acquired'] if snapshot['acquired'] else 0.0
+        snapshot['wait_time_p95'] = waits[int(len(waits) * 0.95)] if waits else 0.0
+        snapshot['requests_per_minute'] = self.requests_per_minute
+        snapshot['tokens_per_minute'] = self.tokens_per_minute
+        return snapshot
+
+
+_buckets = None
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """Return the process-wide rate limiter for a provider, or None when it has no limits set.
+
+    Limits come from <PROVIDER>_RPM / <PROVIDER>_TPM, falling back to
+    AI_RPM / AI_TPM. Buckets live in Postgres unless AI_RATE_LIMIT_BACKEND=file.
+    """
+    global _buckets
+    prefix = provider.upper()
+    requests_per_minute = int(os.getenv(f'{prefix}_RPM', os.getenv('AI_RPM', 0)))
+    tokens_per_minute = int(os.getenv(f'{prefix}_TPM', os.getenv('AI_TPM', 0)))
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    with _limiters_lock:
+        if provider not in _limiters:
+            try:
+                if _buckets is None:
+                    if os.getenv('AI_RATE_LIMIT_BACKEND', 'postgres').lower() == 'file':
+                        _buckets = FileBuckets(os.getenv('AI_RATE_LIMIT_FILE', os.path.join('cache', 'rate_limits.json')))
+                    else:
+                        _buckets = PostgresBuckets()
+            except Exception as e:
+                logging.error(f"Error setting up rate limit buckets, continuing without limits: {e}")
+                return None
+            _limiters[provider] = RateLimiter(provider, _buckets, requests_per_minute, tokens_per_minute)
+            logging.info(f"Rate limiting {provider} to {requests_per_minute or 'unlimited'} requests and "
+                         f"{tokens_per_minute or 'unlimited'} tokens per minute via {type(_buckets).__name__}")
+        return _limiters[provider]
@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+from time import monotonic
+import db_pool
+
+SETTINGS_COLUMNS = [
+    'sketch_operator_prompt',
+    'evidence_processor_prompt',
+    'ai_provider',
+    'ai_model_settings',
+    'ai_provider_keys'
+]
+
+
+class PlatformSettingsCache:
+    """In-process copy of platform_settings, reloaded only when updated_at changes.
+
+    Checks the version at most once per check_interval seconds; everything
+    else (prompts, provider keys, compiled prompt templates) is served from
+    memory.
+    """
+
+    def __init__(self, db, check_interval=5):
+        self.db = db
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0
+        self._values = {}
+        self._templates = {}
+        self.db.register_statement('settings_version', """
+            SELECT updated_at
+            FROM platform_settings
+            ORDER BY id
+            LIMIT 1
+        """)
+        self.db.register_statement('settings_values', f"""
+            SELECT {', '.join(SETTINGS_COLUMNS)}
+            FROM platform_settings
+            ORDER BY id
+            LIMIT 1
+        """)
+
+    def refresh(self, force=False):
+        """Reload settings if platform_settings.updated_at moved since the last load"""
+        with self._lock:
+            now = monotonic()
+            if self._loaded and not force and now - self._checked_at < self.check_interval:
+                return
+            try:
+                with self.db.cursor() as cur:
+                    self.db.execute_prepared(cur, 'settings_version')
+                    row = cur.fetchone()
+                    version = row[0] if row else None
+                    self._checked_at = now
+
+                    # A NULL updated_at gives no change signal, so reload on every check
+                    if self._loaded and not force and version is not None and version == self._version:
+                        return
+
+                    self.db.execute_prepared(cur, 'settings_values')
+                    row = cur.fetchone()
+
+                self._values = dict(zip(SETTINGS_COLUMNS, row)) if row else {}
+                self._templates.clear()
+                if self._loaded and version != self._version:
+                    logging.info(f"Platform settings changed (updated_at {version}), reloaded")
+                self._version = version
+                self._loaded = True
+            except Exception as e:
+                logging.error(f"Error refreshing platform settings: {e}")
+
+    def get(self, name, default=None):
+        self.refresh()
+        value = self._values.get(name)
+        return value if value else default
+
+    def template(self, name, builder):
+        """Return builder(settings[name]), recompiled only when settings change"""
+        self.refresh()
+        with self._lock:
+            if name not in self._templates:
+                value = self._values.get(name)
+                self._templates[name] = builder(value) if value else None
+            return self._templates[name]
+
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def get_settings():
+    """Return the process-wide settings cache"""
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = PlatformSettingsCache(
+                db_pool.get_pool(),
+                check_interval=float(os.getenv('SETTINGS_CHECK_SECONDS', 5))
+            )
+        return _settings
@@ -0,0 +1,332 @@
+import re
+import csv
+import json
+from evidence_archive import open_text
+from datetime import datetime, timezone
+from operator import itemgetter
+
+# Column names (normalised) that usually hold the event time, in order of preference
+TIMESTAMP_COLUMNS = (
+    'datetime', 'timestamp', '@timestamp', 'time_generated', 'timegenerated', 'timecreated', 'time_created',
+    'event_time', 'eventtime', 'utc_time', 'utctime', 'created_at', 'created', 'logged',
+    'time', 'date', 'ts', '_time'
+)
+# Exports that split the event time across a date column and a time-of-day column
+DATE_COLUMNS = ('date', 'event_date', 'eventdate', 'log_date', 'day')
+TIME_OF_DAY_COLUMNS = ('time', 'event_time', 'eventtime', 'time_of_day', 'log_time')
+
+# Timesketch attribute -> normalised column names that map onto it
+COLUMN_ALIASES = {
+    'source_ip': ('src_ip', 'srcip', 'source_ip', 'sourceip', 'source_address', 'src_addr', 'src',
+                  'client_ip', 'clientip', 'c_ip', 'remote_ip', 'remoteip', 'ip_address', 'ipaddress', 'ip'),
+    'dest_ip': ('dst_ip', 'dstip', 'dest_ip', 'destip', 'destination_ip', 'destinationip',
+                'destination_address', 'dst_addr', 'dst', 'server_ip', 's_ip'),
+    'source_port': ('src_port', 'srcport', 'source_port', 'sourceport', 'sport'),
+    'dest_port': ('dst_port', 'dstport', 'dest_port', 'destport', 'destination_port', 'dport', 'port'),
+    'domain': ('domain', 'domain_name', 'fqdn', 'query', 'qname', 'dns_query', 'query_name'),
+    'url': ('url', 'uri', 'request_url', 'cs_uri', 'cs_uri_stem'),
+    'computer_name': ('computer_name', 'computername', 'computer', 'hostname', 'host', 'host_name',
+                      'device', 'device_name', 'devicename', 'workstation', 'machine'),
+    'username': ('username', 'user_name', 'user', 'account', 'account_name', 'accountname',
+                 'targetusername', 'subjectusername', 'login'),
+    'md5_hash': ('md5', 'md5_hash', 'md5hash', 'hash_md5'),
+    'sha1_hash': ('sha1', 'sha1_hash', 'sha1hash', 'hash_sha1'),
+    'sha256_hash': ('sha256', 'sha256_hash', 'sha256hash', 'hash_sha256'),
+    'file_path': ('file_path', 'filepath', 'path', 'file', 'filename', 'file_name', 'image',
+                  'process_path', 'target_filename', 'targetfilename'),
+    'command_line': ('command_line', 'commandline', 'cmdline', 'command', 'process_command_line'),
+    'process_name': ('process_name', 'processname', 'process'),
+    'event_id': ('event_id', 'eventid', 'event_code', 'eventcode'),
+}
+IOC_ATTRIBUTES = {
+    'source_ip', 'dest_ip', 'domain', 'url', 'computer_name', 'username',
+    'md5_hash', 'sha1_hash', 'sha256_hash', 'file_path', 'command_line'
+}
+INTEGER_ATTRIBUTES = {'source_port', 'dest_port', 'event_id'}
+EVENT_TYPE_COLUMNS = ('timestamp_desc', 'event_type', 'eventtype', 'event_name', 'eventname', 'action',
+                      'activity', 'operation', 'category', 'event')
+MESSAGE_COLUMNS = ('message', 'msg', 'description', 'details', 'summary')
+RESERVED_ATTRIBUTES = {'message', 'datetime', 'timestamp_desc', 'observer_name', 'timestamp'}
+
+# Values that identify an IOC column when its name does not
+VALUE_PATTERNS = (
+    ('ip', re.compile(r'^(?:\d{1,3}\.){3}\d{1,3}$')),
+    ('md5_hash', re.compile(r'^[0-9a-fA-F]{32}$')),
+    ('sha1_hash', re.compile(r'^[0-9a-fA-F]{40}$')),
+    ('sha256_hash', re.compile(r'^[0-9a-fA-F]{64}$')),
+)
+
+TIMESTAMP_FORMATS = (
+    '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M', '%d/%m/%Y %H:%M:%S',
+    '%d/%b/%Y:%H:%M:%S %z', '%b %d %Y %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y%m%d%H%M%S'
+)
+
+
+def normalise_column(name):
+    return re.sub(r'[^a-z0-9@]+', '_', (name or '').strip().lower()).strip('_')
+
+
+def _to_utc(parsed):
+    if parsed.tzinfo is None:
+        # The evidence prompt assumes UTC when no timezone is given; so do we
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _parse_iso(value):
+    return _to_utc(datetime.fromisoformat(value))
+
+
+def _parse_epoch(value):
+    number = float(value)
+    # Seconds, milliseconds or microseconds since the epoch
+    while number > 1e11:
+        number /= 1000
+    if not 315532800 <= number <= 4102444800:  # 1980 .. 2100
+        raise ValueError(f"{value} is not a plausible epoch timestamp")
+    return datetime.fromtimestamp(number, tz=timezone.utc)
+
+
+def _format_parser(fmt):
+    def parse(value):
+        return _to_utc(datetime.strptime(value, fmt))
+    return parse
+
+
+TIMESTAMP_PARSERS = [_parse_iso, _parse_epoch] + [_format_parser(fmt) for fmt in TIMESTAMP_FORMATS]
+
+
+def pick_timestamp_parser(values, min_ratio=0.9):
+    """Return the parser that handles at least min_ratio of the non-empty values, or None"""
+    values = [value.strip() for value in values if value and value.strip()]
+    if not values:
+        return None
+    for parser in TIMESTAMP_PARSERS:
+        parsed = 0
+        for value in values:
+            try:
+                parser(value)
+                parsed += 1
+            except (ValueError, OverflowError, OSError):
+                pass
+        if parsed >= len(values) * min_ratio:
+            return parser
+    return None
+
+
+def _date_only(values, parser):
+    """True if every value that parses lands exactly on midnight"""
+    times = []
+    for value in values:
+        try:
+            times.append(parser(value.strip()).time())
+        except (ValueError, OverflowError, OSError):
+            pass
+    return bool(times) and all(not (t.hour or t.minute or t.second or t.microsecond) for t in times)
+
+
+class StructuredSchema:
+    """Column mapping from a CSV/TSV header to Timesketch event fields"""
+
+    def __init__(self, header, timestamp_index, timestamp_parser, attributes, event_type_index, message_index,
+                 time_index=None):
+        self.header = header
+        self.timestamp_index = timestamp_index
+        self.timestamp_parser = timestamp_parser
+        # Time-of-day column joined to a date-only timestamp column, if any
+        self.time_index = time_index
+        self.attributes = attributes
+        self.event_type_index = event_type_index
+        self.message_index = message_index
+        self.default_desc = header[timestamp_index].strip() or 'Event Time'
+        self.ioc_attributes = [(index, name) for index, name in attributes if name in IOC_ATTRIBUTES]
+        self.width = len(header)
+        self._getter = itemgetter(*[index for index, _ in attributes]) if attributes else None
+
+    def describe(self):
+        mapped = ', '.join(f"{self.header[index]}->{name}" for index, name in self.attributes)
+        time = self.header[self.timestamp_index]
+        if self.time_index is not None:
+            time = f"{time}+{self.header[self.time_index]}"
+        return f"time={time}, {mapped}"
+
+    def to_event(self, row, observer):
+        """Map one row to an event dict; raises ValueError if the row cannot be mapped"""
+        if len(row) < self.width:
+            row = row + [''] * (self.width - len(row))
+        value = row[self.timestamp_index].strip()
+        if self.time_index is not None:
+            value = f"{value} {row[self.time_index].strip()}"
+        timestamp = self.timestamp_parser(value)
+
+        values = self._getter(row) if self._getter else ()
+        if len(self.attributes) == 1:
+            values = (values,)
+        attributes = {}
+        for (_, name), value in zip(self.attributes, values):
+            value = value.strip()
+            if not value:
+                continue
+            if name in INTEGER_ATTRIBUTES and value.isdigit():
+                value = int(value)
+            attributes[name] = value
+
+        desc = row[self.event_type_index].strip() if self.event_type_index is not None else ''
+        desc = desc or self.default_desc
+        message = row[self.message_index].strip() if self.message_index is not None else ''
+        if not message:
+            indicators = ', '.join(
+                f"{name}={attributes[name]}" for _, name in self.ioc_attributes if name in attributes
+            )
+            message = f"{desc}: {indicators}" if indicators else desc
+
+        event = {'message': message, 'datetime': timestamp.isoformat(), 'timestamp_desc': desc}
+        event.update(attributes)
+        if observer:
+            event['observer_name'] = observer
+        return event
+
+
+def infer_schema(header, sample_rows):
+    """Infer a StructuredSchema from the header and sample rows, or None if the file is not mappable.
+
+    A file is mappable when one column parses as timestamps for nearly every
+    sampled row and at least one column holds indicators (by name or by
+    value). Columns that match no known field are kept under their own
+    normalised names, so no data is dropped.
+    """
+    if not header or not sample_rows:
+        return None
+    names = [normalise_column(column) for column in header]
+
+    def column_values(index):
+        return [row[index] for row in sample_rows if index < len(row)]
+
+    timestamp_index = None
+    timestamp_parser = None
+    time_index = None
+    time_columns = [index for index, name in enumerate(names) if name in TIME_OF_DAY_COLUMNS]
+
+    # A date column and a time-of-day column are parsed together
+    for date_index in (index for index, name in enumerate(names) if name in DATE_COLUMNS):
+        for index in time_columns:
+            if index == date_index:
+                continue
+            joined = [
+                f"{row[date_index].strip()} {row[index].strip()}"
+                for row in sample_rows if max(date_index, index) < len(row)
+            ]
+            timestamp_parser = pick_timestamp_parser(joined)
+            if timestamp_parser:
+                timestamp_index, time_index = date_index, index
+                break
+        if timestamp_index is not None:
+            break
+
+    if timestamp_index is None:
+        candidates = sorted(
+            (TIMESTAMP_COLUMNS.index(name), index) for index, name in enumerate(names) if name in TIMESTAMP_COLUMNS
+        )
+        for _, index in candidates:
+            timestamp_parser = pick_timestamp_parser(column_values(index))
+            if timestamp_parser and time_columns and _date_only(column_values(index), timestamp_parser):
+                # Every event would land at midnight; the time lives in a column we could not join
+                timestamp_parser = None
+                continue
+            if timestamp_parser:
+                timestamp_index = index
+                break
+    if timestamp_index is None:
+        return None
+
+    alias_lookup = {alias: attribute for attribute, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    event_type_index = next((i for i, name in enumerate(names) if name in EVENT_TYPE_COLUMNS), None)
+    message_index = next((i for i, name in enumerate(names) if name in MESSAGE_COLUMNS), None)
+
+    attributes = []
+    used = set(RESERVED_ATTRIBUTES)
+    has_indicator = False
+    for index, name in enumerate(names):
+        if index in (timestamp_index, time_index, event_type_index, message_index) or not name:
+            continue
+        attribute = alias_lookup.get(name)
+        if attribute is None:
+            values = [value.strip() for value in column_values(index) if value.strip()]
+            for kind, pattern in VALUE_PATTERNS:
+                if values and all(pattern.match(value) for value in values):
+                    has_indicator = True
+                    attribute = name if kind == 'ip' else kind
+                    break
+        if attribute in IOC_ATTRIBUTES:
+            has_indicator = True
+        if attribute is None or attribute in used:
+            attribute = name if name not in used else f"csv_{name}"
+        if attribute in used:
+            continue
+        used.add(attribute)
+        attributes.append((index, attribute))
+
+    if not has_indicator:
+        return None
+    return StructuredSchema(header, timestamp_index, timestamp_parser, attributes, event_type_index, message_index,
+                            time_index=time_index)
+
+
+def convert_file(source, output_path, leftover_path, delimiter=',', observer=None,
+                 sample_size=200, batch_size=5000):
+    """Map a CSV/TSV file (a path or a text stream factory) straight to Timesketch JSONL without the model.
+
+    Returns None when no schema can be inferred (the caller falls back to
+    the model for the whole file). Otherwise returns (events_written,
+    leftover_rows, schema); rows whose timestamp does not parse are written
+    with the header to leftover_path for model analysis.
+    """
+    with open_text(source) as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        sample = []
+        for row in reader:
+            sample.append(row)
+            if len(sample) >= sample_size:
+                break
+        schema = infer_schema(header, sample)
+        if schema is None:
+            return None
+
+        written = 0
+        leftover = 0
+        leftover_file = None
+        leftover_writer = None
+
+        def rows():
+            yield from sample
+            yield from reader
+
+        try:
+            with open(output_path, 'w') as out:
+                batch = []
+                for row in rows():
+                    if not any(field.strip() for field in row):
+                        continue
+                    try:
+                        batch.append(json.dumps(schema.to_event(row, observer)))
+                    except (ValueError, OverflowError, OSError):
+                        if leftover_writer is None:
+                            leftover_file = open(leftover_path, 'w', newline='')
+                            leftover_writer = csv.writer(leftover_file, delimiter=delimiter, lineterminator='\n')
+                            leftover_writer.writerow(header)
+                        leftover_writer.writerow(row)
+                        leftover += 1
+                        continue
+                    if len(batch) >= batch_size:
+                        out.write('\n'.join(batch) + '\n')
+                        written += len(batch)
+                        batch = []
+                if batch:
+                    out.write('\n'.join(batch) + '\n')
+                    written += len(batch)
+        finally:
+            if leftover_file:
+                leftover_file.close()
+
+    return written, leftover, schema
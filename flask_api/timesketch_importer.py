@@ -0,0 +1,135 @@
+import os
+import json
+import logging
+import threading
+from time import perf_counter
+import requests
+
+# Imported as flask_api.timesketch_importer by the API and flat by the daemons
+try:
+    from flask_api.jsonl_stream import JsonlFiles
+except ImportError:
+    from jsonl_stream import JsonlFiles
+
+try:
+    from timesketch_api_client import config as ts_config
+    from timesketch_import_client import importer as ts_importer
+except ImportError:  # only the stand-in backend is usable without the Timesketch clients
+    ts_config = None
+    ts_importer = None
+
+
+class TimesketchImporter:
+    """Imports events into Timesketch over one long-lived authenticated session.
+
+    Replaces spawning the `timesketch` CLI per import: the API client (and
+    its auth handshake) is created once per process and reused, and sketch
+    objects are cached. Setting TIMESKETCH_STANDIN_URL sends events to a
+    local stand-in server instead (see benchmarks/fake_timesketch_server.py).
+    """
+
+    def __init__(self, provider='Security Sketch', stand_in_url=None):
+        self.provider = provider
+        self.stand_in_url = stand_in_url.rstrip('/') if stand_in_url else None
+        self._client = None
+        self._sketches = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session() if self.stand_in_url else None
+
+    def _get_sketch(self, sketch_id):
+        with self._lock:
+            if self._client is None:
+                if ts_config is None:
+                    raise RuntimeError("timesketch_api_client is not installed")
+                self._client = ts_config.get_client()
+                if self._client is None:
+                    raise RuntimeError("Unable to create Timesketch client from configuration")
+                logging.info("Created Timesketch API session")
+            sketch = self._sketches.get(int(sketch_id))
+            if sketch is None:
+                sketch = self._client.get_sketch(int(sketch_id))
+                self._sketches[int(sketch_id)] = sketch
+            return sketch
+
+    def _reset(self):
+        """Drop the cached session so the next import re-authenticates"""
+        with self._lock:
+            self._client = None
+            self._sketches = {}
+
+    def _stream_events(self, sketch_id, events, timeline_name):
+        """Send events one at a time; returns how many were sent"""
+        sent = 0
+        if self.stand_in_url:
+            def lines():
+                nonlocal sent
+                for event in events:
+                    sent += 1
+                    yield (json.dumps(event) + '\n').encode('utf-8')
+
+            response = self._session.post(
+                f"{self.stand_in_url}/api/v1/sketches/{sketch_id}/import",
+                params={'timeline_name': timeline_name, 'provider': self.provider},
+                data=lines(),
+                headers={'Content-Type': 'application/x-ndjson'},
+                timeout=30
+            )
+            response.raise_for_status()
+            return sent
+
+        sketch = self._get_sketch(sketch_id)
+        with ts_importer.ImportStreamer() as streamer:
+            streamer.set_sketch(sketch)
+            streamer.set_timeline_name(timeline_name)
+            streamer.set_provider(self.provider)
+            for event in events:
+                streamer.add_dict(event)
+                sent += 1
+        return sent
+
+    def import_events(self, sketch_id, events, timeline_name):
+        """Import event dicts as a timeline; returns True on success.
+
+        events may be any iterable that can be walked again if the first
+        attempt fails (a list, or JsonlFiles to stream from disk). Nothing to
+        import counts as success, so an empty file is not retried.
+        """
+        if next(iter(events), None) is None:
+            logging.info(f"No events to import to timeline {timeline_name} in sketch {sketch_id}")
+            return True
+        start = perf_counter()
+        for attempt in range(2):
+            try:
+                sent = self._stream_events(sketch_id, events, timeline_name)
+                elapsed_ms = (perf_counter() - start) * 1000
+                logging.info(f"Imported {sent} events to timeline {timeline_name} "
+                             f"in sketch {sketch_id} ({elapsed_ms:.0f} ms)")
+                return True
+            except Exception as e:
+                if attempt == 0 and not self.stand_in_url:
+                    # Expired sessions surface as generic errors; re-authenticate once
+                    logging.warning(f"Timesketch import failed, retrying with a new session: {e}")
+                    self._reset()
+                    continue
+                logging.error(f"Error importing to Timesketch: {e}")
+                return False
+
+    def import_file(self, sketch_id, file_path, timeline_name):
+        """Import a JSONL file as a timeline; returns True on success"""
+        if not os.path.isfile(file_path):
+            logging.error(f"Error reading {file_path} for import: no such file")
+            return False
+        return self.import_events(sketch_id, JsonlFiles([file_path]), timeline_name)
+
+
+_importer = None
+_importer_lock = threading.Lock()
+
+
+def get_importer():
+    """Return the process-wide Timesketch importer"""
+    global _importer
+    with _importer_lock:
+        if _importer is None:
+            _importer = TimesketchImporter(stand_in_url=os.getenv('TIMESKETCH_STANDIN_URL'))
+        return _importer
@@ -0,0 +1,51 @@
+import os
+
+# Rough characters-per-token ratio for English text and log lines across Gemini/GPT tokenizers
+CHARS_PER_TOKEN = float(os.getenv('LLM_CHARS_PER_TOKEN', 4))
+
+
+def estimate_tokens(text):
+    """Cheap token estimate; deliberately errs high for short strings"""
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def split_text(text, max_tokens):
+    """Cut text into pieces of at most max_tokens estimated tokens, on line breaks where possible"""
+    max_chars = max(int((max_tokens - 1) * CHARS_PER_TOKEN), 1)
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind('\n', 0, max_chars) + 1 or max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_into_windows(items, item_text, max_tokens, max_items=None):
+    """Split items into consecutive windows whose estimated tokens fit max_tokens.
+
+    item_text maps an item to the text that will be sent for it. An item that
+    alone exceeds max_tokens still gets a window of its own rather than being
+    dropped. Order is preserved within and across windows.
+    """
+    windows = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item_text(item))
+        full = current and (
+            current_tokens + tokens > max_tokens
+            or (max_items and len(current) >= max_items)
+        )
+        if full:
+            windows.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        windows.append(current)
+    return windows
@@ -61,4 +61,77 @@ BEGIN
         );
     END IF;
 END
-$$; 
\ No newline at end of file
+$$;
+
+-- Supports the single-pass multi-room fetch of new messages in the operator
+CREATE INDEX IF NOT EXISTS idx_messages_room_created_id
+    ON messages (room_id, created_at, id);
+
+-- Wake the operator and evidence processor as soon as work arrives
+CREATE OR REPLACE FUNCTION notify_new_message() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('new_message', NEW.room_id::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_notify_insert ON messages;
+CREATE TRIGGER messages_notify_insert
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION notify_new_message();
+
+CREATE OR REPLACE FUNCTION notify_evidence_uploaded() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('evidence_uploaded', NEW.id::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS uploaded_files_notify_insert ON uploaded_files;
+CREATE TRIGGER uploaded_files_notify_insert
+    AFTER INSERT ON uploaded_files
+    FOR EACH ROW EXECUTE FUNCTION notify_evidence_uploaded();
+
+-- Streaming evidence analysis progress
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS chunks_processed integer DEFAULT 0;
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS bytes_processed bigint DEFAULT 0;
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS progress_updated_at timestamp with time zone;
+
+-- Lease-based claiming so several evidence workers never process the same file
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS claimed_by text;
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS lease_expires_at timestamp with time zone;
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_pending
+    ON uploaded_files (created_at)
+    WHERE processed = FALSE AND processing_error IS NULL;
+
+-- Content-hash dedupe of evidence uploads
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS content_sha256 text;
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS duplicate_of uuid REFERENCES uploaded_files(id);
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_content_sha256
+    ON uploaded_files (content_sha256)
+    WHERE processed = TRUE;
+
+CREATE TABLE IF NOT EXISTS evidence_results (
+    content_sha256 text NOT NULL,
+    analysis_key text NOT NULL,
+    file_id uuid NOT NULL,
+    event_count integer NOT NULL,
+    events bytea NOT NULL,
+    created_at timestamp with time zone DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (content_sha256, analysis_key)
+);
+
+-- Fair evidence scheduling: per-room priority for hot incidents and queue-wait tracking
+ALTER TABLE rooms ADD COLUMN IF NOT EXISTS evidence_priority integer DEFAULT 0;
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS queue_wait_seconds double precision;
+CREATE INDEX IF NOT EXISTS idx_uploaded_files_room_leased
+    ON uploaded_files (room_id)
+    WHERE processed = FALSE AND lease_expires_at IS NOT NULL;
+
+-- Provider RPM/TPM token buckets shared by the operator and evidence processor
+CREATE TABLE IF NOT EXISTS provider_rate_limits (
+    provider text PRIMARY KEY,
+    requests double precision NOT NULL,
+    tokens double precision NOT NULL,
+    updated_at timestamp with time zone NOT NULL
+);
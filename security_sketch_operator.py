@@ -1,15 +1,23 @@
 import os
 import json
-import psycopg2
 from datetime import datetime, timezone
 import google.generativeai as genai
 from time import sleep
 import logging
-import subprocess
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from ai_providers.gemini_provider import GeminiProvider
 from ai_providers.azure_provider import AzureOpenAIProvider
+from ai_providers.failover import configure_failover
+import db_pool
+from timesketch_importer import get_importer
+from import_coalescer import ImportCoalescer, PARTIAL_SUFFIX
+from settings_cache import get_settings
+from token_budget import estimate_tokens, split_into_windows
+from db_notify import NotificationListener
+from indicators import ChatPreClassifier, single_indicator
+from jsonl_stream import JsonlEventParser
 
 # Load environment variables
 load_dotenv()
@@ -44,19 +52,85 @@ DB_CONFIG = {
 if not DB_CONFIG['password']:
     raise ValueError("DB_PASSWORD not found in environment variables")
 
+db_pool.configure(DB_CONFIG)
+
+# Hot-path statements, prepared once per pooled connection
+PREPARED_STATEMENTS = {
+    'update_room_cursors': """
+        INSERT INTO room_message_cursors (room_id, last_created_at, last_message_id)
+        SELECT * FROM unnest($1::text[], $2::timestamptz[], $3::integer[])
+        ON CONFLICT (room_id)
+        DO UPDATE SET
+            last_created_at = EXCLUDED.last_created_at,
+            last_message_id = EXCLUDED.last_message_id,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE (EXCLUDED.last_created_at, EXCLUDED.last_message_id)
+            > (room_message_cursors.last_created_at, room_message_cursors.last_message_id)
+    """
+}
+
+# Timesketch attribute used for a directly emitted indicator of each kind
+DIRECT_EVENT_ATTRIBUTES = {
+    'ip': 'ip_address'
+}
+
+REGULAR_CHAT = "Regular chat: no sketch update"
+
 class SecuritySketchOperator:
     def __init__(self):
+        self.db = db_pool.get_pool()
+        for name, sql in PREPARED_STATEMENTS.items():
+            self.db.register_statement(name, sql)
+        self.settings = get_settings()
+        self.importer = get_importer()
+
         self.ai_provider = self.initialize_ai_provider()
         self.ai_provider.wait_for_configuration()
+        configure_failover(self.ai_provider)
         
-        self.last_processed_timestamps = {}
+        self.fetch_batch_size = int(os.getenv('MESSAGE_FETCH_BATCH', 2000))
+        self.page_size = int(os.getenv('MESSAGE_PAGE_SIZE', 500))
+        self.backlog_pending = False
+
+        # Wake on NOTIFY from the messages trigger instead of fixed polling
+        self.notify_enabled = os.getenv('NOTIFY_ENABLED', 'true').lower() == 'true'
+        self.notify_debounce = float(os.getenv('NOTIFY_DEBOUNCE_SECONDS', 1.0))
+        self.fallback_poll_seconds = float(os.getenv('FALLBACK_POLL_SECONDS', 300))
+        self.listener = NotificationListener(DB_CONFIG, ['new_message']) if self.notify_enabled else None
+
+        # Token budgets used to split a room's backlog into prompt-sized windows
+        self.input_token_budget = int(os.getenv('LLM_INPUT_TOKEN_BUDGET', 24000))
+        self.output_token_budget = int(os.getenv('LLM_OUTPUT_TOKEN_BUDGET', 2048))
+        # Each message can become an event of roughly this many output tokens
+        tokens_per_event = int(os.getenv('LLM_OUTPUT_TOKENS_PER_MESSAGE', 64))
+        self.max_messages_per_window = max(1, self.output_token_budget // tokens_per_event)
+
+        # Batches without indicators or security vocabulary never reach the model
+        self.pre_classifier = ChatPreClassifier()
+        self.direct_indicator_events = os.getenv('CHAT_DIRECT_EVENTS', 'false').lower() == 'true'
+
+        # Rooms are analyzed in parallel, bounded by the provider's concurrency cap by default
+        self.room_workers = int(os.getenv('ROOM_WORKERS', self.ai_provider.max_concurrency))
         self.output_dir = os.getenv('OUTPUT_DIR', 'sketch_files')
         
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
+
+        # Results from many rooms and cycles are imported together per sketch; the window
+        # is kept short so chat findings reach the timeline within a few seconds
+        self.coalescer = ImportCoalescer(
+            self.importer,
+            'timeline',
+            window_seconds=float(os.getenv('CHAT_IMPORT_COALESCE_SECONDS', 2)),
+            max_events=int(os.getenv('IMPORT_COALESCE_MAX_EVENTS', 5000)),
+            max_attempts=int(os.getenv('IMPORT_MAX_ATTEMPTS', 5)),
+            retry_base_seconds=float(os.getenv('IMPORT_RETRY_BASE_SECONDS', 30))
+        )
+        self.coalescer.recover(self.output_dir, r'^chat_sketch_(\d+)_.*\.jsonl$')
         
-        # Initialize database table for processed messages
-        self.init_processed_messages_table()
+        # Initialize database tables for room cursors
+        self.init_tables()
+        self.migrate_legacy_watermarks()
         
         logging.info(f"Initialized SecuritySketchOperator")
 
@@ -69,181 +143,119 @@ class SecuritySketchOperator:
         self.sketch_operator_prompt = None
         self.fetch_prompt()
 
-    def init_processed_messages_table(self):
+    def init_tables(self):
         """Initialize the database tables"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            # Create table for processed messages
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS processed_messages (
-                    message_id TEXT PRIMARY KEY,
-                    processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create table for last processed timestamps
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS last_processed_timestamps (
-                    room_id TEXT PRIMARY KEY,
-                    last_timestamp TIMESTAMP WITH TIME ZONE,
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            conn.commit()
+            with self.db.cursor() as cur:
+                # Keyset watermark per room: the last (created_at, id) handed to analysis
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS room_message_cursors (
+                        room_id TEXT PRIMARY KEY,
+                        last_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                        last_message_id INTEGER NOT NULL DEFAULT 0,
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Legacy timestamp-only watermarks, read once by migrate_legacy_watermarks
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS last_processed_timestamps (
+                        room_id TEXT PRIMARY KEY,
+                        last_timestamp TIMESTAMP WITH TIME ZONE,
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
             
         except Exception as e:
             logging.error(f"Error initializing database tables: {e}")
             raise
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
-
-    def get_last_processed_timestamp(self, room_id):
-        """Get last processed timestamp for a room from database"""
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT last_timestamp 
-                FROM last_processed_timestamps 
-                WHERE room_id = %s
-            """, (str(room_id),))
-            
-            result = cur.fetchone()
-            return result[0].isoformat() if result and result[0] else '1970-01-01'
-            
-        except Exception as e:
-            logging.error(f"Error getting last processed timestamp: {e}")
-            return '1970-01-01'
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
-
-    def update_last_processed_timestamp(self, room_id, timestamp):
-        """Update last processed timestamp for a room in database"""
+
+    def migrate_legacy_watermarks(self):
+        """Seed room cursors from last_processed_timestamps and last_processed.json"""
+        legacy_file = os.getenv('LEGACY_LAST_PROCESSED_FILE', 'last_processed.json')
+        legacy_timestamps = {}
+        if os.path.exists(legacy_file):
+            try:
+                with open(legacy_file) as f:
+                    legacy_timestamps = json.load(f)
+            except Exception as e:
+                logging.error(f"Error reading legacy watermark file {legacy_file}: {e}")
+
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                INSERT INTO last_processed_timestamps (room_id, last_timestamp)
-                VALUES (%s, %s)
-                ON CONFLICT (room_id) 
-                DO UPDATE SET 
-                    last_timestamp = EXCLUDED.last_timestamp,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (str(room_id), timestamp))
-            
-            conn.commit()
-            logging.info(f"Updated last processed timestamp for room {room_id}: {timestamp}")
+            room_ids = list(legacy_timestamps.keys())
+            with self.db.cursor() as cur:
+                # Rooms that already have a cursor are left alone, so this is safe on every start.
+                # The id half of each seed is the highest id at or before the old timestamp,
+                # which keeps the legacy "created_at > timestamp" semantics exactly.
+                cur.execute("""
+                    INSERT INTO room_message_cursors (room_id, last_created_at, last_message_id)
+                    SELECT src.room_id, src.last_timestamp, COALESCE((
+                        SELECT max(m.id)
+                        FROM messages m
+                        WHERE m.room_id::text = src.room_id
+                        AND m.created_at <= src.last_timestamp
+                    ), 0)
+                    FROM (
+                        SELECT room_id, max(last_timestamp) AS last_timestamp
+                        FROM (
+                            SELECT room_id, last_timestamp FROM last_processed_timestamps
+                            UNION ALL
+                            SELECT * FROM unnest(%s::text[], %s::timestamptz[])
+                        ) legacy
+                        WHERE last_timestamp IS NOT NULL
+                        GROUP BY room_id
+                    ) src
+                    ON CONFLICT (room_id) DO NOTHING
+                """, (room_ids, [legacy_timestamps[room_id] for room_id in room_ids]))
+                migrated = cur.rowcount
+
+            if migrated:
+                logging.info(f"Migrated legacy watermarks for {migrated} rooms")
+            if legacy_timestamps:
+                os.replace(legacy_file, f"{legacy_file}.migrated")
+                logging.info(f"Renamed legacy watermark file to {legacy_file}.migrated")
             
         except Exception as e:
-            logging.error(f"Error updating last processed timestamp: {e}")
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
-
-    def is_message_processed(self, message_id):
-        """Check if a message has been processed using database"""
+            logging.error(f"Error migrating legacy watermarks: {e}")
+
+    def update_room_cursors(self, cursors):
+        """Advance the (created_at, id) cursor for several rooms in one statement"""
+        if not cursors:
+            return
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT EXISTS(
-                    SELECT 1 FROM processed_messages 
-                    WHERE message_id = %s
+            room_ids = list(cursors.keys())
+            with self.db.cursor() as cur:
+                self.db.execute_prepared(
+                    cur,
+                    'update_room_cursors',
+                    (
+                        room_ids,
+                        [cursors[room_id][0] for room_id in room_ids],
+                        [cursors[room_id][1] for room_id in room_ids]
+                    )
                 )
-            """, (str(message_id),))
-            
-            return cur.fetchone()[0]
+            for room_id in room_ids:
+                logging.info(f"Advanced cursor for room {room_id} to {cursors[room_id]}")
             
         except Exception as e:
-            logging.error(f"Error checking processed message: {e}")
-            return False
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
-
-    def mark_message_processed(self, message_id):
-        """Mark a message as processed in database"""
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                INSERT INTO processed_messages (message_id)
-                VALUES (%s)
-                ON CONFLICT (message_id) DO NOTHING
-            """, (str(message_id),))
-            
-            conn.commit()
-            
-        except Exception as e:
-            logging.error(f"Error marking message as processed: {e}")
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
+            logging.error(f"Error updating room cursors: {e}")
 
     def get_sketch_file_path(self, sketch_id):
         """Get the path for a sketch's JSONL file"""
         return os.path.join(self.output_dir, f"chat_sketch_{sketch_id}.jsonl")
 
-    def import_to_timesketch(self, sketch_id, file_path):
-        """Import JSONL file to Timesketch"""
-        try:
-            # Generate unique timeline name using UUID
-            timeline_name = f"timeline_{datetime.now().strftime('%Y%m%d')}_{str(uuid.uuid4())[:8]}"
-            
-            command = f'timesketch --sketch {sketch_id} import --name "{timeline_name}" "{file_path}"'
-            logging.info(f"Executing import command: {command}")
-            
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                shell=True
-            )
-            
-            if result.returncode == 0:
-                logging.info(f"Successfully imported timeline {timeline_name} to sketch {sketch_id}")
-                # Clean up the file after successful import
-                os.remove(file_path)
-                logging.info(f"Cleaned up file: {file_path}")
-                return True
-            else:
-                logging.error(f"Import failed: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            logging.error(f"Error importing to Timesketch: {e}")
-            return False
-
     def write_to_jsonl(self, results, sketch_id):
         """Write results to sketch-specific JSONL file"""
         if not results:
             return False
 
-        # Create a new file with timestamp in name to prevent duplicates
+        # Create a new file with timestamp and a unique suffix in name; rooms sharing
+        # a sketch may be written concurrently within the same second
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_path = os.path.join(self.output_dir, f"chat_sketch_{sketch_id}_{timestamp}.jsonl")
+        file_path = os.path.join(self.output_dir, f"chat_sketch_{sketch_id}_{timestamp}_{str(uuid.uuid4())[:8]}.jsonl")
         
         try:
-            with open(file_path, 'w') as f:  # Note: Changed from 'a' to 'w' since this is a new file
+            with open(file_path + PARTIAL_SUFFIX, 'w') as f:  # Note: Changed from 'a' to 'w' since this is a new file
                 for result in results:
                     if result and isinstance(result, str) and result.strip():
                         try:
@@ -252,100 +264,85 @@ class SecuritySketchOperator:
                             f.write(f"{result}\n")
                         except json.JSONDecodeError:
                             logging.error(f"Invalid JSON: {result}")
+            os.replace(file_path + PARTIAL_SUFFIX, file_path)
             return file_path  # Return the path for import
         except Exception as e:
             logging.error(f"Error writing to JSONL: {e}")
             return None
 
     def get_new_messages(self):
-        """Fetch new messages from database since last processed timestamp"""
+        """Fetch the next page of messages for every active room past its (created_at, id) cursor"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-
             messages_by_room = {}
-            
-            cur.execute("""
-                SELECT DISTINCT r.id, r.name, r.sketch_id 
-                FROM rooms r 
-                WHERE r.active = true
-                """)
-            
-            rooms = cur.fetchall()
-            logging.info(f"Found {len(rooms)} active rooms")
 
-            for room_id, room_name, sketch_id in rooms:
-                if not sketch_id:
-                    logging.warning(f"Room {room_name} has no sketch_id, skipping")
-                    continue
-
-                last_processed = self.get_last_processed_timestamp(str(room_id))
-                logging.info(f"Checking room {room_name} (ID: {room_id}, Sketch ID: {sketch_id}) for messages after {last_processed}")
-                
+            # One keyset-paginated query across rooms, streamed through a server-side cursor
+            with self.db.cursor(name='new_messages_cursor') as cur:
+                cur.itersize = self.fetch_batch_size
                 cur.execute("""
-                    SELECT m.id, m.content, m.created_at, u.username, m.llm_required
-                    FROM messages m
-                    JOIN users u ON m.user_id = u.id
-                    WHERE m.room_id = %s AND m.created_at > %s::timestamp
-                    ORDER BY m.created_at ASC
-                    """, (room_id, last_processed))
-                
-                messages = cur.fetchall()
-                if messages:
-                    new_messages = []
-                    for msg in messages:
-                        msg_id = str(msg[0])
-                        if not self.is_message_processed(msg_id):
-                            new_messages.append(msg)
-                            self.mark_message_processed(msg_id)
-                    
-                    if new_messages:
-                        logging.info(f"Processing {len(new_messages)} new messages in room {room_name}")
-                        messages_by_room[room_id] = {
-                            'name': room_name,
-                            'sketch_id': sketch_id,
-                            'messages': [
-                                {
-                                    'id': msg[0],
-                                    'content': msg[1],
-                                    'timestamp': msg[2].isoformat(),
-                                    'username': msg[3],
-                                    'llm_required': msg[4]
-                                } for msg in new_messages
-                            ]
-                        }
-                        # Update the last processed timestamp in the database
-                        self.update_last_processed_timestamp(str(room_id), new_messages[-1][2])
-                    else:
-                        logging.info(f"No new messages to process in room {room_name}")
+                    SELECT r.id, r.name, r.sketch_id,
+                           m.id, m.content, m.created_at, m.username, m.llm_required
+                    FROM rooms r
+                    LEFT JOIN room_message_cursors c ON c.room_id = r.id::text
+                    CROSS JOIN LATERAL (
+                        SELECT m.id, m.content, m.created_at, u.username, m.llm_required
+                        FROM messages m
+                        JOIN users u ON m.user_id = u.id
+                        WHERE m.room_id = r.id
+                        AND (m.created_at, m.id) > (
+                            COALESCE(c.last_created_at, '-infinity'::timestamptz),
+                            COALESCE(c.last_message_id, 0)
+                        )
+                        ORDER BY m.created_at ASC, m.id ASC
+                        LIMIT %s
+                    ) m
+                    WHERE r.active = true
+                    AND r.sketch_id IS NOT NULL
+                    ORDER BY r.id, m.created_at ASC, m.id ASC
+                    """, (self.page_size,))
+
+                for room_id, room_name, sketch_id, msg_id, content, created_at, username, llm_required in cur:
+                    room = messages_by_room.setdefault(room_id, {
+                        'name': room_name,
+                        'sketch_id': sketch_id,
+                        'messages': []
+                    })
+                    room['messages'].append({
+                        'id': msg_id,
+                        'content': content,
+                        'created_at': created_at,
+                        'timestamp': created_at.isoformat(),
+                        'username': username,
+                        'llm_required': llm_required
+                    })
+
+            logging.info(f"Found new messages in {len(messages_by_room)} active rooms")
+
+            cursors = {}
+            self.backlog_pending = False
+            for room_id, room_data in messages_by_room.items():
+                last_message = room_data['messages'][-1]
+                cursors[str(room_id)] = (last_message['created_at'], last_message['id'])
+                logging.info(f"Processing {len(room_data['messages'])} new messages in room {room_data['name']}")
+                if len(room_data['messages']) >= self.page_size:
+                    self.backlog_pending = True
+
+            # Advance the cursors in the database
+            self.update_room_cursors(cursors)
 
             return messages_by_room
 
         except Exception as e:
             logging.error(f"Database error: {e}")
             return {}
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
 
     def fetch_prompt(self):
-        """Fetch sketch operator prompt from database"""
+        """Fetch sketch operator prompt from the platform settings cache"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT sketch_operator_prompt 
-                FROM platform_settings 
-                LIMIT 1
-            """)
-            
-            result = cur.fetchone()
-            if result and result[0]:
-                self.sketch_operator_prompt = result[0]
-                logging.info("Successfully loaded sketch operator prompt")
+            prompt = self.settings.get('sketch_operator_prompt')
+            if prompt:
+                if prompt != self.sketch_operator_prompt:
+                    logging.info("Successfully loaded sketch operator prompt")
+                self.sketch_operator_prompt = prompt
                 return True
             else:
                 logging.warning("No sketch operator prompt found in database yet")
@@ -354,43 +351,39 @@ class SecuritySketchOperator:
         except Exception as e:
             logging.error(f"Error fetching sketch operator prompt: {e}")
             return False
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
+
+    def build_prompt_template(self, prompt):
+        """Wrap the database prompt in the chat analysis template"""
+        # Escape existing curly braces in the database prompt
+        return f'''
+        {prompt.replace("{", "{{").replace("}", "}}")}
+
+        Chat Room: {{room_name}}
+        Messages to Process:
+        {{messages}}
+
+        Force Processing Required: {{force_process}}
+
+        Your response should either be valid JSON lines or "Regular chat: no sketch update" ONLY IF force processing is not required.
+        '''
+
+    def get_prompt_template(self):
+        """Compiled prompt template, rebuilt only when platform settings change"""
+        return self.settings.template('sketch_operator_prompt', self.build_prompt_template)
 
     def initialize_ai_provider(self):
         """Initialize the configured AI provider"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
+            provider_name = self.settings.get('ai_provider', 'gemini')
             
-            cur.execute("""
-                SELECT ai_provider, ai_model_settings
-                FROM platform_settings
-                LIMIT 1
-            """)
-            
-            result = cur.fetchone()
-            if result:
-                provider_name, settings = result
-                
-                if provider_name == 'azure':
-                    return AzureOpenAIProvider()
-                else:  # default to gemini
-                    return GeminiProvider()
-            
-            return GeminiProvider()  # fallback to default
+            if provider_name == 'azure':
+                return AzureOpenAIProvider()
+            else:  # default to gemini
+                return GeminiProvider()
             
         except Exception as e:
             logging.error(f"Error initializing AI provider: {e}")
             return GeminiProvider()  # fallback to default
-        finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
 
     def analyze_messages(self, messages_by_room):
         """Send messages to AI provider for analysis and get Timesketch format back"""
@@ -398,81 +391,49 @@ class SecuritySketchOperator:
             logging.info("No new messages to analyze")
             return []
 
-        # Refresh prompt before analysis
-        self.fetch_prompt()
+        # Cached template; only recompiled when the prompt changes in the database
+        prompt_template = self.get_prompt_template()
         
-        if not self.sketch_operator_prompt:
+        if not prompt_template:
             logging.error("No sketch operator prompt available")
             return []
 
         logging.info(f"Analyzing messages from {len(messages_by_room)} rooms")
 
-        # Update the prompt_template to use the database prompt but escape existing curly braces
-        prompt_template = f'''
-        {self.sketch_operator_prompt.replace("{", "{{").replace("}", "}}")}
-
-        Chat Room: {{room_name}}
-        Messages to Process:
-        {{messages}}
-
-        Force Processing Required: {{force_process}}
-
-        Your response should either be valid JSON lines or "Regular chat: no sketch update" ONLY IF force processing is not required.
-        '''
+        # Budget left for messages once the fixed prompt text is accounted for
+        message_budget = max(self.input_token_budget - estimate_tokens(prompt_template), 1)
 
         results = []
         for room_id, room_data in messages_by_room.items():
-            messages_text = "\n".join([
-                f"{msg['username']} ({msg['timestamp']}): {msg['content']}"
-                for msg in room_data['messages']
-            ])
-
             try:
-                force_process = any(msg['llm_required'] for msg in room_data['messages'])
-                
-                prompt = prompt_template.format(
-                    room_name=room_data['name'],
-                    messages=messages_text,
-                    force_process=str(force_process)
+                messages = room_data['messages']
+                if self.direct_indicator_events:
+                    messages = self.emit_direct_events(messages, results)
+
+                windows = split_into_windows(
+                    messages,
+                    self.format_message,
+                    message_budget,
+                    max_items=self.max_messages_per_window
                 )
+                logging.info(f"Analyzing messages for room: {room_data['name']} in {len(windows)} chunks")
 
-                logging.info(f"Analyzing messages for room: {room_data['name']}")
+                prepared = [self.window_prompt(prompt_template, room_data['name'], window) for window in windows]
+                prepared = [item for item in prepared if item]
 
-                # Use the configured AI provider
-                response = self.ai_provider.generate_content(
-                    prompt,
+                # Windows fan out as one batch within the provider cap; ordered results keep message order
+                batch = self.ai_provider.generate_batch(
+                    [prompt for prompt, _ in prepared],
+                    ordered=True,
+                    max_parallel=self.ai_provider.max_concurrency,
                     temperature=0.1,
-                    max_tokens=2048
+                    max_tokens=self.output_token_budget,
+                    generation_config={'max_output_tokens': self.output_token_budget}
                 )
-                
-                if response:
-                    response_text = response.strip()
-                    
-                    # Add back markdown stripping
-                    response_text = response_text.replace('```jsonl', '')
-                    response_text = response_text.replace('```json', '')
-                    response_text = response_text.replace('```', '')
-                    response_text = response_text.strip()
-                    
-                    force_process = any(msg['llm_required'] for msg in room_data['messages'])
-                    
-                    if force_process:
-                        logging.info("Message marked for LLM processing, forcing analysis")
-                    
-                    if "Regular chat: no sketch update" not in response_text or force_process:
-                        for line in response_text.split('\n'):
-                            line = line.strip()
-                            if line and line != "Regular chat: no sketch update":
-                                try:
-                                    json.loads(line)  # Validate JSON
-                                    results.append(line)
-                                    logging.info(f"Added valid JSON result: {line}")
-                                except json.JSONDecodeError as je:
-                                    logging.error(f"Invalid JSON line: {line}")
-                                    logging.error(f"JSON error: {je}")
-                else:
-                    logging.warning("No response from AI provider")
-                    
+                for item in batch:
+                    if item.error is None:
+                        results.extend(self.parse_window_response(item.response, prepared[item.index][1]))
+
             except Exception as e:
                 logging.error(f"Error processing room {room_data['name']}: {str(e)}")
                 logging.error("Full error details: ", exc_info=True)
@@ -480,10 +441,131 @@ class SecuritySketchOperator:
         logging.info(f"Total valid results to write: {len(results)}")
         return results
 
+    def direct_event(self, msg):
+        """Timesketch event for a message that is nothing but one indicator, else None"""
+        if msg['llm_required']:
+            return None
+        indicator = single_indicator(msg['content'])
+        if not indicator:
+            return None
+        kind, value = indicator
+        return {
+            'message': value,
+            'datetime': msg['timestamp'],
+            'timestamp_desc': 'Indicator Shared',
+            DIRECT_EVENT_ATTRIBUTES.get(kind, kind): value,
+            'observer_name': msg['username']
+        }
+
+    def emit_direct_events(self, messages, results):
+        """Append events for single-indicator messages to results; returns the messages still needing analysis"""
+        remaining = []
+        emitted = 0
+        for msg in messages:
+            event = self.direct_event(msg)
+            if event:
+                results.append(json.dumps(event))
+                emitted += 1
+            else:
+                remaining.append(msg)
+        if emitted:
+            self.pre_classifier.record_direct_events(emitted)
+            logging.info(f"Emitted {emitted} single-indicator messages as events without the model")
+        return remaining
+
+    def format_message(self, msg):
+        """Render one chat message the way it appears in the prompt"""
+        return f"{msg['username']} ({msg['timestamp']}): {msg['content']}"
+
+    def window_prompt(self, prompt_template, room_name, messages):
+        """Return (prompt, force_process) for one token-bounded window, or None if it needs no model"""
+        if not self.pre_classifier.needs_model(messages):
+            logging.info(f"Skipping model for {len(messages)} messages in {room_name}: no indicators or security content")
+            return None
+
+        messages_text = "\n".join([self.format_message(msg) for msg in messages])
+        force_process = any(msg['llm_required'] for msg in messages)
+        
+        prompt = prompt_template.format(
+            room_name=room_name,
+            messages=messages_text,
+            force_process=str(force_process)
+        )
+        return prompt, force_process
+
+    def parse_window_response(self, response, force_process):
+        """Valid JSON lines from the model's answer for one window"""
+        results = []
+        if response:
+            if force_process:
+                logging.info("Message marked for LLM processing, forcing analysis")
+            
+            if REGULAR_CHAT not in response or force_process:
+                # Fences, the status line and invalid lines are dropped as each line is parsed
+                parser = JsonlEventParser(status_lines=(REGULAR_CHAT,))
+                for line in parser.iter_events([response]):
+                    results.append(line)
+                    logging.info(f"Added valid JSON result: {line}")
+        else:
+            logging.warning("No response from AI provider")
+
+        return results
+
     def validate_api_key(self, provided_key):
         """Validate the provided API key"""
         return provided_key == self.api_key
 
+    def process_room(self, room_id, room_data):
+        """Analyze one room's messages and queue the results for import"""
+        sketch_id = room_data['sketch_id']
+        logging.info(f"Processing room {room_data['name']} (Sketch ID: {sketch_id})")
+        
+        results = self.analyze_messages({room_id: room_data})
+        
+        if results:
+            file_path = self.write_to_jsonl(results, sketch_id)
+            if file_path:  # Only import if we have a valid file path
+                self.coalescer.add(sketch_id, file_path, len(results))
+                logging.info(f"Queued {len(results)} events from room {room_data['name']} for import")
+
+    def process_rooms(self, messages_by_room):
+        """Process rooms concurrently; each room is a single task, so its messages stay in order"""
+        if not messages_by_room:
+            return
+
+        workers = max(1, min(self.room_workers, len(messages_by_room)))
+        if workers == 1:
+            for room_id, room_data in messages_by_room.items():
+                self.process_room(room_id, room_data)
+            return
+
+        logging.info(f"Processing {len(messages_by_room)} rooms with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='room') as executor:
+            futures = {
+                executor.submit(self.process_room, room_id, room_data): room_data['name']
+                for room_id, room_data in messages_by_room.items()
+            }
+            # The next cycle only starts once every room from this one has finished
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Error processing room {futures[future]}: {e}")
+
+    def wait_for_work(self, interval_minutes):
+        """Block until a new message is announced, or until the next poll is due"""
+        if not self.listener:
+            logging.info(f"Sleeping for {interval_minutes} minutes...")
+            sleep(interval_minutes * 60)
+            return
+
+        notifications = self.listener.wait(self.fallback_poll_seconds, debounce=self.notify_debounce)
+        if notifications:
+            rooms = {payload for _, payload in notifications}
+            logging.info(f"Woken by {len(notifications)} new message notifications across {len(rooms)} rooms")
+        else:
+            logging.info("No notifications received, running fallback poll")
+
     def run(self, interval_minutes=1):
         """Main operation loop"""
         if not self.validate_api_key(self.api_key):
@@ -505,23 +587,20 @@ class SecuritySketchOperator:
 
                 logging.info("Fetching new messages...")
                 messages_by_room = self.get_new_messages()
+                self.process_rooms(messages_by_room)
                 
-                for room_id, room_data in messages_by_room.items():
-                    sketch_id = room_data['sketch_id']
-                    logging.info(f"Processing room {room_data['name']} (Sketch ID: {sketch_id})")
-                    
-                    results = self.analyze_messages({room_id: room_data})
-                    
-                    if results:
-                        file_path = self.write_to_jsonl(results, sketch_id)
-                        if file_path:  # Only import if we have a valid file path
-                            if self.import_to_timesketch(sketch_id, file_path):
-                                logging.info(f"Successfully processed and imported data for room {room_data['name']}")
-                            else:
-                                logging.error(f"Failed to import data for room {room_data['name']}")
-                
-                logging.info(f"Sleeping for {interval_minutes} minutes...")
-                sleep(interval_minutes * 60)
+                logging.info(f"Database pool stats: {self.db.stats()}")
+                logging.info(f"LLM cache stats: {self.ai_provider.cache_stats()}")
+                if self.ai_provider.rate_limiter:
+                    logging.info(f"Rate limiter stats: {self.ai_provider.rate_limit_stats()}")
+                logging.info(f"Provider resilience stats: {self.ai_provider.resilience_stats()}")
+                logging.info(f"Import coalescer stats: {self.coalescer.stats()}")
+                logging.info(f"Pre-classifier stats: {self.pre_classifier.stats()}")
+                if self.backlog_pending:
+                    logging.info("Room backlog exceeds one page, fetching the next page immediately")
+                    continue
+
+                self.wait_for_work(interval_minutes)
                 
             except Exception as e:
                 logging.error(f"Error in main loop: {e}")
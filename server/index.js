@@ -111,10 +111,11 @@ const upload = multer({
   storage,
   fileFilter: (req, file, cb) => {
     const ext = path.extname(file.originalname).toLowerCase();
-    if (ext === '.csv' || ext === '.tsv' || ext === '.txt' || ext === '.json') {
+    // Compressed bundles are decompressed by the evidence processor
+    if (['.csv', '.tsv', '.txt', '.json', '.gz', '.tgz', '.zip', '.zst'].includes(ext)) {
       cb(null, true);
     } else {
-      cb(new Error('Only CSV, TSV, TXT, and JSON files are allowed'));
+      cb(new Error('Only CSV, TSV, TXT, and JSON files (optionally gzip, zip or zstd compressed) are allowed'));
     }
   },
   limits: {
@@ -1119,7 +1120,7 @@ app.get('/api/files/:roomId', validateApiKey, async (req, res) => {
   try {
     const result = await pool.query(
       `SELECT id, original_filename, file_size, file_type, created_at,
-              uploader_username, uploader_team
+              uploader_username, uploader_team, queue_wait_seconds
        FROM uploaded_files
        WHERE room_id = $1
        ORDER BY created_at DESC`,
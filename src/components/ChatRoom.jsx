@@ -800,10 +800,10 @@ function ChatRoom() {
     const file = e.target.files[0];
     if (!file) return;
 
-    const validTypes = ['.csv', '.tsv', '.txt'];
+    const validTypes = ['.csv', '.tsv', '.txt', '.gz', '.tgz', '.zip', '.zst'];
     const fileExtension = file.name.substring(file.name.lastIndexOf('.')).toLowerCase();
     if (!validTypes.includes(fileExtension)) {
-      setError('Invalid file type. Please upload CSV, TSV, or TXT files only.');
+      setError('Invalid file type. Please upload CSV, TSV, or TXT files, optionally gzip, zip or zstd compressed.');
       return;
     }
 
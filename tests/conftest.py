@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The daemons run from flask_api/ and import its modules as top-level names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask_api'))
+
+# Providers built in tests must not open the on-disk response cache
+os.environ.setdefault('LLM_CACHE_ENABLED', 'false')
@@ -0,0 +1,19 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_api_imports_as_package():
+    """entrypoint.sh starts the API with `cd /app; python -m flask_api.app`"""
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_cors')
+    # A fresh interpreter, so flask_api/ is not on sys.path as it is for the other tests
+    result = subprocess.run(
+        [sys.executable, '-c', 'import flask_api.app'],
+        cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,54 @@
+import asyncio
+
+from ai_providers.base_provider import BaseAIProvider
+
+
+class SlowProvider(BaseAIProvider):
+    provider_name = 'slow'
+
+    def __init__(self, max_concurrency):
+        super().__init__()
+        self.response_cache = None
+        self.rate_limiter = None
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.peak = 0
+
+    def initialize_provider(self):
+        return True
+
+    def validate_configuration(self):
+        return True
+
+    def _generate_content(self, prompt, **kwargs):
+        return prompt
+
+    async def _agenerate_content(self, prompt, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return prompt
+
+
+def test_async_requests_do_not_wait_for_thread_slots():
+    provider = SlowProvider(max_concurrency=2)
+    # Every threaded slot is taken, as by long-running worker threads
+    for _ in range(2):
+        provider._request_slots.acquire()
+    try:
+        result = provider.run_async(provider.agenerate_content('prompt'), timeout=5)
+    finally:
+        for _ in range(2):
+            provider._request_slots.release()
+    assert result == 'prompt'
+
+
+def test_async_requests_are_capped_per_loop():
+    provider = SlowProvider(max_concurrency=3)
+
+    async def fan_out():
+        return await asyncio.gather(*(provider.agenerate_content(f"prompt {i}") for i in range(12)))
+
+    assert provider.run_async(fan_out(), timeout=5) == [f"prompt {i}" for i in range(12)]
+    assert provider.peak == 3
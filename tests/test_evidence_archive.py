@@ -0,0 +1,79 @@
+import io
+import gzip
+import tarfile
+import zipfile
+
+import pytest
+
+from evidence_archive import DecompressionLimitError, iter_members, zstandard
+
+LINE = b"2024-05-01T00:00:00Z sshd[1]: Failed password for root from 10.0.0.1\n"
+
+
+def read_all(path, **limits):
+    contents = {}
+    for member_name, _, open_member in iter_members(str(path), path.name, 'txt', **limits):
+        with open_member() as f:
+            contents[member_name] = f.read()
+    return contents
+
+
+def write_gzip(path, data):
+    with gzip.open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_gzip_bomb_fails_on_ratio(tmp_path):
+    path = write_gzip(tmp_path / 'auth.log.gz', LINE * 200000)
+    with pytest.raises(DecompressionLimitError):
+        read_all(path, max_ratio=100)
+
+
+def test_gzip_within_limits_is_read(tmp_path):
+    path = write_gzip(tmp_path / 'auth.log.gz', LINE * 1000)
+    assert read_all(path, max_member_bytes=1 << 20, max_ratio=1000) == {'auth.log.gz': (LINE * 1000).decode()}
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")
+def test_zstd_bomb_fails_on_member_size(tmp_path):
+    path = tmp_path / 'auth.log.zst'
+    path.write_bytes(zstandard.ZstdCompressor().compress(LINE * 100000))
+    with pytest.raises(DecompressionLimitError):
+        read_all(path, max_member_bytes=1 << 20)
+
+
+def test_zip_member_declared_past_limit_fails(tmp_path):
+    path = tmp_path / 'logs.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('big.log', LINE * 50000)
+    with pytest.raises(DecompressionLimitError):
+        read_all(path, max_member_bytes=1 << 20)
+
+
+def test_zip_total_counts_every_member_once(tmp_path):
+    path = tmp_path / 'logs.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(4):
+            archive.writestr(f"part{i}.log", LINE * 5000)
+    member_bytes = len(LINE) * 5000
+    # Re-reading a member (structured pass, then the model) is not charged twice
+    for member_name, _, open_member in iter_members(str(path), path.name, 'txt', max_total_bytes=member_bytes * 4):
+        for _ in range(2):
+            with open_member() as f:
+                f.read()
+    with pytest.raises(DecompressionLimitError):
+        read_all(path, max_total_bytes=member_bytes * 3)
+
+
+def test_tar_gz_total_limit(tmp_path):
+    path = tmp_path / 'logs.tar.gz'
+    with tarfile.open(path, 'w:gz') as archive:
+        for i in range(3):
+            data = LINE * 20000
+            info = tarfile.TarInfo(f"part{i}.log")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    assert len(read_all(path, max_total_bytes=len(LINE) * 70000)) == 3
+    with pytest.raises(DecompressionLimitError):
+        read_all(path, max_total_bytes=len(LINE) * 50000)
@@ -0,0 +1,76 @@
+import os
+import json
+
+from import_coalescer import ImportCoalescer
+
+
+class RecordingImporter:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def import_events(self, sketch_id, events, timeline_name):
+        self.calls.append((sketch_id, [event['message'] for event in events], timeline_name))
+        return self.results.pop(0) if self.results else True
+
+
+def spool(directory, name, messages):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        for message in messages:
+            f.write(json.dumps({'message': message}) + '\n')
+    return path
+
+
+def make_coalescer(importer, **kwargs):
+    coalescer = ImportCoalescer(importer, 'timeline', window_seconds=60, retry_base_seconds=0, **kwargs)
+    coalescer._stop.set()
+    return coalescer
+
+
+def test_retries_reuse_the_timeline_name(tmp_path):
+    importer = RecordingImporter([False, True])
+    coalescer = make_coalescer(importer)
+    path = spool(tmp_path, 'chat_sketch_1_a.jsonl', ['one', 'two'])
+    coalescer.add(1, path, 2)
+
+    assert coalescer.flush(1) is False
+    assert coalescer.flush(1) is True
+    assert [call[2] for call in importer.calls] == [importer.calls[0][2]] * 2
+    assert importer.calls[1][1] == ['one', 'two']
+    assert not os.path.exists(path)
+
+
+def test_batch_is_moved_aside_after_max_attempts(tmp_path):
+    importer = RecordingImporter([False] * 3)
+    coalescer = make_coalescer(importer, max_attempts=3)
+    path = spool(tmp_path, 'chat_sketch_1_a.jsonl', ['one'])
+    coalescer.add(1, path, 1)
+
+    for _ in range(4):
+        coalescer.flush(1)
+    assert len(importer.calls) == 3
+    assert os.path.exists(tmp_path / 'failed' / 'chat_sketch_1_a.jsonl')
+    assert coalescer.stats()['pending_sketches'] == 0
+
+
+def test_backoff_holds_the_retry(tmp_path):
+    importer = RecordingImporter([False])
+    coalescer = ImportCoalescer(importer, 'timeline', window_seconds=60, retry_base_seconds=60)
+    coalescer._stop.set()
+    coalescer.add(1, spool(tmp_path, 'chat_sketch_1_a.jsonl', ['one']), 1)
+
+    coalescer.flush(1)
+    assert coalescer.flush(1) is False
+    assert len(importer.calls) == 1
+
+
+def test_empty_batch_counts_as_imported(tmp_path):
+    importer = RecordingImporter([False])
+    coalescer = make_coalescer(importer)
+    path = spool(tmp_path, 'chat_sketch_1_a.jsonl', [])
+    coalescer.add(1, path, 0)
+
+    assert coalescer.flush(1) is True
+    assert importer.calls == []
+    assert not os.path.exists(path)
@@ -0,0 +1,38 @@
+import pytest
+
+from indicators import ChatPreClassifier, extract_indicators, single_indicator
+
+
+@pytest.mark.parametrize('text', ['fe80::1', '2001:db8::1', '2001:db8::ff00:42:8329', '1:2:3:4:5:6:7:8'])
+def test_ipv6_addresses_match(text):
+    assert extract_indicators(text).get('ip') == [text]
+    assert single_indicator(text) == ('ip', text)
+
+
+@pytest.mark.parametrize('text', ['12:30::45', 'a:b::c', 'Note::', 'std::vector', 'meet at 10:30::'])
+def test_times_and_labels_are_not_ipv6(text):
+    assert 'ip' not in extract_indicators(text)
+    assert single_indicator(text) is None
+
+
+@pytest.mark.parametrize('text', [
+    'can you process the request for lunch orders',
+    'I will connect with you after the standup',
+    'the port of Seattle is lovely',
+    'check the timeline doc before the meeting',
+    'logs from the build look fine, merging now',
+    'thanks, that helps',
+])
+def test_everyday_chat_is_noise(text):
+    assert not ChatPreClassifier().classify({'content': text})
+
+
+@pytest.mark.parametrize('text', [
+    "I've reviewed all the emails, no additional impact",
+    'Investigation is complete, only 2 machines were affected',
+    'network contain CPC1234 please',
+    'can you validate connectivity to the file server',
+    'saw beaconing from the finance laptop',
+])
+def test_findings_without_indicators_are_relevant(text):
+    assert ChatPreClassifier().classify({'content': text})
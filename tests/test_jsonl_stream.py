@@ -0,0 +1,27 @@
+import json
+
+from jsonl_stream import JsonlEventParser
+
+EVENT = json.dumps({'message': 'Beacon to 10.0.0.5', 'datetime': '2024-05-01T00:00:00Z', 'timestamp_desc': 'Network'})
+
+
+def parse(chunks):
+    parser = JsonlEventParser(status_lines=('No security content found',))
+    return list(parser.iter_events(chunks)), parser
+
+
+def test_inline_fenced_event_is_parsed():
+    assert parse([f"```{EVENT}```"])[0] == [EVENT]
+    assert parse([f"```json {EVENT}```\n"])[0] == [EVENT]
+
+
+def test_fences_on_their_own_lines_are_skipped():
+    events, parser = parse(["```json\n", EVENT[:10], EVENT[10:] + "\n", "```"])
+    assert events == [EVENT]
+    assert parser.stats == {'events': 1, 'invalid': 0}
+
+
+def test_status_line_is_not_an_event():
+    events, parser = parse(["```\nNo security content found\n```"])
+    assert events == []
+    assert parser.status_seen
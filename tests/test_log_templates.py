@@ -0,0 +1,44 @@
+from log_templates import TemplateMiner, split_timestamp
+
+
+def mine(lines, **kwargs):
+    miner = TemplateMiner(**kwargs)
+    for line in lines:
+        masked, timestamp = split_timestamp(line)
+        miner.add(masked.split(), line, timestamp)
+    return miner, ''.join(miner.render())
+
+
+def test_free_text_usernames_past_max_values_are_kept():
+    lines = [
+        f"May  1 00:{i % 60:02d}:00 web01 sshd[1]: Failed password for invalid user user{i} from 10.0.0.1 port 22 ssh2"
+        for i in range(500)
+    ]
+    miner, rendered = mine(lines, max_values=20)
+    assert len(miner.clusters) == 1
+    assert all(f"user{i}," in rendered or f"user{i}\n" in rendered for i in range(500))
+    assert 'more distinct' not in rendered
+
+
+def test_csv_user_column_past_max_values_is_kept():
+    header = ['time', 'user', 'action']
+    miner = TemplateMiner(max_values=3, field_names=header)
+    for i in range(50):
+        masked, timestamp = split_timestamp(f"2024-05-01 00:00:{i:02d}")
+        miner.add([masked, f"acct{i}", 'logon'], f"row {i}\n", timestamp)
+    rendered = ''.join(miner.render(field_names=header, join=','))
+    assert all(f"acct{i}" in rendered for i in range(50))
+
+
+def test_ordinary_values_are_still_summarised():
+    lines = [f"worker finished job number {i} ok" for i in range(50)]
+    _, rendered = mine(lines, max_values=5)
+    assert '(+45 more distinct)' in rendered
+
+
+def test_seen_window_uses_earliest_and_latest_time():
+    stamps = ['00:39', '00:59', '00:10', '00:45']
+    lines = [f"2024-05-01T{stamp}:00Z host01 service restarted" for stamp in stamps]
+    _, rendered = mine(lines)
+    assert 'first seen 2024-05-01T00:10:00Z' in rendered
+    assert 'last seen 2024-05-01T00:59:00Z' in rendered
@@ -0,0 +1,55 @@
+import pytest
+
+from ai_providers.base_provider import BaseAIProvider
+from ai_providers.resilience import CircuitBreaker, CircuitOpenError
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedProvider(BaseAIProvider):
+    """Answers each request with the next status from a script"""
+    provider_name = 'scripted'
+
+    def __init__(self, statuses):
+        super().__init__()
+        self.response_cache = None
+        self.rate_limiter = None
+        self.retry_attempts = 1
+        self.statuses = list(statuses)
+
+    def initialize_provider(self):
+        return True
+
+    def validate_configuration(self):
+        return True
+
+    def _generate_content(self, prompt, **kwargs):
+        status = self.statuses.pop(0)
+        if status != 200:
+            raise StatusError(status)
+        return 'ok'
+
+
+def test_client_errors_do_not_reset_the_failure_count(monkeypatch):
+    monkeypatch.setenv('AI_BREAKER_FAILURES', '3')
+    provider = ScriptedProvider([503, 400, 503, 400, 503, 200])
+    for _ in range(5):
+        with pytest.raises(StatusError):
+            provider.generate_content('prompt', use_cache=False)
+    assert provider.circuit_breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        provider.generate_content('prompt', use_cache=False)
+
+
+def test_client_error_on_probe_lets_the_next_request_probe():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.wait_time() == 0
+    breaker.release_probe()
+    assert breaker.wait_time() == 0
+    breaker.record_success()
+    assert breaker.state == 'closed'
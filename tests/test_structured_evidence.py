@@ -0,0 +1,47 @@
+import csv
+import json
+
+from structured_evidence import convert_file, infer_schema
+
+HEADER = ['date', 'time', 'src_ip', 'user', 'action']
+ROWS = [
+    ['2024-05-01', '14:30:05', '10.0.0.5', 'alice', 'logon'],
+    ['2024-05-01', '23:59:59', '10.0.0.6', 'bob', 'logoff'],
+]
+
+
+def test_date_and_time_columns_are_combined():
+    schema = infer_schema(HEADER, ROWS)
+    event = schema.to_event(ROWS[0], 'analyst')
+    assert event['datetime'] == '2024-05-01T14:30:05+00:00'
+    assert 'time' not in event
+    assert schema.describe().startswith('time=date+time')
+
+
+def test_us_date_with_twelve_hour_time():
+    rows = [['05/01/2024', '2:30:05 PM', '10.0.0.5', 'alice', 'logon']]
+    event = infer_schema(HEADER, rows).to_event(rows[0], None)
+    assert event['datetime'] == '2024-05-01T14:30:05+00:00'
+
+
+def test_date_only_column_is_rejected_next_to_an_unusable_time_column():
+    rows = [['2024-05-01', 'afternoon', '10.0.0.5', 'alice', 'logon']]
+    assert infer_schema(HEADER, rows) is None
+
+
+def test_single_timestamp_column_still_maps():
+    header = ['timestamp', 'src_ip']
+    rows = [['2024-05-01T14:30:05Z', '10.0.0.5']]
+    assert infer_schema(header, rows).to_event(rows[0], None)['datetime'] == '2024-05-01T14:30:05+00:00'
+
+
+def test_convert_file_uses_both_columns(tmp_path):
+    source = tmp_path / 'export.csv'
+    with open(source, 'w', newline='') as f:
+        csv.writer(f).writerows([HEADER] + ROWS)
+    output = tmp_path / 'events.jsonl'
+    written, leftover, _ = convert_file(str(source), str(output), str(tmp_path / 'leftover.csv'))
+    assert (written, leftover) == (2, 0)
+    assert [json.loads(line)['datetime'] for line in output.read_text().splitlines()] == [
+        '2024-05-01T14:30:05+00:00', '2024-05-01T23:59:59+00:00'
+    ]
@@ -0,0 +1,105 @@
+import json
+
+import timesketch_importer
+from jsonl_stream import JsonlFiles
+
+
+class FakeStreamer:
+    """Stands in for timesketch_import_client.importer.ImportStreamer"""
+    instances = []
+    fail_next = 0
+
+    def __init__(self):
+        self.sketch = None
+        self.timeline_name = None
+        self.provider = None
+        self.events = []
+        self.closed = False
+        FakeStreamer.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+        return False
+
+    def set_sketch(self, sketch):
+        self.sketch = sketch
+
+    def set_timeline_name(self, name):
+        self.timeline_name = name
+
+    def set_provider(self, provider):
+        self.provider = provider
+
+    def add_dict(self, event):
+        if FakeStreamer.fail_next:
+            FakeStreamer.fail_next -= 1
+            raise RuntimeError("session expired")
+        self.events.append(event)
+
+
+class FakeClient:
+    def __init__(self):
+        self.sketch_lookups = []
+
+    def get_sketch(self, sketch_id):
+        self.sketch_lookups.append(sketch_id)
+        return f"sketch-{sketch_id}"
+
+
+class FakeConfig:
+    def __init__(self):
+        self.clients = []
+
+    def get_client(self):
+        self.clients.append(FakeClient())
+        return self.clients[-1]
+
+
+class FakeImporterModule:
+    ImportStreamer = FakeStreamer
+
+
+def make_importer(monkeypatch):
+    FakeStreamer.instances = []
+    FakeStreamer.fail_next = 0
+    config = FakeConfig()
+    monkeypatch.setattr(timesketch_importer, 'ts_config', config)
+    monkeypatch.setattr(timesketch_importer, 'ts_importer', FakeImporterModule)
+    return timesketch_importer.TimesketchImporter(), config
+
+
+def test_streams_events_through_import_streamer(monkeypatch, tmp_path):
+    importer, config = make_importer(monkeypatch)
+    path = tmp_path / 'events.jsonl'
+    events = [{'message': f"event {i}", 'datetime': '2024-05-01T00:00:00Z', 'timestamp_desc': 'Test'} for i in range(3)]
+    path.write_text(''.join(json.dumps(event) + '\n' for event in events))
+
+    assert importer.import_events(7, JsonlFiles([str(path)]), 'timeline_a') is True
+    assert importer.import_file(7, str(path), 'timeline_b') is True
+
+    first, second = FakeStreamer.instances
+    assert (first.sketch, first.timeline_name, first.provider) == ('sketch-7', 'timeline_a', 'Security Sketch')
+    assert first.events == events and first.closed
+    assert second.timeline_name == 'timeline_b' and second.events == events
+    # One authenticated session and one sketch lookup serve both imports
+    assert len(config.clients) == 1
+    assert config.clients[0].sketch_lookups == [7]
+
+
+def test_failed_import_reconnects_and_resends(monkeypatch):
+    importer, config = make_importer(monkeypatch)
+    FakeStreamer.fail_next = 1
+    events = [{'message': 'one'}, {'message': 'two'}]
+
+    assert importer.import_events(3, events, 'timeline_a') is True
+    assert len(config.clients) == 2
+    assert FakeStreamer.instances[-1].events == events
+
+
+def test_missing_file_fails(monkeypatch, tmp_path):
+    importer, _ = make_importer(monkeypatch)
+    assert importer.import_file(3, str(tmp_path / 'missing.jsonl'), 'timeline_a') is False
+    assert FakeStreamer.instances == []